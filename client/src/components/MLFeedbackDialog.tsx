@@ -28,6 +28,11 @@ interface MLFeedbackDialogProps {
     destinationCity: string
     tonnage: number
     productType: string
+    originLat?: string | number
+    originLng?: string | number
+    destLat?: string | number
+    destLng?: string | number
+    month?: number
   }
   onUseRecommendedValue?: () => void
   recommendationDetails?: {
@@ -189,7 +189,12 @@ const MLRecommendationButton = ({
           originCity: freightData.originCity || '',
           destinationCity: freightData.destinationCity || '',
           tonnage: Number(freightData.tonnage) || 1000,
-          productType: freightData.productType || 'grains'
+          productType: freightData.productType || 'grains',
+          originLat: freightData.originLat ?? freightData.originCoordinates?.lat,
+          originLng: freightData.originLng ?? freightData.originCoordinates?.lng,
+          destLat: freightData.destLat ?? freightData.destinationLat ?? freightData.destinationCoordinates?.lat,
+          destLng: freightData.destLng ?? freightData.destinationLng ?? freightData.destinationCoordinates?.lng,
+          month: freightData.month || new Date().getMonth() + 1
         }}
         onUseRecommendedValue={() => {
           onRecommendationReceived(recommendedValue);
@@ -0,0 +1,237 @@
+"""
+Módulo de backtest do sistema de fretes.
+Avalia todas as viagens do histórico com a própria viagem excluída
+(leave-one-out), usando a busca por similaridade e o modelo ML em lote
+(ver batch_predict.py), e resume MAE/MAPE por método, rota e mês.
+Também implementa a avaliação temporal (walk-forward) dos modelos de treino.
+"""
+
+import os
+import json
+import time
+import hashlib
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.preprocessing import StandardScaler
+from batch_predict import LANE_COLUMNS, build_lane_table, lane_keys, predict_batch
+
+# Cache dos resultados de cada fold da avaliação walk-forward
+WALK_FORWARD_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'walk_forward')
+
+# Versão do procedimento de avaliação (invalida o cache quando alterada)
+WALK_FORWARD_VERSION = 1
+
+# Métodos avaliados no backtest (ver batch_predict.predict_batch)
+BACKTEST_METHODS = ['similar_routes', 'ml_model', 'standard', 'high_confidence']
+
+def leave_one_out_backtest(historical_data, model, scaler, features, radius_km=50):
+    """
+    Prediz cada viagem do histórico sem considerar a própria viagem na busca
+    por rotas similares nem na faixa de distância similar.
+
+    Observação: o modelo ML é o modelo já treinado (com todo o histórico);
+    o leave-one-out se aplica às etapas baseadas em dados históricos.
+
+    Args:
+        historical_data (DataFrame): DataFrame com os dados históricos
+        model, scaler, features: Componentes retornados por load_model_and_scaler
+        radius_km (float): Raio em km para busca (default: 50)
+
+    Returns:
+        DataFrame: Uma linha por viagem e método, com valor real, predição,
+                   erro absoluto e percentual, rota e mês
+    """
+    inicio = time.perf_counter()
+
+    historico = historical_data.reset_index(drop=True)
+    lanes = build_lane_table(historico)
+    chaves = lane_keys(lanes)
+
+    exclude = {
+        'lane': lanes['row_lane'],
+        'row': np.arange(len(historico)),
+        'price': historico['Frete Carreteiro'].to_numpy(dtype=np.float64),
+        'km': historico['KM'].to_numpy(dtype=np.float64),
+    }
+
+    resultados = predict_batch(historico, historico, model, scaler, features,
+                               radius_km=radius_km, lanes=lanes, exclude=exclude)
+
+    real = exclude['price']
+    partes = []
+    for metodo in BACKTEST_METHODS:
+        pred = resultados[metodo]
+        erro_abs = np.abs(pred['prediction'].to_numpy() - real)
+        partes.append(pd.DataFrame({
+            'row': np.arange(len(historico)),
+            'evaluated_method': metodo,
+            'lane': chaves[lanes['row_lane']],
+            'month': historico['Mês'].to_numpy(),
+            'km': exclude['km'],
+            'actual': real,
+            'prediction': pred['prediction'].to_numpy(),
+            'confidence': pred['confidence'].to_numpy(),
+            'method': pred['method'].to_numpy(),
+            'num_routes': pred['num_routes'].to_numpy(),
+            'abs_error': erro_abs,
+            'pct_error': erro_abs / real * 100,
+        }))
+
+    resultado = pd.concat(partes, ignore_index=True)
+    print(f"Backtest leave-one-out: {len(historico)} viagens × {len(BACKTEST_METHODS)} métodos "
+          f"em {time.perf_counter() - inicio:.2f}s")
+    return resultado
+
+def summarize_errors(results, by=None):
+    """
+    Resume os erros do backtest (MAE, MAPE e cobertura) por método e,
+    opcionalmente, por dimensões adicionais.
+
+    Args:
+        results (DataFrame): Saída de leave_one_out_backtest
+        by (list, optional): Colunas adicionais de agrupamento (ex.: ['lane'], ['month'])
+
+    Returns:
+        DataFrame: Uma linha por grupo com n, cobertura, MAE e MAPE
+    """
+    chaves = ['evaluated_method'] + list(by or [])
+    avaliados = results.assign(covered=results['prediction'].notna())
+
+    resumo = avaliados.groupby(chaves, sort=True).agg(
+        n=('actual', 'size'),
+        covered=('covered', 'sum'),
+        mae=('abs_error', 'mean'),
+        mape=('pct_error', 'mean'),
+    ).reset_index()
+    resumo['coverage'] = resumo['covered'] / resumo['n']
+    return resumo
+
+def _fold_fingerprint(train_df, test_df, features, model_names):
+    """
+    Gera a impressão digital de um fold: dados de treino e teste, features,
+    modelos e versão do procedimento. Só folds cujos dados mudaram são recalculados.
+    """
+    colunas = list(features) + ['Frete Carreteiro'] + LANE_COLUMNS
+    colunas = list(dict.fromkeys(colunas))
+
+    h = hashlib.sha256()
+    h.update(json.dumps({'version': WALK_FORWARD_VERSION, 'features': list(features),
+                         'models': list(model_names)}).encode('utf-8'))
+    for parte in (train_df, test_df):
+        h.update(pd.util.hash_pandas_object(parte[colunas], index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+def _run_walk_forward_fold(fold):
+    """
+    Treina os modelos candidatos com os dados até o mês M e avalia o mês M+1.
+    Executado em processos separados (ProcessPoolExecutor).
+    """
+    from train import build_candidate_models
+
+    train_df = fold['train']
+    test_df = fold['test'].copy()
+    features = fold['features']
+
+    # Valor_por_km é derivado do preço: no mês avaliado ele é substituído pela
+    # média da rota no período de treino (informação disponível no mês M)
+    if 'Valor_por_km' in features:
+        media_rota = train_df.groupby(LANE_COLUMNS)['Valor_por_km'].mean().rename('_valor_km_rota')
+        test_df = test_df.join(media_rota, on=LANE_COLUMNS)
+        test_df['Valor_por_km'] = test_df['_valor_km_rota'].fillna(train_df['Valor_por_km'].median())
+
+    scaler = StandardScaler()
+    X_train = scaler.fit_transform(train_df[features])
+    X_test = scaler.transform(test_df[features])
+    y_train = train_df['Frete Carreteiro'].to_numpy()
+    y_test = test_df['Frete Carreteiro'].to_numpy()
+
+    metricas = []
+    for name, model in build_candidate_models().items():
+        if name not in fold['model_names']:
+            continue
+        model.fit(X_train, y_train)
+        y_pred = model.predict(X_test)
+        erro = y_pred - y_test
+        metricas.append({
+            'period': fold['period'],
+            'model': name,
+            'n_train': int(len(train_df)),
+            'n_test': int(len(test_df)),
+            'mae': float(np.mean(np.abs(erro))),
+            'mape': float(np.mean(np.abs(erro / y_test)) * 100),
+            'rmse': float(np.sqrt(np.mean(erro ** 2))),
+        })
+    return metricas
+
+def walk_forward_backtest(df, features, model_names=None, min_train_size=50,
+                          max_workers=None, cache_dir=WALK_FORWARD_CACHE_DIR):
+    """
+    Avaliação temporal (walk-forward): para cada mês M do histórico, treina
+    com todas as viagens até M e avalia as viagens do mês seguinte.
+
+    Os folds são independentes e executados em paralelo; o resultado de cada
+    fold fica em cache, identificado pela impressão digital dos seus dados,
+    de modo que novas execuções só recalculam os folds alterados.
+
+    Args:
+        df (DataFrame): Dados de treino (ver train.load_data)
+        features (list): Features do modelo
+        model_names (list, optional): Modelos de train.build_candidate_models a avaliar
+        min_train_size (int): Mínimo de viagens de treino para avaliar um mês
+        max_workers (int, optional): Processos paralelos (default: todos os núcleos)
+        cache_dir (str): Diretório do cache por fold
+
+    Returns:
+        DataFrame: Métricas (MAE, MAPE, RMSE) por mês avaliado e modelo
+    """
+    from train import build_candidate_models
+
+    if model_names is None:
+        model_names = list(build_candidate_models().keys())
+
+    inicio = time.perf_counter()
+    periodo = (df['Ano'].astype(int) * 100 + df['Mês'].astype(int)).to_numpy()
+    periodos = np.unique(periodo)
+
+    folds = []
+    for anterior, atual in zip(periodos[:-1], periodos[1:]):
+        train_df = df[periodo <= anterior]
+        if len(train_df) < min_train_size:
+            continue
+        test_df = df[periodo == atual]
+        folds.append({
+            'period': f"{atual // 100}-{atual % 100:02d}",
+            'train': train_df,
+            'test': test_df,
+            'features': list(features),
+            'model_names': list(model_names),
+            'fingerprint': _fold_fingerprint(train_df, test_df, features, model_names),
+        })
+
+    os.makedirs(cache_dir, exist_ok=True)
+    resultados = []
+    pendentes = []
+    for fold in folds:
+        cache_path = os.path.join(cache_dir, f"{fold['fingerprint']}.json")
+        if os.path.exists(cache_path):
+            with open(cache_path, 'r') as f:
+                resultados.extend(json.load(f))
+        else:
+            pendentes.append(fold)
+
+    print(f"Walk-forward: {len(folds)} meses avaliados, {len(folds) - len(pendentes)} em cache, "
+          f"{len(pendentes)} a calcular")
+
+    if pendentes:
+        with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+            for fold, metricas in zip(pendentes, executor.map(_run_walk_forward_fold, pendentes)):
+                with open(os.path.join(cache_dir, f"{fold['fingerprint']}.json"), 'w') as f:
+                    json.dump(metricas, f)
+                resultados.extend(metricas)
+
+    print(f"Walk-forward concluído em {time.perf_counter() - inicio:.2f}s")
+
+    if not resultados:
+        return pd.DataFrame(columns=['period', 'model', 'n_train', 'n_test', 'mae', 'mape', 'rmse'])
+    return pd.DataFrame(resultados).sort_values(['period', 'model']).reset_index(drop=True)
@@ -0,0 +1,587 @@
+"""
+Módulo de predição em lote para o sistema de fretes.
+Implementa versões vetorizadas da busca por rotas similares e das regras de
+combinação usadas em predict.py e improved_prediction.py, permitindo avaliar
+milhares de rotas com uma única passada pelo histórico e uma única chamada
+ao modelo ML.
+"""
+
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from data_processor import lane_key, distance_band_stats, get_feature_builder, build_feature_matrix
+from similarity_index import haversine_km, geodesic_near_radius, cached_for_frame, HAVERSINE_MAX_ERROR
+from seasonality import seasonal_factors
+from nearest_lanes import nearest_lane_stats
+from residual_correction import correction_factors, apply_correction
+from feature_store import join_features, AGGREGATE_FEATURES, LEVEL_CONFIDENCE
+from staged_inference import is_staged_model, get_staged_model, stages_for_budget, predict_staged
+from prediction_intervals import (load_quantile_models, prediction_interval, interval_models,
+                                  quantile_models_for_budget, DEFAULT_MODEL_CONFIDENCE, QUANTILE_MODELS_PATH)
+
+# Colunas de coordenadas que identificam uma rota (lane)
+LANE_COLUMNS = ['Lat_Origem', 'Lng_Origem', 'Lat_Destino', 'Lng_Destino']
+
+# Limite de células (consultas × rotas) processadas por bloco
+MAX_CELLS_PER_CHUNK = 4_000_000
+
+def build_lane_table(historical_data):
+    """
+    Agrupa o histórico por rota (coordenadas exatas de origem e destino).
+    Como a pontuação de similaridade depende apenas das coordenadas, todas as
+    viagens de uma mesma rota compartilham a mesma pontuação e podem ser
+    agregadas antes da busca.
+
+    Args:
+        historical_data (DataFrame): DataFrame com os dados históricos
+
+    Returns:
+        dict: Arrays por rota (coordenadas, contagem, somas de preço e km)
+              e o índice da rota de cada linha do histórico ('row_lane')
+    """
+    row_lane = historical_data.groupby(LANE_COLUMNS, sort=False).ngroup().to_numpy()
+    n_lanes = int(row_lane.max()) + 1 if len(row_lane) else 0
+
+    precos = historical_data['Frete Carreteiro'].to_numpy(dtype=np.float64)
+    kms = historical_data['KM'].to_numpy(dtype=np.float64)
+
+    primeiro = np.full(n_lanes, -1, dtype=np.int64)
+    # Primeira linha de cada rota (para recuperar as coordenadas)
+    primeiro[row_lane[::-1]] = np.arange(len(row_lane))[::-1]
+
+    coords = historical_data[LANE_COLUMNS].to_numpy(dtype=np.float64)[primeiro]
+
+    return {
+        'lat_origem': coords[:, 0],
+        'lng_origem': coords[:, 1],
+        'lat_destino': coords[:, 2],
+        'lng_destino': coords[:, 3],
+        'count': np.bincount(row_lane, minlength=n_lanes).astype(np.float64),
+        'price_sum': np.bincount(row_lane, weights=precos, minlength=n_lanes),
+        'km_sum': np.bincount(row_lane, weights=kms, minlength=n_lanes),
+        'row_lane': row_lane,
+    }
+
+def lane_keys(lanes):
+    """
+    Retorna a chave canônica (ver data_processor.lane_key) de cada rota da tabela.
+    """
+    return np.array([
+        lane_key(*c) for c in zip(lanes['lat_origem'], lanes['lng_origem'],
+                                  lanes['lat_destino'], lanes['lng_destino'])
+    ], dtype=object)
+
+def batch_similarity_stats(lanes, lat_origem, lng_origem, lat_destino, lng_destino,
+                           radius_km=50, exclude=None):
+    """
+    Calcula, para um lote de consultas, as estatísticas agregadas das rotas
+    similares (mesmo critério de find_similar_routes).
+
+    Args:
+        lanes (dict): Tabela de rotas gerada por build_lane_table
+        lat_origem, lng_origem, lat_destino, lng_destino (array): Coordenadas das consultas
+        radius_km (float): Raio em km para busca (default: 50)
+        exclude (dict, optional): Viagem a excluir de cada consulta (leave-one-out),
+            com arrays 'lane' (índice da rota, -1 para nenhuma), 'price' e 'km'
+
+    Returns:
+        dict: Arrays com 'num_routes', 'score_sum', 'weighted_price_sum'
+              (Σ score·preço), 'price_sum' e 'km_sum' por consulta
+    """
+    lat_origem = np.asarray(lat_origem, dtype=np.float64)
+    lng_origem = np.asarray(lng_origem, dtype=np.float64)
+    lat_destino = np.asarray(lat_destino, dtype=np.float64)
+    lng_destino = np.asarray(lng_destino, dtype=np.float64)
+
+    n_queries = len(lat_origem)
+    n_lanes = len(lanes['count'])
+    stats = {name: np.zeros(n_queries) for name in
+             ('num_routes', 'score_sum', 'weighted_price_sum', 'price_sum', 'km_sum')}
+
+    if n_queries == 0 or n_lanes == 0:
+        return stats
+
+    chunk = max(1, MAX_CELLS_PER_CHUNK // n_lanes)
+    for inicio in range(0, n_queries, chunk):
+        fim = min(inicio + chunk, n_queries)
+        bloco = slice(inicio, fim)
+
+        coordenadas_origem = (lat_origem[bloco, None], lng_origem[bloco, None],
+                              lanes['lat_origem'][None, :], lanes['lng_origem'][None, :])
+        coordenadas_destino = (lat_destino[bloco, None], lng_destino[bloco, None],
+                               lanes['lat_destino'][None, :], lanes['lng_destino'][None, :])
+        dist_origem = haversine_km(*coordenadas_origem)
+        dist_destino = haversine_km(*coordenadas_destino)
+
+        # Perto do raio, a distância geodésica decide (mesmas rotas de find_similar_routes);
+        # só importa onde a outra ponta da rota também pode estar dentro do raio
+        limite = radius_km * (1 + HAVERSINE_MAX_ERROR)
+        geodesic_near_radius(dist_origem, *coordenadas_origem, radius_km, candidates=dist_destino <= limite)
+        geodesic_near_radius(dist_destino, *coordenadas_destino, radius_km, candidates=dist_origem <= limite)
+
+        dentro = (dist_origem <= radius_km) & (dist_destino <= radius_km)
+        score = ((1 - dist_origem / radius_km) * 50 + (1 - dist_destino / radius_km) * 50) * dentro
+
+        count = dentro * lanes['count']
+        stats['num_routes'][bloco] = count.sum(axis=1)
+        stats['score_sum'][bloco] = (score * lanes['count']).sum(axis=1)
+        stats['weighted_price_sum'][bloco] = (score * lanes['price_sum']).sum(axis=1)
+        stats['price_sum'][bloco] = (dentro * lanes['price_sum']).sum(axis=1)
+        stats['km_sum'][bloco] = (dentro * lanes['km_sum']).sum(axis=1)
+
+        if exclude is not None:
+            # Remove a contribuição da própria viagem (leave-one-out)
+            lane_idx = np.asarray(exclude['lane'])[bloco]
+            linhas = np.nonzero(lane_idx >= 0)[0]
+            colunas = lane_idx[linhas]
+            proprio_dentro = dentro[linhas, colunas]
+            proprio_score = score[linhas, colunas]
+            alvo = linhas + inicio
+
+            stats['num_routes'][alvo] -= proprio_dentro
+            stats['score_sum'][alvo] -= proprio_score
+            stats['weighted_price_sum'][alvo] -= proprio_score * np.asarray(exclude['price'])[alvo]
+            stats['price_sum'][alvo] -= proprio_dentro * np.asarray(exclude['price'])[alvo]
+            stats['km_sum'][alvo] -= proprio_dentro * np.asarray(exclude['km'])[alvo]
+
+    return stats
+
+def batch_model_predict(model, scaler, features, inputs, n_stages=None, interval=False):
+    """
+    Executa o modelo ML para um lote de entradas em uma única chamada.
+
+    Args:
+        model: Modelo treinado
+        scaler: Scaler ajustado no treino
+        features (list): Lista de features na ordem do treino
+        inputs (dict): Arrays das consultas (ver _model_inputs); features
+            do modelo que não dependem da consulta recebem 0
+        n_stages (int, optional): Estágios do GradientBoosting usados (default: todos)
+        interval (bool): Retorna também o intervalo de predição (ver
+            prediction_intervals.prediction_interval)
+
+    Returns:
+        ndarray: Predições arredondadas para múltiplos de 5
+        dict: Intervalo de predição (apenas com interval=True; None se não há
+              intervalo para o modelo)
+    """
+    if len(inputs['km']) == 0:
+        return (np.zeros(0), None) if interval else np.zeros(0)
+
+    X_scaled = build_feature_matrix(get_feature_builder(features, scaler), **inputs)
+    if n_stages is not None:
+        prediction = predict_staged(get_staged_model(model), X_scaled, n_stages)
+    else:
+        prediction = model.predict(X_scaled)
+    if interval:
+        quantis = load_quantile_models(model, features, QUANTILE_MODELS_PATH)
+        intervalo = prediction_interval(model, X_scaled, prediction, quantis, n_stages=n_stages)
+        return np.round(prediction / 5) * 5, intervalo
+    return np.round(prediction / 5) * 5
+
+def _model_inputs(queries, valor_por_km):
+    """Arrays de entrada do modelo (ver data_processor.build_feature_matrix), como em predict.py."""
+    if 'Ano' in queries.columns:
+        anos = queries['Ano'].to_numpy()
+    else:
+        anos = datetime.now().year
+
+    return {
+        'km': queries['KM'].to_numpy(dtype=np.float64),
+        'mes': queries['Mês'].to_numpy(),
+        'ano': anos,
+        'lat_origem': queries['Lat_Origem'].to_numpy(dtype=np.float64),
+        'lng_origem': queries['Lng_Origem'].to_numpy(dtype=np.float64),
+        'lat_destino': queries['Lat_Destino'].to_numpy(dtype=np.float64),
+        'lng_destino': queries['Lng_Destino'].to_numpy(dtype=np.float64),
+        'valor_por_km': valor_por_km,
+    }
+
+def _similarity_estimate(stats):
+    """
+    Preço ponderado pela similaridade, score médio e confiança geográfica
+    (mesmas fórmulas de get_most_similar_price).
+    """
+    n = stats['num_routes']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        preco = stats['weighted_price_sum'] / stats['score_sum']
+        score_medio = stats['score_sum'] / n
+    preco_arredondado = np.round(preco / 5) * 5
+
+    confianca = np.minimum(n / 10, 1.0) * 0.4 + (score_medio / 100) * 0.6
+    confianca = np.minimum(confianca, 1.0)
+    return preco_arredondado, score_medio, confianca
+
+def _nearest_estimate(nearest, model_prediction):
+    """
+    Estimativa pelas rotas vizinhas combinada com o modelo (50%/50%), como em
+    predict_freight_price e predict_with_high_confidence.
+    """
+    disponivel = nearest['num_lanes'] > 0
+    preco = np.round((np.nan_to_num(nearest['prediction']) * 0.5 + model_prediction * 0.5) / 5) * 5
+    return disponivel, preco, nearest['confidence']
+
+def combine_standard(stats, model_prediction, nearest, model_confidence=DEFAULT_MODEL_CONFIDENCE):
+    """
+    Aplica as regras de predict_freight_price a um lote de consultas.
+
+    Args:
+        stats (dict): Saída de batch_similarity_stats
+        model_prediction (array): Predições do modelo (arredondadas)
+        nearest (dict): Saída de nearest_lanes.nearest_lane_stats
+        model_confidence (float or array): Confiança do modelo (derivada do intervalo de predição)
+
+    Returns:
+        DataFrame: Colunas 'prediction', 'confidence', 'method', 'num_routes',
+                   'num_lanes' e 'nearest_distance' (rotas vizinhas, para a explicação)
+    """
+    n = stats['num_routes']
+    preco_geo, _, confianca_geo = _similarity_estimate(stats)
+
+    tem_rotas = n > 0
+    alta = tem_rotas & (confianca_geo >= 0.9)
+    media = tem_rotas & ~alta & (confianca_geo >= 0.7)
+    balanceada = tem_rotas & ~alta & ~media
+    tem_vizinhas, preco_vizinhas, confianca_vizinhas = _nearest_estimate(nearest, model_prediction)
+    vizinhas = ~tem_rotas & tem_vizinhas
+
+    prediction = np.select(
+        [alta, media, balanceada, vizinhas],
+        [preco_geo,
+         np.round((preco_geo * 0.8 + model_prediction * 0.2) / 5) * 5,
+         np.round((preco_geo * 0.5 + model_prediction * 0.5) / 5) * 5,
+         preco_vizinhas],
+        default=model_prediction
+    )
+    confidence = np.select(
+        [alta, media, balanceada, vizinhas],
+        [confianca_geo,
+         confianca_geo * 0.8 + model_confidence * 0.2,
+         confianca_geo * 0.5 + model_confidence * 0.5,
+         confianca_vizinhas],
+        default=model_confidence
+    )
+    method = np.select(
+        [alta, media, balanceada, vizinhas],
+        ['geographic_coordinates', 'combined_geo_priority', 'combined_balanced', 'nearest_lanes'],
+        default='ml_model'
+    )
+
+    return pd.DataFrame({
+        'prediction': prediction.astype(np.float64),
+        'confidence': confidence,
+        'method': method,
+        'num_routes': n.astype(np.int64),
+        'num_lanes': nearest['num_lanes'],
+        'nearest_distance': nearest['nearest_distance'],
+    })
+
+def combine_high_confidence(stats, model_prediction, band, nearest, plain_model_prediction,
+                            model_confidence=0.85):
+    """
+    Aplica as regras de predict_with_high_confidence a um lote de consultas.
+
+    Args:
+        stats (dict): Saída de batch_similarity_stats
+        model_prediction (array): Predições do modelo com Valor_por_km das
+            rotas similares (arredondadas)
+        band (dict): Saída de data_processor.distance_band_stats
+        nearest (dict): Saída de nearest_lanes.nearest_lane_stats
+        plain_model_prediction (array): Predições do modelo com Valor_por_km = 0
+        model_confidence (float or array): Confiança do modelo nas predições com
+            Valor_por_km das rotas similares (derivada do intervalo de predição)
+
+    Returns:
+        DataFrame: Colunas 'prediction', 'confidence', 'method' e 'num_routes'
+                   (prediction é NaN quando não há dados suficientes)
+    """
+    n = stats['num_routes']
+    preco_geo, score_medio, _ = _similarity_estimate(stats)
+
+    geo = n >= 5
+    hibrido = (n > 0) & ~geo
+    tem_vizinhas, preco_vizinhas, confianca_vizinhas = _nearest_estimate(nearest, plain_model_prediction)
+    vizinhas = (n == 0) & tem_vizinhas
+    distancia = (n == 0) & ~tem_vizinhas & (band['count'] >= 5)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cv = band['std'] / band['mean']
+    confianca_distancia = np.minimum(band['count'] / 50, 0.7) * np.maximum(0, 1 - cv)
+
+    prediction = np.select(
+        [geo, hibrido, vizinhas, distancia],
+        [preco_geo,
+         np.round((preco_geo * 0.75 + model_prediction * 0.25) / 5) * 5,
+         preco_vizinhas,
+         np.round(band['mean'] / 5) * 5],
+        default=np.nan
+    )
+    confidence = np.select(
+        [geo, hibrido, vizinhas, distancia],
+        [np.minimum((score_medio / 100) * 1.25, 0.99),
+         np.minimum(score_medio / 100, 0.95) * 0.75 + model_confidence * 0.25,
+         confianca_vizinhas,
+         confianca_distancia],
+        default=0.0
+    )
+    method = np.select(
+        [geo, hibrido, vizinhas, distancia],
+        ['geographic_coordinates', 'geographic_priority', 'nearest_lanes', 'similar_distance'],
+        default='insufficient_data'
+    )
+
+    return pd.DataFrame({
+        'prediction': prediction.astype(np.float64),
+        'confidence': confidence,
+        'method': method,
+        'num_routes': n.astype(np.int64),
+    })
+
+def predict_from_stats(queries, stats, band, nearest, model, scaler, features, seasonality=None,
+                       residuals=None, latency_budget_ms=None):
+    """
+    Aplica os métodos de predição a um lote de consultas cujas estatísticas
+    de rotas similares e de faixa de distância já foram calculadas.
+
+    Args:
+        queries (DataFrame): Rotas (ver predict_batch)
+        stats (dict): Saída de batch_similarity_stats, alinhada com queries
+        band (dict): Saída de data_processor.distance_band_stats, alinhada com queries
+        nearest (dict): Saída de nearest_lanes.nearest_lane_stats, alinhada com queries
+        model, scaler, features: Componentes retornados por load_model_and_scaler
+        seasonality (dict, optional): Tabela de sazonalidade (ver predict_batch)
+        residuals (dict, optional): Tabela de correção residual (ver predict_batch)
+        latency_budget_ms (float, optional): Orçamento de latência do modelo (ver predict_batch)
+
+    Returns:
+        dict: DataFrames por método (ver predict_batch)
+    """
+    if seasonality is not None:
+        fatores = seasonal_factors(
+            seasonality,
+            queries['Lat_Origem'].to_numpy(), queries['Lng_Origem'].to_numpy(),
+            queries['Lat_Destino'].to_numpy(), queries['Lng_Destino'].to_numpy(),
+            queries['Mês'].to_numpy()
+        )
+        stats = dict(stats, weighted_price_sum=stats['weighted_price_sum'] * fatores)
+        band = dict(band, mean=band['mean'] * fatores)
+        nearest = dict(nearest, prediction=nearest['prediction'] * fatores)
+
+    n = stats['num_routes']
+
+    # Estágios do GradientBoosting que cabem no orçamento para o lote inteiro
+    estagios = None
+    com_intervalo = True
+    if latency_budget_ms is not None and is_staged_model(model):
+        # O orçamento inclui os modelos de quantis do intervalo, avaliados com os mesmos estágios;
+        # se nem com o mínimo de estágios eles cabem, o lote é respondido sem intervalo
+        quantis = load_quantile_models(model, features, QUANTILE_MODELS_PATH)
+        orcados = quantile_models_for_budget(model, quantis, latency_budget_ms, n_rows=len(queries))
+        com_intervalo = quantis is None or orcados is not None
+        estagios = stages_for_budget(get_staged_model(model), latency_budget_ms, n_rows=len(queries),
+                                     n_models=1 + interval_models(model, orcados))
+
+    # Modelo puro (Valor_por_km = 0, como em predict_freight_price), com o intervalo de predição
+    if com_intervalo:
+        pred_modelo, intervalo = batch_model_predict(model, scaler, features, _model_inputs(queries, 0.0),
+                                                     estagios, interval=True)
+    else:
+        pred_modelo, intervalo = batch_model_predict(model, scaler, features, _model_inputs(queries, 0.0),
+                                                     estagios), None
+    confianca_modelo = DEFAULT_MODEL_CONFIDENCE if intervalo is None else intervalo['confidence']
+
+    # Modelo com Valor_por_km das rotas similares (como em predict_with_high_confidence)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        valor_km_similar = np.where(n > 0, stats['price_sum'] / stats['km_sum'], 0.0)
+    hibrido = np.nonzero((n > 0) & (n < 5))[0]
+    pred_hibrido = np.zeros(len(queries))
+    confianca_hibrido = np.full(len(queries), 0.85)
+    if len(hibrido) and com_intervalo:
+        pred_hibrido[hibrido], intervalo_hibrido = batch_model_predict(
+            model, scaler, features,
+            _model_inputs(queries.iloc[hibrido], valor_km_similar[hibrido]), estagios, interval=True
+        )
+        if intervalo_hibrido is not None:
+            confianca_hibrido[hibrido] = intervalo_hibrido['confidence']
+    elif len(hibrido):
+        pred_hibrido[hibrido] = batch_model_predict(
+            model, scaler, features,
+            _model_inputs(queries.iloc[hibrido], valor_km_similar[hibrido]), estagios
+        )
+
+    preco_geo, _, confianca_geo = _similarity_estimate(stats)
+
+    padrao = combine_standard(stats, pred_modelo, nearest, confianca_modelo)
+    alta_confianca = combine_high_confidence(stats, pred_hibrido, band, nearest, pred_modelo, confianca_hibrido)
+    if residuals is not None:
+        # Correção residual do feedback, aplicada aos pipelines como na predição individual
+        correcoes = correction_factors(
+            residuals,
+            queries['Lat_Origem'].to_numpy(), queries['Lng_Origem'].to_numpy(),
+            queries['Lat_Destino'].to_numpy(), queries['Lng_Destino'].to_numpy(),
+            queries['Mês'].to_numpy()
+        )
+        padrao['prediction'] = apply_correction(padrao['prediction'], correcoes)
+        alta_confianca['prediction'] = apply_correction(alta_confianca['prediction'], correcoes)
+
+    modelo = pd.DataFrame({
+        'prediction': pred_modelo,
+        'confidence': np.broadcast_to(confianca_modelo, len(queries)).astype(np.float64),
+        'method': 'ml_model',
+        'num_routes': n.astype(np.int64),
+    })
+    if intervalo is not None:
+        modelo['lower'] = intervalo['lower']
+        modelo['upper'] = intervalo['upper']
+    elif not com_intervalo:
+        modelo['model_interval_skipped'] = 'latency_budget'
+    if estagios is not None:
+        modelo['model_stages'] = estagios
+
+    return {
+        'similar_routes': pd.DataFrame({
+            'prediction': np.where(n > 0, preco_geo, np.nan),
+            'confidence': np.where(n > 0, confianca_geo, 0.0),
+            'method': np.where(n > 0, 'similar_routes', 'no_similar_routes'),
+            'num_routes': n.astype(np.int64),
+        }),
+        'ml_model': modelo,
+        'standard': padrao,
+        'high_confidence': alta_confianca,
+    }
+
+def predict_batch(queries, historical_data, model, scaler, features, radius_km=50,
+                  lanes=None, exclude=None, seasonality=None, residuals=None, latency_budget_ms=None):
+    """
+    Prediz o frete de um lote de rotas com os dois pipelines de produção
+    (predict.py e improved_prediction.py) e os métodos individuais.
+
+    Args:
+        queries (DataFrame): Rotas com colunas Lat_Origem, Lng_Origem, Lat_Destino,
+            Lng_Destino, KM, Mês e, opcionalmente, Ano
+        historical_data (DataFrame): DataFrame com os dados históricos
+        model, scaler, features: Componentes retornados por load_model_and_scaler
+        radius_km (float): Raio em km para busca (default: 50)
+        lanes (dict, optional): Tabela de rotas pré-calculada (build_lane_table)
+        exclude (dict, optional): Viagem a excluir de cada consulta (leave-one-out),
+            com arrays 'lane', 'row', 'price' e 'km' (ver batch_similarity_stats e
+            nearest_lanes.nearest_lane_stats)
+        seasonality (dict, optional): Tabela de sazonalidade (seasonality.load_seasonality_table)
+            aplicada aos preços históricos, como na predição individual
+        residuals (dict, optional): Tabela de correção residual do feedback
+            (residual_correction.load_residual_table) aplicada aos pipelines
+        latency_budget_ms (float, optional): Orçamento de latência do modelo para o
+            lote; para um GradientBoosting, usa apenas os estágios que cabem nele
+            (ver staged_inference) e reporta a coluna 'model_stages' em 'ml_model'
+
+    Returns:
+        dict: DataFrames por método ('similar_routes', 'ml_model', 'standard',
+              'high_confidence'), alinhados com as linhas de queries; 'ml_model'
+              traz o intervalo de predição do modelo ('lower' e 'upper') quando
+              disponível (ver prediction_intervals), ou 'model_interval_skipped'
+              quando o intervalo não cabe no orçamento de latência
+    """
+    if lanes is None:
+        lanes = cached_for_frame(historical_data, 'lane_table', build_lane_table)
+
+    stats = batch_similarity_stats(
+        lanes,
+        queries['Lat_Origem'].to_numpy(), queries['Lng_Origem'].to_numpy(),
+        queries['Lat_Destino'].to_numpy(), queries['Lng_Destino'].to_numpy(),
+        radius_km=radius_km, exclude=exclude
+    )
+    band = distance_band_stats(
+        historical_data, queries['KM'].to_numpy(),
+        exclude_price=None if exclude is None else exclude['price'],
+        exclude_km=None if exclude is None else exclude['km']
+    )
+    nearest = nearest_lane_stats(
+        historical_data,
+        queries['Lat_Origem'].to_numpy(), queries['Lng_Origem'].to_numpy(),
+        queries['Lat_Destino'].to_numpy(), queries['Lng_Destino'].to_numpy(),
+        queries['KM'].to_numpy(), exclude=exclude
+    )
+
+    return predict_from_stats(queries, stats, band, nearest, model, scaler, features,
+                              seasonality=seasonality, residuals=residuals,
+                              latency_budget_ms=latency_budget_ms)
+
+def predict_enhanced_batch(queries, store, model, scaler, features, residuals=None):
+    """
+    Prediz um lote de rotas com o modelo aprimorado: os agregados da feature
+    store são juntados às consultas (ver feature_store.join_features) e o
+    modelo é executado em uma única chamada (mesmo resultado de
+    predict.predict_enhanced_price).
+
+    Args:
+        queries (DataFrame): Rotas (ver predict_batch)
+        store (dict): Feature store (feature_store.load_feature_store)
+        model, scaler, features: Componentes retornados por predict.load_enhanced_model
+        residuals (dict, optional): Tabela de correção residual do feedback
+
+    Returns:
+        DataFrame: 'prediction', 'confidence', 'method' e 'feature_level',
+                   alinhado com as linhas de queries
+    """
+    queries = queries.reset_index(drop=True)
+    agregados = join_features(store, queries)
+    inputs = _model_inputs(queries, 0.0)
+    inputs['aggregates'] = {nome: agregados[nome].to_numpy(dtype=np.float64) for nome in AGGREGATE_FEATURES}
+    prediction = batch_model_predict(model, scaler, features, inputs)
+
+    if residuals is not None:
+        prediction = apply_correction(prediction, correction_factors(
+            residuals, queries['Lat_Origem'], queries['Lng_Origem'],
+            queries['Lat_Destino'], queries['Lng_Destino'], queries['Mês']))
+
+    return pd.DataFrame({
+        'prediction': prediction,
+        'confidence': agregados['level'].map(LEVEL_CONFIDENCE).to_numpy(dtype=np.float64),
+        'method': 'enhanced_model',
+        'feature_level': agregados['level'],
+    })
+
+def predict_curve(historical_data, model, scaler, features, lat_origem, lng_origem,
+                  lat_destino, lng_destino, months, kms, radius_km=50, seasonality=None,
+                  residuals=None):
+    """
+    Prediz uma rota em vários cenários (meses × distâncias) com uma única
+    busca por rotas similares e uma única chamada ao modelo ML.
+    A busca depende apenas das coordenadas, então é feita uma vez e
+    replicada para todos os cenários.
+
+    Args:
+        historical_data (DataFrame): DataFrame com os dados históricos
+        model, scaler, features: Componentes retornados por load_model_and_scaler
+        lat_origem, lng_origem, lat_destino, lng_destino (float): Coordenadas da rota
+        months (list): Meses avaliados (1-12)
+        kms (list): Distâncias avaliadas (km)
+        radius_km (float): Raio em km para busca (default: 50)
+        seasonality (dict, optional): Tabela de sazonalidade
+        residuals (dict, optional): Tabela de correção residual do feedback
+
+    Returns:
+        DataFrame: Cenários (colunas 'Mês' e 'KM'; para cada KM, todos os meses)
+        dict: DataFrames por método (ver predict_batch), alinhados com os cenários
+    """
+    meses, kms = np.meshgrid(np.asarray(months, dtype=np.int64), np.asarray(kms, dtype=np.float64))
+    n = meses.size
+    cenarios = pd.DataFrame({
+        'Lat_Origem': np.full(n, float(lat_origem)),
+        'Lng_Origem': np.full(n, float(lng_origem)),
+        'Lat_Destino': np.full(n, float(lat_destino)),
+        'Lng_Destino': np.full(n, float(lng_destino)),
+        'KM': kms.ravel(),
+        'Mês': meses.ravel(),
+    })
+
+    lanes = cached_for_frame(historical_data, 'lane_table', build_lane_table)
+    unica = batch_similarity_stats(lanes, [lat_origem], [lng_origem], [lat_destino], [lng_destino],
+                                   radius_km=radius_km)
+    stats = {name: np.repeat(valores, n) for name, valores in unica.items()}
+    band = distance_band_stats(historical_data, cenarios['KM'].to_numpy())
+    nearest = nearest_lane_stats(historical_data, lat_origem, lng_origem, lat_destino, lng_destino,
+                                 cenarios['KM'].to_numpy())
+
+    return cenarios, predict_from_stats(cenarios, stats, band, nearest, model, scaler, features,
+                                        seasonality=seasonality, residuals=residuals)
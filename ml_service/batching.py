@@ -0,0 +1,134 @@
+"""
+Módulo de micro-lotes (micro-batching) para o serviço residente de predição.
+Requisições concorrentes são colocadas em uma fila asyncio; um único
+consumidor junta as que chegam em uma janela de poucos milissegundos (ou até
+atingir o tamanho máximo do lote), processa o lote com uma única chamada
+vetorizada e devolve a cada requisição o seu resultado.
+
+Enquanto um lote está sendo processado (em uma thread, sem bloquear o event
+loop), as novas requisições se acumulam na fila e formam o lote seguinte.
+
+Requisições idênticas em andamento (mesma chave, ver key_fn) são agrupadas
+(single-flight): apenas a primeira entra na fila e as demais aguardam o
+mesmo resultado.
+"""
+
+import time
+import asyncio
+
+# Tamanho máximo do lote e janela de coleta padrão
+MAX_BATCH_SIZE = 64
+MAX_WAIT_MS = 2.0
+
+class MicroBatcher:
+    """
+    Agrupa chamadas concorrentes de submit() em lotes para process_batch.
+
+    Args:
+        process_batch (callable): Função síncrona que recebe a lista de itens
+            e retorna a lista de resultados na mesma ordem
+        max_batch_size (int): Máximo de itens por lote
+        max_wait_ms (float): Tempo máximo de espera por novos itens após o primeiro
+        key_fn (callable, optional): Chave normalizada de um item; itens com a
+            mesma chave em andamento compartilham uma única avaliação
+            (None desativa o agrupamento, assim como uma chave None)
+    """
+
+    def __init__(self, process_batch, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS, key_fn=None):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.key_fn = key_fn
+        self.stats = {'requests': 0, 'batches': 0, 'max_batch': 0, 'coalesced': 0}
+        self._queue = None
+        self._task = None
+        self._inflight = {}
+        self._batch = []
+
+    async def start(self):
+        """Inicia o consumidor da fila no event loop atual."""
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Encerra o consumidor. Requisições pendentes recebem erro: as da fila e
+        as do lote que estava sendo coletado ou processado.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        pendentes = self._batch
+        self._batch = []
+        while self._queue is not None and not self._queue.empty():
+            pendentes.append(self._queue.get_nowait())
+        for _, futuro in pendentes:
+            if not futuro.done():
+                futuro.set_exception(RuntimeError("Serviço encerrado"))
+
+    async def submit(self, item):
+        """Enfileira um item (ou se junta a um idêntico em andamento) e aguarda o seu resultado."""
+        if self._task is None:
+            raise RuntimeError("MicroBatcher não iniciado")
+
+        chave = self.key_fn(item) if self.key_fn is not None else None
+        if chave is not None and chave in self._inflight:
+            self.stats['coalesced'] += 1
+            # shield: o cancelamento de uma requisição não cancela as demais
+            return await asyncio.shield(self._inflight[chave])
+
+        futuro = asyncio.get_running_loop().create_future()
+        if chave is not None:
+            self._inflight[chave] = futuro
+            futuro.add_done_callback(lambda _: self._inflight.pop(chave, None))
+        await self._queue.put((item, futuro))
+        return await asyncio.shield(futuro) if chave is not None else await futuro
+
+    async def _collect(self):
+        """Aguarda o primeiro item e junta os seguintes até o tamanho ou prazo máximo."""
+        # O lote fica acessível a stop() desde o primeiro item
+        lote = self._batch = [await self._queue.get()]
+        prazo = time.monotonic() + self.max_wait_ms / 1000
+
+        while len(lote) < self.max_batch_size:
+            # Primeiro esvazia o que já está na fila, sem esperar
+            if not self._queue.empty():
+                lote.append(self._queue.get_nowait())
+                continue
+            restante = prazo - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                lote.append(await asyncio.wait_for(self._queue.get(), restante))
+            except asyncio.TimeoutError:
+                break
+        return lote
+
+    async def _run(self):
+        """Laço do consumidor: coleta, processa em uma thread e distribui os resultados."""
+        loop = asyncio.get_running_loop()
+        while True:
+            lote = await self._collect()
+            itens = [item for item, _ in lote]
+
+            self.stats['requests'] += len(lote)
+            self.stats['batches'] += 1
+            self.stats['max_batch'] = max(self.stats['max_batch'], len(lote))
+
+            try:
+                resultados = await loop.run_in_executor(None, self.process_batch, itens)
+            except Exception as e:
+                for _, futuro in lote:
+                    if not futuro.done():
+                        futuro.set_exception(e)
+                self._batch = []
+                continue
+
+            for (_, futuro), resultado in zip(lote, resultados):
+                if not futuro.done():
+                    futuro.set_result(resultado)
+            self._batch = []
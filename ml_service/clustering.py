@@ -0,0 +1,242 @@
+"""
+Módulo de clusters de origens e destinos do sistema de fretes.
+Agrupa as origens e os destinos do histórico com MiniBatchKMeans em
+coordenadas projetadas em km (projeção equiretangular centrada no
+histórico) e persiste os centroides em JSON ao lado do modelo.
+
+A atribuição de um ponto é uma busca pelo centroide mais próximo
+(poucos microssegundos para um ponto; KDTree dos centroides para lotes).
+Novas viagens atualizam os clusters de forma incremental, com a mesma regra
+do MiniBatchKMeans (o centroide se move em direção ao ponto com taxa
+1 / contagem); um ponto a mais de NEW_CLUSTER_RADIUS_KM de todos os
+centroides abre um novo cluster, sem reagrupar o histórico.
+"""
+
+import os
+import sys
+import math
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.neighbors import KDTree
+from similarity_index import EARTH_RADIUS_KM
+
+# Caminho dos clusters (ao lado do modelo)
+CLUSTERS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'route_clusters.json')
+
+# Quantidade inicial de clusters de origem e de destino
+N_ORIGIN_CLUSTERS = 6
+N_DEST_CLUSTERS = 12
+
+# Distância (km) ao centroide mais próximo a partir da qual um ponto novo abre um cluster
+NEW_CLUSTER_RADIUS_KM = 100.0
+
+# Colunas de coordenadas de cada lado da rota
+SIDE_COLUMNS = {
+    'origin': ('Lat_Origem', 'Lng_Origem'),
+    'dest': ('Lat_Destino', 'Lng_Destino'),
+}
+
+# Índices dos centroides por (versão, lado), reutilizados entre atribuições
+_indexes = {}
+
+# Clusters carregados (por caminho), reutilizados entre predições do mesmo processo
+_loaded_clusters = {}
+
+def _project(lat, lng, lat_ref):
+    """Projeção equiretangular em km: pontos n × 2 (x = leste, y = norte)."""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lng = np.radians(np.asarray(lng, dtype=np.float64))
+    return np.column_stack([np.ravel(lng * np.cos(np.radians(lat_ref)) * EARTH_RADIUS_KM),
+                            np.ravel(lat * EARTH_RADIUS_KM)])
+
+def _set_version(clusters):
+    """Atualiza a versão (hash dos centroides) e descarta os índices antigos."""
+    for lado in SIDE_COLUMNS:
+        _indexes.pop((clusters.get('version'), lado), None)
+    conteudo = json.dumps([clusters['lat_ref'], clusters['origin'], clusters['dest']]).encode('utf-8')
+    clusters['version'] = hashlib.sha1(conteudo).hexdigest()[:12]
+    clusters['updated_at'] = datetime.now().isoformat()
+
+def _fit_side(pontos, pesos, n_clusters, random_state):
+    """Ajusta os clusters de um lado: centroides (km) e peso acumulado de cada um."""
+    unicos, inverso = np.unique(pontos, axis=0, return_inverse=True)
+    pesos_unicos = np.bincount(inverso.ravel(), weights=pesos, minlength=len(unicos))
+
+    kmeans = MiniBatchKMeans(n_clusters=min(n_clusters, len(unicos)), batch_size=256,
+                             n_init=3, random_state=random_state)
+    rotulos = kmeans.fit_predict(unicos, sample_weight=pesos_unicos)
+    contagens = np.bincount(rotulos, weights=pesos_unicos, minlength=kmeans.n_clusters)
+    return {
+        'centroids': [[round(float(x), 4), round(float(y), 4)] for x, y in kmeans.cluster_centers_],
+        'counts': [round(float(c), 1) for c in contagens],
+    }
+
+def fit_clusters(df, sample_weight=None, n_origin=N_ORIGIN_CLUSTERS, n_dest=N_DEST_CLUSTERS, random_state=42):
+    """
+    Agrupa as origens e os destinos de um DataFrame histórico.
+    Pontos repetidos são agrupados (com peso) antes do ajuste.
+
+    Args:
+        df (DataFrame): Dados com as colunas de coordenadas
+        sample_weight (array, optional): Peso de cada linha
+        n_origin, n_dest (int): Quantidade de clusters de origem e de destino
+        random_state (int): Semente do MiniBatchKMeans
+
+    Returns:
+        dict: 'lat_ref' da projeção, 'origin' e 'dest' ('centroids' em km e
+              'counts'), 'version' e 'updated_at'
+    """
+    w = np.ones(len(df)) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+    lat_ref = float(np.mean(np.concatenate([df['Lat_Origem'].to_numpy(dtype=np.float64),
+                                            df['Lat_Destino'].to_numpy(dtype=np.float64)])))
+    clusters = {'lat_ref': lat_ref}
+    for lado, n in (('origin', n_origin), ('dest', n_dest)):
+        lat, lng = SIDE_COLUMNS[lado]
+        clusters[lado] = _fit_side(_project(df[lat], df[lng], lat_ref), w, n, random_state)
+    _set_version(clusters)
+    return clusters
+
+def _side_index(clusters, side):
+    """Centroides do lado em array contíguo e KDTree (construídos uma vez por versão)."""
+    chave = (clusters['version'], side)
+    indice = _indexes.get(chave)
+    if indice is None:
+        centroides = np.ascontiguousarray(clusters[side]['centroids'], dtype=np.float64)
+        indice = {'centroids': centroides, 'x': centroides[:, 0].copy(), 'y': centroides[:, 1].copy(),
+                  'x_scale': math.cos(math.radians(clusters['lat_ref'])) * EARTH_RADIUS_KM,
+                  'tree': KDTree(centroides)}
+        _indexes[chave] = indice
+    return indice
+
+def assign_cluster(clusters, side, lat, lng):
+    """
+    Cluster de um ponto (centroide mais próximo).
+
+    Args:
+        clusters (dict): Clusters (ver fit_clusters)
+        side (str): 'origin' ou 'dest'
+        lat, lng (float): Coordenadas do ponto
+
+    Returns:
+        int: Índice do cluster
+    """
+    indice = _side_index(clusters, side)
+    # Projeção escalar (mesma de _project), sem a sobrecarga de arrays para um ponto
+    x = math.radians(float(lng)) * indice['x_scale']
+    y = math.radians(float(lat)) * EARTH_RADIUS_KM
+    return int(np.argmin((indice['x'] - x) ** 2 + (indice['y'] - y) ** 2))
+
+def assign_clusters(clusters, side, lat, lng):
+    """
+    Versão em lote de assign_cluster (KDTree dos centroides).
+
+    Returns:
+        ndarray: Índice do cluster de cada ponto
+        ndarray: Distância (km) ao centroide
+    """
+    if len(np.atleast_1d(lat)) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    distancias, indices = _side_index(clusters, side)['tree'].query(_project(lat, lng, clusters['lat_ref']), k=1)
+    return indices[:, 0], distancias[:, 0]
+
+def update_clusters(clusters, df, sample_weight=None, new_cluster_radius_km=NEW_CLUSTER_RADIUS_KM):
+    """
+    Atualiza os clusters com novas viagens (O(novas viagens), sem reagrupar o histórico).
+    Cada ponto move o centroide mais próximo em direção a ele com taxa
+    peso / peso acumulado do cluster; pontos além do raio abrem um novo cluster.
+
+    Args:
+        clusters (dict): Clusters (alterados no lugar)
+        df (DataFrame): Novas viagens com as colunas de coordenadas
+        sample_weight (array, optional): Peso de cada viagem
+        new_cluster_radius_km (float): Distância mínima para abrir um cluster
+
+    Returns:
+        dict: Quantidade de clusters novos por lado
+    """
+    w = np.ones(len(df)) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+    novos = {}
+    for lado, (lat, lng) in SIDE_COLUMNS.items():
+        centroides = np.asarray(clusters[lado]['centroids'], dtype=np.float64)
+        contagens = np.asarray(clusters[lado]['counts'], dtype=np.float64)
+        inicial = len(centroides)
+
+        for ponto, peso in zip(_project(df[lat], df[lng], clusters['lat_ref']), w):
+            distancias = np.hypot(centroides[:, 0] - ponto[0], centroides[:, 1] - ponto[1])
+            c = int(np.argmin(distancias))
+            if distancias[c] > new_cluster_radius_km:
+                centroides = np.vstack([centroides, ponto])
+                contagens = np.append(contagens, peso)
+                continue
+            contagens[c] += peso
+            centroides[c] += (ponto - centroides[c]) * peso / contagens[c]
+
+        clusters[lado] = {
+            'centroids': [[round(float(x), 4), round(float(y), 4)] for x, y in centroides],
+            'counts': [round(float(c), 1) for c in contagens],
+        }
+        novos[lado] = len(centroides) - inicial
+    _set_version(clusters)
+    return novos
+
+def save_clusters(clusters, path=CLUSTERS_PATH):
+    """Salva os clusters em JSON (escrita atômica) e descarta a versão em memória."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporario = f"{path}.tmp"
+    with open(temporario, 'w') as f:
+        json.dump(clusters, f, separators=(',', ':'))
+    os.replace(temporario, path)
+    _loaded_clusters.pop(path, None)
+    print(f"Clusters salvos em: {path} (versão {clusters['version']}, "
+          f"{len(clusters['origin']['centroids'])} origens, {len(clusters['dest']['centroids'])} destinos)")
+
+def load_clusters(path=CLUSTERS_PATH):
+    """
+    Carrega os clusters (uma vez por processo).
+
+    Returns:
+        dict: Clusters, ou None se ainda não foram gerados
+    """
+    if path not in _loaded_clusters:
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as f:
+            _loaded_clusters[path] = json.load(f)
+    return _loaded_clusters[path]
+
+def main():
+    """
+    Gera, atualiza ou consulta os clusters:
+    python clustering.py fit
+    python clustering.py update novas_viagens.csv
+    python clustering.py assign lat lng
+    """
+    comando = sys.argv[1] if len(sys.argv) >= 2 else None
+
+    if comando == 'fit':
+        from predict import load_historical_data
+        save_clusters(fit_clusters(load_historical_data()))
+        return
+
+    clusters = load_clusters()
+    if comando in ('update', 'assign') and clusters is None:
+        print(f"Clusters não encontrados em {CLUSTERS_PATH} (execute: python clustering.py fit)")
+        return
+
+    if comando == 'update' and len(sys.argv) >= 3:
+        novos = update_clusters(clusters, pd.read_csv(sys.argv[2]))
+        print(f"Clusters novos: {novos['origin']} de origem, {novos['dest']} de destino")
+        save_clusters(clusters)
+    elif comando == 'assign' and len(sys.argv) >= 4:
+        lat, lng = float(sys.argv[2]), float(sys.argv[3])
+        print(f"Cluster de origem: {assign_cluster(clusters, 'origin', lat, lng)} | "
+              f"cluster de destino: {assign_cluster(clusters, 'dest', lat, lng)}")
+    else:
+        print("Uso: python clustering.py fit | update novas_viagens.csv | assign lat lng")
+
+if __name__ == "__main__":
+    main()
@@ -5,9 +5,75 @@ Fornece funções para preparação e transformação dos dados para predição.
 
 import pandas as pd
 import numpy as np
-from geopy.distance import geodesic
+from similarity_index import search_similar_routes, summarize_similar_routes, matches_to_frame, cached_for_frame
 
-def find_similar_routes(lat_origem, lng_origem, lat_destino, lng_destino, historical_data, radius_km=50):
+def lane_key(lat_origem, lng_origem, lat_destino, lng_destino):
+    """
+    Gera a chave canônica de uma rota (par origem → destino).
+    As coordenadas são arredondadas para 4 casas decimais (~10m), de modo que
+    a mesma rota gere sempre a mesma chave entre treino e predição.
+
+    Returns:
+        str: Chave no formato "lat,lng>lat,lng"
+    """
+    return (f"{float(lat_origem):.4f},{float(lng_origem):.4f}>"
+            f"{float(lat_destino):.4f},{float(lng_destino):.4f}")
+
+def compact_historical_frame(df):
+    """
+    Converte o DataFrame histórico para tipos compactos, reduzindo a memória
+    de cada processo que mantém o histórico residente:
+    - coordenadas em float32 (~0.2m de precisão)
+    - mês, trimestre, ano e KM em inteiros pequenos
+    - rota como categoria ('Rota', chaves de lane_key)
+    - colunas de texto originais (ORIGEN, DESTINO, Data Saída) removidas
+
+    Args:
+        df (DataFrame): DataFrame histórico já processado
+
+    Returns:
+        DataFrame: Novo DataFrame com tipos compactos
+    """
+    colunas_rota = ['Lat_Origem', 'Lng_Origem', 'Lat_Destino', 'Lng_Destino']
+
+    # A chave da rota é gerada antes da conversão para float32
+    codigos = df.groupby(colunas_rota, sort=False).ngroup().to_numpy()
+    unicos = df[colunas_rota].drop_duplicates()
+    chaves = np.array([lane_key(*c) for c in unicos.itertuples(index=False)], dtype=object)
+
+    compacto = df.drop(columns=['ORIGEN', 'DESTINO', 'Data Saída'], errors='ignore')
+    compacto = compacto.assign(Rota=pd.Categorical(chaves[codigos]))
+
+    for coluna in colunas_rota:
+        compacto[coluna] = compacto[coluna].astype(np.float32)
+    for coluna in ['Mês', 'Trimestre']:
+        compacto[coluna] = compacto[coluna].astype(np.int8)
+    compacto['Ano'] = compacto['Ano'].astype(np.int16)
+    compacto['KM'] = pd.to_numeric(compacto['KM'], downcast='integer')
+
+    return compacto
+
+def frame_memory_report(before, after):
+    """
+    Compara o uso de memória (bytes por linha) de duas versões do histórico.
+
+    Returns:
+        dict: Bytes totais e por linha antes/depois e redução percentual
+    """
+    antes = int(before.memory_usage(deep=True).sum())
+    depois = int(after.memory_usage(deep=True).sum())
+    linhas = max(len(after), 1)
+    return {
+        "rows": len(after),
+        "bytes_before": antes,
+        "bytes_after": depois,
+        "bytes_per_row_before": round(antes / max(len(before), 1), 1),
+        "bytes_per_row_after": round(depois / linhas, 1),
+        "reduction_pct": round((1 - depois / antes) * 100, 1) if antes else 0.0,
+    }
+
+def find_similar_routes(lat_origem, lng_origem, lat_destino, lng_destino, historical_data, radius_km=50,
+                        top_k=None):
     """
     Encontra rotas similares considerando um raio de 50km ao redor das coordenadas de origem e destino.
     
@@ -18,6 +84,7 @@ def find_similar_routes(lat_origem, lng_origem, lat_destino, lng_destino, histor
         lng_destino (float): Longitude do destino
         historical_data (DataFrame): DataFrame com os dados históricos
         radius_km (int): Raio em km para busca (default: 50)
+        top_k (int, optional): Retorna apenas as top_k rotas mais similares
         
     Returns:
         DataFrame: DataFrame com rotas similares encontradas e pontuação de similaridade
@@ -25,41 +92,23 @@ def find_similar_routes(lat_origem, lng_origem, lat_destino, lng_destino, histor
     if historical_data.empty:
         return pd.DataFrame()
     
-    # Converte para coordenadas
-    origem_coord = (lat_origem, lng_origem)
-    destino_coord = (lat_destino, lng_destino)
-    
-    # Cria cópia dos dados para manipulação
-    df = historical_data.copy()
-    
-    # Coordenadas na base de dados
-    df['origem_coord'] = list(zip(df['Lat_Origem'], df['Lng_Origem']))
-    df['destino_coord'] = list(zip(df['Lat_Destino'], df['Lng_Destino']))
-    
-    # Calcula distâncias para origem e destino
-    df['distancia_origem'] = df['origem_coord'].apply(lambda x: geodesic(origem_coord, x).kilometers)
-    df['distancia_destino'] = df['destino_coord'].apply(lambda x: geodesic(destino_coord, x).kilometers)
-    
-    # Filtra por raio (50km)
-    df_filtrado = df[(df['distancia_origem'] <= radius_km) & (df['distancia_destino'] <= radius_km)].copy()
+    # Busca no índice de coordenadas (sem copiar o histórico)
+    if top_k is not None:
+        matches = summarize_similar_routes(
+            historical_data, lat_origem, lng_origem, lat_destino, lng_destino,
+            radius_km=radius_km, k=top_k
+        )['top']
+    else:
+        matches = search_similar_routes(
+            historical_data, lat_origem, lng_origem, lat_destino, lng_destino, radius_km=radius_km
+        )
     
-    if df_filtrado.empty:
+    if len(matches) == 0:
         return pd.DataFrame()
     
-    # Calcula pontuação de similaridade (maior para rotas mais próximas)
-    # Pontuação máxima: 100 (exatamente a mesma rota)
-    
-    # Fator de decaimento para distância - dá maior peso para rotas mais próximas
-    # Usando .loc para evitar SettingWithCopyWarning
-    df_filtrado.loc[:, 'score_origem'] = (1 - df_filtrado['distancia_origem'] / radius_km) * 50  # Máximo 50 pontos
-    df_filtrado.loc[:, 'score_destino'] = (1 - df_filtrado['distancia_destino'] / radius_km) * 50  # Máximo 50 pontos
-    df_filtrado.loc[:, 'similarity_score'] = df_filtrado['score_origem'] + df_filtrado['score_destino']
-    
-    # Ordena por maior similaridade
-    resultado = df_filtrado.sort_values('similarity_score', ascending=False)
-    
-    # Retorna apenas as colunas relevantes
-    return resultado[['Frete Carreteiro', 'KM', 'Mês', 'distancia_origem', 'distancia_destino', 'similarity_score']]
+    # Pontuação de similaridade: máximo de 50 pontos pela origem e 50 pelo destino
+    # (100 = exatamente a mesma rota). Registros ordenados por maior similaridade.
+    return matches_to_frame(historical_data, matches)
 
 def get_most_similar_price(lat_origem, lng_origem, lat_destino, lng_destino, historical_data, radius_km=50):
     """
@@ -77,49 +126,109 @@ def get_most_similar_price(lat_origem, lng_origem, lat_destino, lng_destino, his
         float: Preço recomendado (ou None se não encontrar)
         dict: Detalhes da recomendação
     """
-    rotas_similares = find_similar_routes(
-        lat_origem, lng_origem, lat_destino, lng_destino, 
-        historical_data, radius_km
+    resumo = summarize_similar_routes(
+        historical_data, lat_origem, lng_origem, lat_destino, lng_destino,
+        radius_km=radius_km, k=5
     )
     
-    if rotas_similares.empty:
+    if resumo['num_routes'] == 0:
         return None, {
             "confidence": 0,
             "num_routes": 0,
             "message": "Nenhuma rota similar encontrada"
         }
     
-    # Pesos ponderados pela similaridade
-    pesos = rotas_similares['similarity_score'] / rotas_similares['similarity_score'].sum()
-    preco_recomendado = (rotas_similares['Frete Carreteiro'] * pesos).sum()
-    
-    # Calcula confiança baseada no número de rotas e scores
-    num_rotas = len(rotas_similares)
-    score_medio = rotas_similares['similarity_score'].mean()
-    
-    # Fatores de confiança:
-    # 1. Número de rotas (mais é melhor)
-    # 2. Score médio (mais alto é melhor)
-    confianca_n_rotas = min(num_rotas / 10, 1.0)  # Saturando em 10+ rotas
-    confianca_score = score_medio / 100  # Score máximo é 100
+    num_rotas = resumo['num_routes']
+    confianca = resumo['confidence']
     
-    # Confiança geral (média ponderada)
-    confianca = (confianca_n_rotas * 0.4) + (confianca_score * 0.6)
-    confianca = min(confianca, 1.0)  # Limita a 100%
-    
-    # Arredonda para o múltiplo de 5 mais próximo
-    preco_recomendado = round(preco_recomendado / 5) * 5
+    # Preço ponderado pela similaridade, arredondado para o múltiplo de 5 mais próximo
+    preco_recomendado = round(resumo['weighted_price'] / 5) * 5
     
     return preco_recomendado, {
         "confidence": confianca,
         "confidence_pct": round(confianca * 100, 1),
         "num_routes": num_rotas,
-        "avg_similarity": round(score_medio, 1),
+        "avg_similarity": round(resumo['avg_similarity'], 1),
         "price_basis": "similar_routes",
         "message": f"Preço baseado em {num_rotas} rota(s) similar(es) num raio de {radius_km}km",
-        "similar_routes": rotas_similares.head(5).to_dict('records')
+        "similar_routes": matches_to_frame(historical_data, resumo['top']).to_dict('records')
+    }
+
+def build_distance_band_index(historical_data):
+    """
+    Constrói o índice de distâncias: KM ordenado e somas acumuladas de preço,
+    preço² e R$/km. Os preços são centralizados na média global antes das
+    somas para preservar a precisão numérica do desvio padrão.
+    
+    Args:
+        historical_data (DataFrame): DataFrame com os dados históricos
+        
+    Returns:
+        dict: Arrays 'km' (ordenado), 'price_sum', 'price_sq_sum', 'value_per_km_sum'
+              (com um zero inicial) e o deslocamento 'price_shift'
+    """
+    ordem = np.argsort(historical_data['KM'].to_numpy(), kind='stable')
+    precos = historical_data['Frete Carreteiro'].to_numpy(dtype=np.float64)[ordem]
+    valor_km = historical_data['Valor_por_km'].to_numpy(dtype=np.float64)[ordem]
+    deslocamento = float(precos.mean()) if len(precos) else 0.0
+    centrados = precos - deslocamento
+    
+    return {
+        'km': historical_data['KM'].to_numpy(dtype=np.float64)[ordem],
+        'price_shift': deslocamento,
+        'price_sum': np.concatenate(([0.0], np.cumsum(centrados))),
+        'price_sq_sum': np.concatenate(([0.0], np.cumsum(centrados ** 2))),
+        'value_per_km_sum': np.concatenate(([0.0], np.cumsum(valor_km))),
     }
 
+def distance_band_stats(historical_data, km, exclude_price=None, exclude_km=None):
+    """
+    Estatísticas das viagens com distância similar (0.9·km <= KM <= 1.1·km).
+    Usa o índice de distâncias do histórico (construído uma única vez): a faixa
+    é obtida com duas buscas binárias e as estatísticas em O(1) pelas somas
+    acumuladas, independentemente do tamanho do histórico.
+    
+    Args:
+        historical_data (DataFrame): DataFrame com os dados históricos
+        km (float ou array): Distância(s) consultada(s)
+        exclude_price, exclude_km (array, optional): Viagem a excluir de cada
+            consulta (leave-one-out)
+        
+    Returns:
+        dict: 'count', 'mean', 'std' (ddof=1, como pandas) e 'value_per_km_mean',
+              com o mesmo formato de km
+    """
+    index = cached_for_frame(historical_data, 'distance_band_index', build_distance_band_index)
+    km = np.asarray(km, dtype=np.float64)
+    
+    inicio = np.searchsorted(index['km'], 0.9 * km, side='left')
+    fim = np.searchsorted(index['km'], 1.1 * km, side='right')
+    
+    count = (fim - inicio).astype(np.float64)
+    s1 = index['price_sum'][fim] - index['price_sum'][inicio]
+    s2 = index['price_sq_sum'][fim] - index['price_sq_sum'][inicio]
+    sv = index['value_per_km_sum'][fim] - index['value_per_km_sum'][inicio]
+    
+    if exclude_price is not None:
+        exclude_price = np.asarray(exclude_price, dtype=np.float64)
+        exclude_km = np.asarray(exclude_km, dtype=np.float64)
+        na_faixa = (exclude_km >= 0.9 * km) & (exclude_km <= 1.1 * km)
+        centrado = exclude_price - index['price_shift']
+        count = count - na_faixa
+        s1 = s1 - na_faixa * centrado
+        s2 = s2 - na_faixa * centrado ** 2
+        sv = sv - na_faixa * (exclude_price / exclude_km)
+    
+    with np.errstate(invalid='ignore', divide='ignore'):
+        media_centrada = s1 / count
+        var = (s2 - s1 * media_centrada) / (count - 1)
+        return {
+            'count': count,
+            'mean': media_centrada + index['price_shift'],
+            'std': np.sqrt(np.maximum(var, 0.0)),
+            'value_per_km_mean': sv / count,
+        }
+
 def prepare_data_for_model(df, features_list):
     """
     Prepara os dados para serem usados no modelo de ML.
@@ -134,6 +243,109 @@ def prepare_data_for_model(df, features_list):
     X = df[features_list]
     return X
 
+# Construtores compilados por (features, scaler), reutilizados entre predições
+_feature_builders = {}
+
+def compile_feature_builder(features, scaler=None):
+    """
+    Pré-compila o construtor de vetores de features na ordem do modelo.
+    As features calculáveis a partir da consulta (ver _fill_features) e as
+    agregadas informadas em 'aggregates' são preenchidas; as demais recebem 0,
+    como em predict.py.
+    Quando o scaler é um StandardScaler, a padronização é aplicada no próprio
+    construtor ((x - média) / escala), sem passar pelo DataFrame nem pela
+    validação do scikit-learn.
+
+    Args:
+        features (list): Features na ordem do treino (metadados do modelo)
+        scaler (optional): Scaler ajustado no treino
+
+    Returns:
+        dict: Posição de cada feature, parâmetros da padronização e o vetor
+              reutilizado pelas predições individuais
+    """
+    positions = {nome: posicao for posicao, nome in enumerate(features)}
+    fundido = scaler is not None and hasattr(scaler, 'mean_') and hasattr(scaler, 'scale_')
+    return {
+        'features': list(features),
+        'positions': positions,
+        'scaler': None if fundido else scaler,
+        'mean': np.asarray(scaler.mean_, dtype=np.float64) if fundido else None,
+        'scale': np.asarray(scaler.scale_, dtype=np.float64) if fundido else None,
+        'row': np.zeros((1, len(features))),
+        'source': scaler,
+    }
+
+def get_feature_builder(features, scaler=None):
+    """Retorna o construtor compilado para o par (features, scaler) do modelo carregado."""
+    chave = (tuple(features), id(scaler))
+    builder = _feature_builders.get(chave)
+    if builder is None or builder['source'] is not scaler:
+        builder = compile_feature_builder(features, scaler)
+        _feature_builders[chave] = builder
+    return builder
+
+def _fill_features(builder, X, km, mes, ano, lat_origem, lng_origem, lat_destino, lng_destino, valor_por_km,
+                   aggregates=None):
+    """Escreve as features da consulta (e os agregados) nas colunas de X e aplica a padronização."""
+    mes = np.asarray(mes)
+    valores = dict(aggregates or {})
+    valores.update({
+        'KM': km,
+        'Mês': mes,
+        'Trimestre': (mes - 1) // 3 + 1,
+        'Ano': ano,
+        'Lat_Origem': lat_origem,
+        'Lng_Origem': lng_origem,
+        'Lat_Destino': lat_destino,
+        'Lng_Destino': lng_destino,
+        'Valor_por_km': valores.get('Valor_por_km', valor_por_km),
+        # Coordenadas "imputadas" do modelo aprimorado: iguais às informadas
+        'Lat_Origem_Imp': lat_origem,
+        'Lng_Origem_Imp': lng_origem,
+        'Lat_Destino_Imp': lat_destino,
+        'Lng_Destino_Imp': lng_destino,
+    })
+    for nome, posicao in builder['positions'].items():
+        if nome in valores:
+            X[:, posicao] = valores[nome]
+
+    if builder['mean'] is not None:
+        X -= builder['mean']
+        X /= builder['scale']
+    elif builder['scaler'] is not None:
+        X = builder['scaler'].transform(pd.DataFrame(X, columns=builder['features']))
+    return X
+
+def build_feature_row(builder, km, mes, ano, lat_origem, lng_origem, lat_destino, lng_destino,
+                      valor_por_km=0.0, aggregates=None):
+    """
+    Vetor de features (já padronizado) de uma consulta, escrito no vetor
+    reutilizável do construtor. O resultado é sobrescrito na próxima chamada.
+    'aggregates' fornece features agregadas (nome → valor), que têm
+    precedência sobre valor_por_km.
+
+    Returns:
+        ndarray: Matriz 1 × n_features pronta para model.predict
+    """
+    X = builder['row']
+    X.fill(0.0)
+    return _fill_features(builder, X, km, mes, ano, lat_origem, lng_origem, lat_destino, lng_destino,
+                          valor_por_km, aggregates)
+
+def build_feature_matrix(builder, km, mes, ano, lat_origem, lng_origem, lat_destino, lng_destino,
+                         valor_por_km=0.0, aggregates=None):
+    """
+    Versão em lote de build_feature_row (arrays alinhados ou escalares).
+
+    Returns:
+        ndarray: Matriz n × n_features pronta para model.predict
+    """
+    n = len(np.atleast_1d(km))
+    X = np.zeros((n, len(builder['features'])))
+    return _fill_features(builder, X, km, mes, ano, lat_origem, lng_origem, lat_destino, lng_destino,
+                          valor_por_km, aggregates)
+
 def explain_prediction(prediction, details, df_input):
     """
     Gera uma explicação da predição em linguagem natural.
@@ -141,7 +353,7 @@ def explain_prediction(prediction, details, df_input):
     Args:
         prediction (float): Valor predito pelo modelo
         details (dict): Detalhes da predição
-        df_input (DataFrame): Dados de entrada
+        df_input (dict ou DataFrame): Dados de entrada
         
     Returns:
         str: Explicação da predição
@@ -159,7 +371,7 @@ def explain_prediction(prediction, details, df_input):
         f"Baseado em {details['num_routes']} rota(s) similar(es) dentro de um raio de 50km\n"
     )
     
-    if details["num_routes"] > 0:
+    if details["num_routes"] > 0 and details.get("similar_routes"):
         rota_mais_similar = details["similar_routes"][0]
         msg += (
             f"Rota mais similar:\n"
@@ -0,0 +1,233 @@
+"""
+Módulo de destilação do modelo aprimorado.
+O modelo aprimorado (enhanced_gb_model.pkl) é um RandomForest de 100 árvores
+profundas (~3 MB); cada predição percorre todas elas. A destilação ajusta um
+GradientBoosting raso (o "aluno") às saídas do modelo aprimorado (o
+"professor") sobre o histórico e sobre pontos gerados a partir dele:
+- mesmo KM de cada rota com variação de ±20%, todos os meses e anos do histórico
+- parte dos pontos com origem e destino deslocados, para cobrir rotas fora
+  do histórico (agregados de nível 'cluster_pair'/'global' da feature store)
+
+O aluno usa as mesmas features, o mesmo scaler e a mesma feature store do
+professor, e é servido como nível rápido padrão de predict_enhanced_price.
+Os limites de erro em relação ao professor (rotas separadas do ajuste, com
+todos os pontos gerados a partir delas) e a precisão de ambos no histórico são
+gravados nos metadados do aluno.
+"""
+
+import os
+import json
+import time
+import pickle
+import joblib
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from sklearn.ensemble import GradientBoostingRegressor
+from data_processor import lane_key, get_feature_builder, build_feature_matrix
+from feature_store import join_features, AGGREGATE_FEATURES
+
+# Caminhos do aluno (ao lado do modelo aprimorado)
+STUDENT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'enhanced_student_model.pkl')
+STUDENT_METADATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models',
+                                     'enhanced_student_model_metadata.json')
+
+# Pontos gerados por viagem do histórico
+SYNTHETIC_PER_TRIP = 3
+
+# Fração dos pontos gerados com origem e destino deslocados e deslocamento máximo (graus)
+SHIFTED_FRACTION = 0.3
+MAX_SHIFT_DEG = 0.5
+
+# Fração das rotas separada para medir o erro do aluno em relação ao professor
+HOLDOUT_FRACTION = 0.2
+
+# Hiperparâmetros do aluno
+STUDENT_PARAMS = {'n_estimators': 200, 'max_depth': 4, 'learning_rate': 0.1, 'subsample': 0.8,
+                  'random_state': 42}
+
+QUERY_COLUMNS = ['Lat_Origem', 'Lng_Origem', 'Lat_Destino', 'Lng_Destino', 'KM', 'Mês', 'Ano']
+
+def generate_points(historical_data, per_trip=SYNTHETIC_PER_TRIP, shifted_fraction=SHIFTED_FRACTION,
+                    max_shift_deg=MAX_SHIFT_DEG, random_state=42):
+    """
+    Gera consultas para a destilação a partir do histórico.
+
+    Returns:
+        DataFrame: Consultas do histórico seguidas das geradas (colunas de
+                   QUERY_COLUMNS, 'synthetic' e 'lane', a rota da viagem de
+                   origem de cada ponto, antes do deslocamento)
+    """
+    rng = np.random.default_rng(random_state)
+    historico = historical_data[QUERY_COLUMNS].astype(np.float64).reset_index(drop=True)
+    historico['lane'] = [lane_key(*c) for c in historico[['Lat_Origem', 'Lng_Origem', 'Lat_Destino',
+                                                           'Lng_Destino']].itertuples(index=False)]
+
+    gerados = historico.iloc[rng.integers(0, len(historico), len(historico) * per_trip)].reset_index(drop=True)
+    n = len(gerados)
+    gerados['KM'] = np.maximum(np.round(gerados['KM'] * rng.uniform(0.8, 1.2, n)), 1.0)
+    gerados['Mês'] = rng.integers(1, 13, n).astype(np.float64)
+    gerados['Ano'] = rng.choice(historico['Ano'].unique(), n)
+
+    deslocados = rng.random(n) < shifted_fraction
+    for coluna in ['Lat_Origem', 'Lng_Origem', 'Lat_Destino', 'Lng_Destino']:
+        gerados.loc[deslocados, coluna] += rng.uniform(-max_shift_deg, max_shift_deg, int(deslocados.sum()))
+
+    pontos = pd.concat([historico.assign(synthetic=False), gerados.assign(synthetic=True)], ignore_index=True)
+    pontos['Mês'] = pontos['Mês'].astype(int)
+    return pontos
+
+def enhanced_inputs(queries, store, scaler, features):
+    """
+    Matriz de features padronizada do modelo aprimorado (agregados da feature store).
+
+    Returns:
+        ndarray: Matriz n × n_features
+        DataFrame: Agregados juntados às consultas (ver feature_store.join_features)
+    """
+    agregados = join_features(store, queries)
+    anos = queries['Ano'].to_numpy() if 'Ano' in queries.columns else datetime.now().year
+    X = build_feature_matrix(
+        get_feature_builder(features, scaler), queries['KM'].to_numpy(dtype=np.float64),
+        queries['Mês'].to_numpy(), anos,
+        queries['Lat_Origem'].to_numpy(dtype=np.float64), queries['Lng_Origem'].to_numpy(dtype=np.float64),
+        queries['Lat_Destino'].to_numpy(dtype=np.float64), queries['Lng_Destino'].to_numpy(dtype=np.float64),
+        aggregates={nome: agregados[nome].to_numpy(dtype=np.float64) for nome in AGGREGATE_FEATURES})
+    return X, agregados
+
+def error_bounds(student, teacher):
+    """Erro do aluno em relação ao professor (R$ e relativo)."""
+    erro = np.abs(np.asarray(student) - np.asarray(teacher))
+    relativo = erro / np.maximum(np.abs(teacher), 1.0)
+    return {
+        'mae': round(float(erro.mean()), 3),
+        'p95_abs': round(float(np.percentile(erro, 95)), 3),
+        'max_abs': round(float(erro.max()), 3),
+        'mape': round(float(relativo.mean()), 5),
+        'p95_pct': round(float(np.percentile(relativo, 95)), 5),
+    }
+
+def _single_latency_ms(model, X, repeats=200):
+    """Tempo médio (ms) de uma predição individual."""
+    linha = X[:1]
+    inicio = time.perf_counter()
+    for _ in range(repeats):
+        model.predict(linha)
+    return (time.perf_counter() - inicio) / repeats * 1000
+
+def distill_enhanced_model(historical_data, store, teacher, scaler, features, per_trip=SYNTHETIC_PER_TRIP,
+                           params=None, random_state=42):
+    """
+    Ajusta o aluno às saídas do professor e mede o erro entre os dois.
+
+    Args:
+        historical_data (DataFrame): Histórico (coordenadas, KM, Mês, Ano e 'Frete Carreteiro')
+        store (dict): Feature store usada pelo professor na predição
+        teacher, scaler, features: Modelo aprimorado (ver predict.load_enhanced_model)
+        per_trip (int): Pontos gerados por viagem do histórico
+        params (dict, optional): Hiperparâmetros do aluno (default: STUDENT_PARAMS)
+
+    Returns:
+        GradientBoostingRegressor: Aluno ajustado
+        dict: Relatório (limites de erro, precisão no histórico, tamanho e latência)
+    """
+    inicio = time.perf_counter()
+    pontos = generate_points(historical_data, per_trip=per_trip, random_state=random_state)
+    X, agregados = enhanced_inputs(pontos, store, scaler, features)
+    alvo = teacher.predict(X)
+
+    # Rotas inteiras separadas: os pontos gerados de uma viagem (mesma rota, KM
+    # ±20%) ficam do mesmo lado, e os limites medem rotas que o aluno não viu
+    rotas = pontos['lane'].to_numpy()
+    unicas = np.unique(rotas)
+    separadas = unicas[np.random.default_rng(random_state).random(len(unicas)) < HOLDOUT_FRACTION]
+    separados = np.isin(rotas, separadas)
+    student = GradientBoostingRegressor(**(params or STUDENT_PARAMS))
+    student.fit(X[~separados], alvo[~separados])
+    predicao = student.predict(X)
+
+    historico = ~pontos['synthetic'].to_numpy()
+    real = historical_data['Frete Carreteiro'].to_numpy(dtype=np.float64)
+    niveis = agregados['level'].to_numpy()
+
+    report = {
+        'n_points': int(len(pontos)),
+        'n_synthetic': int(pontos['synthetic'].sum()),
+        'n_holdout_lanes': int(len(separadas)),
+        'holdout_vs_teacher': error_bounds(predicao[separados], alvo[separados]),
+        'holdout_vs_teacher_by_level': {
+            nivel: error_bounds(predicao[separados & (niveis == nivel)], alvo[separados & (niveis == nivel)])
+            for nivel in np.unique(niveis[separados])
+        },
+        'history_mape': {
+            'teacher': round(float(np.mean(np.abs(np.round(alvo[historico] / 5) * 5 - real) / real)), 5),
+            'student': round(float(np.mean(np.abs(np.round(predicao[historico] / 5) * 5 - real) / real)), 5),
+        },
+        'size_bytes': {'teacher': len(pickle.dumps(teacher)), 'student': len(pickle.dumps(student))},
+        'single_latency_ms': {'teacher': round(_single_latency_ms(teacher, X), 3),
+                              'student': round(_single_latency_ms(student, X), 3)},
+        'fit_seconds': round(time.perf_counter() - inicio, 1),
+    }
+    return student, report
+
+def save_student(student, report, features, store, path=STUDENT_MODEL_PATH, metadata_path=STUDENT_METADATA_PATH):
+    """Salva o aluno e os metadados (features, versão da store e relatório da destilação)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    joblib.dump(student, path)
+    metadata = {
+        'model_type': 'GradientBoosting (destilado)',
+        'training_date': datetime.now().isoformat(),
+        'teacher': 'enhanced_gb_model.pkl',
+        'features': list(features),
+        'feature_store_version': store['version'],
+        'params': dict(STUDENT_PARAMS),
+        'distillation': report,
+    }
+    with open(metadata_path, 'w') as f:
+        json.dump(metadata, f, indent=2)
+    print(f"Aluno salvo em: {path}")
+
+def print_report(report):
+    """Exibe o relatório da destilação."""
+    limites = report['holdout_vs_teacher']
+    print(f"Destilação: {report['n_points']} pontos ({report['n_synthetic']} gerados) em {report['fit_seconds']}s")
+    print(f"Erro do aluno vs professor ({report['n_holdout_lanes']} rotas separadas): MAE R$ {limites['mae']:.2f}, "
+          f"p95 R$ {limites['p95_abs']:.2f}, máximo R$ {limites['max_abs']:.2f}, "
+          f"MAPE {limites['mape'] * 100:.2f}% (p95 {limites['p95_pct'] * 100:.2f}%)")
+    for nivel, erro in report['holdout_vs_teacher_by_level'].items():
+        print(f"  nível {nivel}: MAE R$ {erro['mae']:.2f}, p95 R$ {erro['p95_abs']:.2f}")
+    print(f"MAPE no histórico: professor {report['history_mape']['teacher'] * 100:.2f}% | "
+          f"aluno {report['history_mape']['student'] * 100:.2f}%")
+    print(f"Tamanho: {report['size_bytes']['teacher'] / 1e6:.2f} MB → {report['size_bytes']['student'] / 1e6:.2f} MB | "
+          f"predição individual: {report['single_latency_ms']['teacher']:.2f}ms → "
+          f"{report['single_latency_ms']['student']:.2f}ms")
+
+def run_distillation(historical_data, store, path=STUDENT_MODEL_PATH, metadata_path=STUDENT_METADATA_PATH):
+    """
+    Etapa de destilação do treino: carrega o professor, ajusta e salva o aluno.
+
+    Returns:
+        dict: Relatório da destilação
+    """
+    from predict import load_enhanced_model
+
+    teacher, scaler, features, _ = load_enhanced_model('full')
+    student, report = distill_enhanced_model(historical_data, store, teacher, scaler, features)
+    print_report(report)
+    save_student(student, report, features, store, path, metadata_path)
+    return report
+
+def main():
+    """Destila o modelo aprimorado a partir do histórico: python distill.py"""
+    from predict import load_historical_data
+    from feature_store import load_feature_store, build_feature_store, save_feature_store
+
+    historical_data = load_historical_data()
+    store = load_feature_store()
+    if store is None:
+        store = build_feature_store(historical_data)
+        save_feature_store(store)
+    run_distillation(historical_data, store)
+
+if __name__ == "__main__":
+    main()
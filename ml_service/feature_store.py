@@ -0,0 +1,227 @@
+"""
+Módulo de features agregadas (feature store) do modelo aprimorado.
+O modelo aprimorado (enhanced_gb_model.pkl) usa, além das features da
+consulta, agregados do histórico que não podem ser calculados a partir de
+uma única cotação:
+- Route_Mean: frete médio da rota (data_processor.lane_key)
+- Origin_Cluster_Mean / Dest_Cluster_Mean: frete médio do cluster de origem
+  e de destino (células de uma grade de coordenadas ou, opcionalmente, os
+  clusters de clustering.py, incorporados à store)
+- Valor_por_km: R$/km médio da rota (no treino era o da própria viagem)
+
+Os agregados são materializados uma vez a partir do histórico, salvos em
+JSON ao lado do modelo com uma versão (hash do conteúdo) e consultados na
+predição com buscas em dicionário (O(1)). Rotas sem histórico usam o par de
+clusters origem → destino (R$/km médio × KM) e, na falta dele, a média geral.
+"""
+
+import os
+import sys
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from data_processor import lane_key
+from clustering import assign_cluster, assign_clusters
+
+# Caminho da feature store (ao lado do modelo aprimorado)
+FEATURE_STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'enhanced_feature_store.json')
+
+# Tamanho da célula da grade que define os clusters de origem e destino (graus)
+CLUSTER_GRID_DEG = 1.0
+
+# Features agregadas servidas pela store
+AGGREGATE_FEATURES = ['Route_Mean', 'Origin_Cluster_Mean', 'Dest_Cluster_Mean', 'Valor_por_km']
+
+# Confiança das predições do modelo aprimorado pelo nível dos agregados
+LEVEL_CONFIDENCE = {'lane': 0.95, 'cluster_pair': 0.6, 'global': 0.5}
+
+# Colunas de coordenadas que identificam uma rota
+LANE_COLUMNS = ['Lat_Origem', 'Lng_Origem', 'Lat_Destino', 'Lng_Destino']
+
+# Stores carregadas (por caminho), reutilizadas entre predições do mesmo processo
+_loaded_stores = {}
+
+def cluster_key(lat, lng, grid_deg=CLUSTER_GRID_DEG):
+    """Chave do cluster (célula da grade) de um ponto: "i,j"."""
+    return f"{int(np.floor(float(lat) / grid_deg))},{int(np.floor(float(lng) / grid_deg))}"
+
+def _cluster_keys(store, lat_origem, lng_origem, lat_destino, lng_destino):
+    """Chaves dos clusters de origem e de destino de uma rota, conforme o agrupamento da store."""
+    clusters = store.get('clusters')
+    if clusters is None:
+        grid = store['cluster_grid_deg']
+        return cluster_key(lat_origem, lng_origem, grid), cluster_key(lat_destino, lng_destino, grid)
+    return (f"o{assign_cluster(clusters, 'origin', lat_origem, lng_origem)}",
+            f"d{assign_cluster(clusters, 'dest', lat_destino, lng_destino)}")
+
+def _weighted_means(chaves, w, preco, valor_km):
+    """Médias ponderadas de frete e R$/km por chave: chave → [frete, R$/km, peso]."""
+    grupos = pd.DataFrame({'key': chaves, 'w': w, 'wp': w * preco, 'wv': w * valor_km})
+    somas = grupos.groupby('key', sort=True)[['w', 'wp', 'wv']].sum()
+    return {chave: [round(float(linha.wp / linha.w), 4), round(float(linha.wv / linha.w), 6),
+                    round(float(linha.w), 1)]
+            for chave, linha in zip(somas.index, somas.itertuples(index=False))}
+
+def build_feature_store(df, sample_weight=None, grid_deg=CLUSTER_GRID_DEG, clusters=None):
+    """
+    Materializa os agregados de rota e de cluster de um DataFrame histórico.
+
+    Args:
+        df (DataFrame): Dados com coordenadas, 'Frete Carreteiro' e 'Valor_por_km'
+        sample_weight (array, optional): Peso de cada linha
+        grid_deg (float): Tamanho da célula dos clusters (agrupamento por grade)
+        clusters (dict, optional): Clusters de clustering.py, usados no lugar
+            da grade e incorporados à store
+
+    Returns:
+        dict: Store com 'lanes', 'cluster_pairs' (chave → [frete, R$/km, peso]),
+              'origin_clusters', 'dest_clusters', 'global' e 'version'
+    """
+    w = np.ones(len(df)) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+    preco = df['Frete Carreteiro'].to_numpy(dtype=np.float64)
+    valor_km = df['Valor_por_km'].to_numpy(dtype=np.float64)
+
+    # Chaves calculadas uma vez por rota distinta
+    codigos = df.groupby(LANE_COLUMNS, sort=False, observed=True).ngroup().to_numpy()
+    unicos = df[LANE_COLUMNS].drop_duplicates()
+    lanes = np.array([lane_key(*c) for c in unicos.itertuples(index=False)], dtype=object)
+    if clusters is None:
+        origens = np.array([cluster_key(c[0], c[1], grid_deg) for c in unicos.itertuples(index=False)],
+                           dtype=object)
+        destinos = np.array([cluster_key(c[2], c[3], grid_deg) for c in unicos.itertuples(index=False)],
+                            dtype=object)
+    else:
+        origens = np.char.add('o', assign_clusters(clusters, 'origin', unicos['Lat_Origem'],
+                                                   unicos['Lng_Origem'])[0].astype(str)).astype(object)
+        destinos = np.char.add('d', assign_clusters(clusters, 'dest', unicos['Lat_Destino'],
+                                                    unicos['Lng_Destino'])[0].astype(str)).astype(object)
+
+    store = {
+        'cluster_grid_deg': grid_deg,
+        'clusters': clusters,
+        'n_trips': round(float(w.sum()), 1),
+        'global': [round(float(np.average(preco, weights=w)), 4),
+                   round(float(np.average(valor_km, weights=w)), 6), round(float(w.sum()), 1)],
+        'lanes': _weighted_means(lanes[codigos], w, preco, valor_km),
+        'origin_clusters': _weighted_means(origens[codigos], w, preco, valor_km),
+        'dest_clusters': _weighted_means(destinos[codigos], w, preco, valor_km),
+        'cluster_pairs': _weighted_means(origens[codigos] + '>' + destinos[codigos], w, preco, valor_km),
+    }
+    # Versão: hash do conteúdo (mesmo histórico e agrupamento → mesma versão)
+    conteudo = json.dumps(dict(store, clusters=clusters and clusters['version']), sort_keys=True).encode('utf-8')
+    store['version'] = hashlib.sha1(conteudo).hexdigest()[:12]
+    store['created_at'] = datetime.now().isoformat()
+    return store
+
+def save_feature_store(store, path=FEATURE_STORE_PATH):
+    """Salva a store em JSON (escrita atômica) e descarta a versão em memória."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporario = f"{path}.tmp"
+    with open(temporario, 'w') as f:
+        json.dump(store, f, separators=(',', ':'))
+    os.replace(temporario, path)
+    _loaded_stores.pop(path, None)
+    print(f"Feature store salva em: {path} (versão {store['version']}, {len(store['lanes'])} rotas, "
+          f"{len(store['cluster_pairs'])} pares de clusters)")
+
+def load_feature_store(path=FEATURE_STORE_PATH):
+    """
+    Carrega a feature store (uma vez por processo).
+
+    Returns:
+        dict: Store, ou None se ainda não foi gerada
+    """
+    if path not in _loaded_stores:
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as f:
+            _loaded_stores[path] = json.load(f)
+    return _loaded_stores[path]
+
+def lookup_features(store, lat_origem, lng_origem, lat_destino, lng_destino, km):
+    """
+    Agregados de uma consulta (O(1)).
+
+    Returns:
+        dict: Valor de cada feature de AGGREGATE_FEATURES, 'level' ('lane',
+              'cluster_pair' ou 'global'), 'trips' (peso do nível) e 'version'
+    """
+    origem, destino = _cluster_keys(store, lat_origem, lng_origem, lat_destino, lng_destino)
+    global_ = store['global']
+
+    rota = store['lanes'].get(lane_key(lat_origem, lng_origem, lat_destino, lng_destino))
+    if rota is not None:
+        nivel, route_mean, valor_km, viagens = 'lane', rota[0], rota[1], rota[2]
+    else:
+        par = store['cluster_pairs'].get(f"{origem}>{destino}")
+        nivel, base = ('cluster_pair', par) if par is not None else ('global', global_)
+        route_mean, valor_km, viagens = base[1] * float(km), base[1], base[2]
+
+    return {
+        'Route_Mean': route_mean,
+        'Origin_Cluster_Mean': store['origin_clusters'].get(origem, global_)[0],
+        'Dest_Cluster_Mean': store['dest_clusters'].get(destino, global_)[0],
+        'Valor_por_km': valor_km,
+        'level': nivel,
+        'trips': viagens,
+        'version': store['version'],
+    }
+
+def join_features(store, queries):
+    """
+    Versão em lote de lookup_features: junta os agregados às consultas
+    (uma busca por rota distinta).
+
+    Args:
+        queries (DataFrame): Consultas com coordenadas e 'KM'
+
+    Returns:
+        DataFrame: Colunas de AGGREGATE_FEATURES, 'level' e 'trips', alinhadas com queries
+    """
+    queries = queries.reset_index(drop=True)
+    codigos = queries.groupby(LANE_COLUMNS, sort=False).ngroup().to_numpy()
+    unicos = queries[LANE_COLUMNS].drop_duplicates()
+
+    colunas = AGGREGATE_FEATURES + ['level', 'trips']
+    linhas = [lookup_features(store, *c, 1.0) for c in unicos.itertuples(index=False)]
+    agregados = pd.DataFrame([[linha[c] for c in colunas] for linha in linhas], columns=colunas).iloc[codigos]
+    agregados = agregados.reset_index(drop=True)
+
+    # Fora do nível de rota, Route_Mean é o R$/km do nível × KM da consulta
+    escala = np.where(agregados['level'] == 'lane', 1.0, queries['KM'].to_numpy(dtype=np.float64))
+    agregados['Route_Mean'] = agregados['Route_Mean'] * escala
+    return agregados
+
+def main():
+    """
+    Gera a store a partir do histórico ou consulta uma rota:
+    python feature_store.py build [--clusters]   (--clusters: usa os clusters de clustering.py)
+    python feature_store.py origem_lat origem_lng destino_lat destino_lng km
+    """
+    if len(sys.argv) >= 2 and sys.argv[1] == 'build':
+        from predict import load_historical_data
+        from clustering import load_clusters, CLUSTERS_PATH
+
+        clusters = None
+        if '--clusters' in sys.argv:
+            clusters = load_clusters()
+            if clusters is None:
+                print(f"Clusters não encontrados em {CLUSTERS_PATH} (execute: python clustering.py fit)")
+                return
+        save_feature_store(build_feature_store(load_historical_data(), clusters=clusters))
+        return
+
+    if len(sys.argv) < 6:
+        print("Uso: python feature_store.py build | origem_lat origem_lng destino_lat destino_lng km")
+        return
+
+    store = load_feature_store()
+    if store is None:
+        print(f"Feature store não encontrada em {FEATURE_STORE_PATH} (execute: python feature_store.py build)")
+        return
+    print(json.dumps(lookup_features(store, *[float(v) for v in sys.argv[1:6]]), indent=2))
+
+if __name__ == "__main__":
+    main()
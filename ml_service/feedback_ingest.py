@@ -0,0 +1,281 @@
+"""
+Módulo de ingestão de feedback para o treino do sistema de fretes.
+Lê exportações locais (JSONL, um documento por linha) das coleções
+ml_feedback, ml_training_samples e ml_feedback_negative e converte os
+preços informados pelos usuários em amostras de treino ponderadas.
+
+O arquivo é processado em lotes: cada lote é normalizado com
+pd.json_normalize, validado com máscaras vetorizadas e deduplicado contra o
+histórico e contra os lotes anteriores (mesma rota, preço e data). Linhas
+rejeitadas são gravadas com o motivo em um arquivo de rejeitos (JSONL).
+"""
+
+import os
+import sys
+import json
+import argparse
+import itertools
+import numpy as np
+import pandas as pd
+
+# Documentos por lote
+FEEDBACK_BATCH_SIZE = 10_000
+
+# Peso padrão de cada amostra de feedback no treino (uma viagem do histórico = 1)
+FEEDBACK_SAMPLE_WEIGHT = 1.0
+
+# Faixa aceita de R$/km em relação aos percentis 1 e 99 do histórico
+VALUE_PER_KM_TOLERANCE = 3.0
+
+# Distância máxima aceita (km)
+MAX_KM = 5000
+
+# Campos de cada documento exportado (alternativas em ordem de prioridade)
+FEEDBACK_FIELDS = {
+    'price': ['userSuggestedPrice', 'driverPayment'],
+    'km': ['metadata.distance', 'totalDistance'],
+    'lat_origem': ['metadata.originLat', 'originLat'],
+    'lng_origem': ['metadata.originLng', 'originLng'],
+    'lat_destino': ['metadata.destLat', 'destLat'],
+    'lng_destino': ['metadata.destLng', 'destLng'],
+    'month': ['metadata.month', 'month'],
+    'created_at': ['createdAt'],
+    'doc_id': ['id', '_id'],
+}
+
+# Colunas das amostras geradas (mesmas do treino)
+SAMPLE_COLUMNS = ['KM', 'Mês', 'Trimestre', 'Ano', 'Lat_Origem', 'Lng_Origem', 'Lat_Destino',
+                  'Lng_Destino', 'Valor_por_km', 'Frete Carreteiro']
+
+def iter_feedback_batches(path, batch_size=FEEDBACK_BATCH_SIZE):
+    """
+    Lê a exportação em lotes de linhas.
+
+    Yields:
+        list: Tuplas (número da linha, texto da linha) do lote
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        linhas = ((i, linha.strip()) for i, linha in enumerate(f, start=1))
+        linhas = ((i, linha) for i, linha in linhas if linha)
+        while True:
+            lote = list(itertools.islice(linhas, batch_size))
+            if not lote:
+                return
+            yield lote
+
+def _first_present(frame, campos):
+    """Primeira coluna não nula entre as alternativas de um campo."""
+    valores = pd.Series(np.nan, index=frame.index, dtype=object)
+    for campo in reversed(campos):
+        if campo in frame.columns:
+            valores = frame[campo].where(frame[campo].notna(), valores)
+    return valores
+
+def normalize_feedback(docs):
+    """
+    Converte documentos de feedback em colunas numéricas (vetorizado).
+
+    Args:
+        docs (list): Documentos exportados (dicts)
+
+    Returns:
+        DataFrame: Colunas 'price', 'km', coordenadas, 'month', 'date' e 'doc_id'
+    """
+    bruto = pd.json_normalize(docs)
+    frame = pd.DataFrame(index=bruto.index)
+    for nome, campos in FEEDBACK_FIELDS.items():
+        frame[nome] = _first_present(bruto, campos)
+
+    for nome in ['price', 'km', 'lat_origem', 'lng_origem', 'lat_destino', 'lng_destino', 'month']:
+        frame[nome] = pd.to_numeric(frame[nome], errors='coerce')
+    frame['date'] = pd.to_datetime(frame['created_at'], errors='coerce', utc=True).dt.tz_localize(None)
+    # Mês da cotação quando informado, senão o mês do registro
+    frame['month'] = frame['month'].fillna(frame['date'].dt.month)
+    return frame.drop(columns='created_at')
+
+def history_bounds(historical_data):
+    """Faixa plausível de R$/km, a partir dos percentis do histórico."""
+    valor_km = historical_data['Frete Carreteiro'] / historical_data['KM']
+    p1, p99 = np.nanpercentile(valor_km, [1, 99])
+    return p1 / VALUE_PER_KM_TOLERANCE, p99 * VALUE_PER_KM_TOLERANCE
+
+def validate_feedback(frame, bounds):
+    """
+    Valida as linhas normalizadas (máscaras vetorizadas).
+
+    Args:
+        frame (DataFrame): Saída de normalize_feedback
+        bounds (tuple): Faixa de R$/km aceita (ver history_bounds)
+
+    Returns:
+        Series: Motivo da rejeição de cada linha ('' para linhas válidas)
+    """
+    coordenadas = frame[['lat_origem', 'lng_origem', 'lat_destino', 'lng_destino']]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        valor_km = frame['price'] / frame['km']
+
+    regras = [
+        (frame['price'].isna(), 'sem preço sugerido'),
+        (frame['price'] <= 0, 'preço não positivo'),
+        (frame['km'].isna() | (frame['km'] <= 0) | (frame['km'] > MAX_KM), 'distância inválida'),
+        (coordenadas.isna().any(axis=1), 'sem coordenadas'),
+        ((frame['lat_origem'].abs() > 90) | (frame['lat_destino'].abs() > 90) |
+         (frame['lng_origem'].abs() > 180) | (frame['lng_destino'].abs() > 180) |
+         (coordenadas == 0).all(axis=1), 'coordenadas inválidas'),
+        (frame['date'].isna(), 'data inválida'),
+        (~frame['month'].between(1, 12), 'mês inválido'),
+        ((valor_km < bounds[0]) | (valor_km > bounds[1]), 'R$/km fora da faixa do histórico'),
+    ]
+    return pd.Series(np.select([mascara.to_numpy() for mascara, _ in regras],
+                               [motivo for _, motivo in regras], default=''),
+                     index=frame.index)
+
+def trip_keys(lat_origem, lng_origem, lat_destino, lng_destino, price, date):
+    """
+    Chaves de deduplicação de viagens: rota canônica (coordenadas com 4 casas,
+    como data_processor.lane_key), preço e dia.
+
+    Returns:
+        MultiIndex: Uma chave por viagem
+    """
+    return pd.MultiIndex.from_arrays([
+        np.round(np.asarray(lat_origem, dtype=np.float64), 4),
+        np.round(np.asarray(lng_origem, dtype=np.float64), 4),
+        np.round(np.asarray(lat_destino, dtype=np.float64), 4),
+        np.round(np.asarray(lng_destino, dtype=np.float64), 4),
+        np.round(np.asarray(price, dtype=np.float64), 2),
+        pd.DatetimeIndex(date).normalize(),
+    ])
+
+def history_trip_keys(historical_data):
+    """Chaves de deduplicação das viagens do histórico (ver trip_keys)."""
+    return trip_keys(historical_data['Lat_Origem'], historical_data['Lng_Origem'],
+                     historical_data['Lat_Destino'], historical_data['Lng_Destino'],
+                     historical_data['Frete Carreteiro'],
+                     pd.to_datetime(historical_data['Data Saída'], dayfirst=True))
+
+def to_training_samples(frame, weight=FEEDBACK_SAMPLE_WEIGHT):
+    """Converte linhas válidas nas colunas de treino (ver train.build_features)."""
+    mes = frame['month'].astype(np.int64).to_numpy()
+    return pd.DataFrame({
+        'KM': frame['km'].to_numpy(),
+        'Mês': mes,
+        'Trimestre': (mes - 1) // 3 + 1,
+        'Ano': frame['date'].dt.year.to_numpy(),
+        'Lat_Origem': frame['lat_origem'].to_numpy(),
+        'Lng_Origem': frame['lng_origem'].to_numpy(),
+        'Lat_Destino': frame['lat_destino'].to_numpy(),
+        'Lng_Destino': frame['lng_destino'].to_numpy(),
+        'Valor_por_km': (frame['price'] / frame['km']).to_numpy(),
+        'Frete Carreteiro': frame['price'].to_numpy(),
+        'sample_weight': np.full(len(frame), float(weight)),
+    })
+
+def ingest_feedback(path, historical_data, weight=FEEDBACK_SAMPLE_WEIGHT,
+                    batch_size=FEEDBACK_BATCH_SIZE, reject_path=None):
+    """
+    Converte uma exportação de feedback em amostras de treino ponderadas.
+
+    Args:
+        path (str): Exportação JSONL (um documento por linha)
+        historical_data (DataFrame): Histórico de treino (ver train.load_data)
+        weight (float): Peso de cada amostra de feedback
+        batch_size (int): Documentos por lote
+        reject_path (str, optional): Arquivo de rejeitos (default: <path>.rejects.jsonl)
+
+    Returns:
+        DataFrame: Amostras com as colunas de treino e 'sample_weight'
+        dict: Estatísticas da ingestão (lidas, aceitas, rejeitadas por motivo)
+    """
+    reject_path = reject_path or f"{os.path.splitext(path)[0]}.rejects.jsonl"
+    bounds = history_bounds(historical_data)
+    vistas = history_trip_keys(historical_data).unique()
+    ids_vistos = set()
+
+    amostras, motivos = [], {}
+    lidas = 0
+    with open(reject_path, 'w', encoding='utf-8') as rejeitos:
+        def rejeita(linha, texto, motivo, documento=None):
+            motivos[motivo] = motivos.get(motivo, 0) + 1
+            rejeitos.write(json.dumps({'line': linha, 'reason': motivo,
+                                       'record': documento if documento is not None else texto},
+                                      ensure_ascii=False) + '\n')
+
+        for lote in iter_feedback_batches(path, batch_size):
+            lidas += len(lote)
+            linhas, docs = [], []
+            for numero, texto in lote:
+                try:
+                    documento = json.loads(texto)
+                except json.JSONDecodeError:
+                    rejeita(numero, texto, 'JSON inválido')
+                    continue
+                if not isinstance(documento, dict):
+                    rejeita(numero, texto, 'JSON inválido')
+                    continue
+                linhas.append(numero)
+                docs.append(documento)
+            if not docs:
+                continue
+
+            frame = normalize_feedback(docs)
+            motivo = validate_feedback(frame, bounds)
+
+            # Documentos repetidos na exportação (mesmo id)
+            ids = frame['doc_id'].astype(str).where(frame['doc_id'].notna())
+            repetido_id = ids.notna() & (ids.isin(ids_vistos) | ids.duplicated())
+            motivo = motivo.where((motivo != '') | ~repetido_id, 'documento repetido')
+
+            # Viagens já presentes no histórico, em lotes anteriores ou no próprio lote
+            validas = motivo == ''
+            chaves = trip_keys(frame['lat_origem'], frame['lng_origem'], frame['lat_destino'],
+                               frame['lng_destino'], frame['price'], frame['date'])
+            duplicada = validas.to_numpy() & (chaves.isin(vistas) | chaves.duplicated())
+            motivo = motivo.where(~duplicada, 'viagem duplicada')
+
+            aceitas = (motivo == '').to_numpy()
+            vistas = vistas.append(chaves[aceitas]).unique()
+            ids_vistos.update(ids[aceitas & ids.notna().to_numpy()])
+
+            for i in np.nonzero(~aceitas)[0]:
+                rejeita(linhas[i], None, motivo.iloc[i], docs[i])
+            if aceitas.any():
+                amostras.append(to_training_samples(frame[aceitas], weight))
+
+    resultado = (pd.concat(amostras, ignore_index=True) if amostras
+                 else to_training_samples(normalize_feedback([{}]).iloc[:0], weight))
+    stats = {
+        'read': int(lidas),
+        'accepted': int(len(resultado)),
+        'rejected': int(sum(motivos.values())),
+        'reject_reasons': motivos,
+        'reject_path': reject_path,
+        'weight': float(weight),
+    }
+    print(f"Feedback: {stats['accepted']} amostras aceitas de {stats['read']} documentos "
+          f"({stats['rejected']} rejeitados em {reject_path})")
+    for motivo, quantidade in sorted(motivos.items(), key=lambda item: -item[1]):
+        print(f"  {motivo}: {quantidade}")
+    return resultado, stats
+
+def main():
+    """Valida uma exportação de feedback sem treinar: python feedback_ingest.py export.jsonl"""
+    from train import load_data
+
+    parser = argparse.ArgumentParser(description="Ingestão de feedback exportado (JSONL)")
+    parser.add_argument('path', help="Exportação JSONL das coleções de feedback")
+    parser.add_argument('--weight', type=float, default=FEEDBACK_SAMPLE_WEIGHT,
+                        help="Peso de cada amostra de feedback")
+    parser.add_argument('--rejects', default=None, help="Arquivo de rejeitos")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        print(f"Arquivo não encontrado: {args.path}")
+        sys.exit(1)
+
+    amostras, _ = ingest_feedback(args.path, load_data(), weight=args.weight, reject_path=args.rejects)
+    if len(amostras):
+        print(amostras[SAMPLE_COLUMNS].describe().T[['mean', 'min', 'max']])
+
+if __name__ == "__main__":
+    main()
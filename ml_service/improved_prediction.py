@@ -11,9 +11,42 @@ import numpy as np
 import json
 from datetime import datetime
 from predict import load_historical_data, load_model_and_scaler
-from data_processor import find_similar_routes, prepare_data_for_model
+from data_processor import distance_band_stats, get_feature_builder, build_feature_row
+from similarity_index import summarize_similar_routes, matches_to_frame
+from seasonality import load_seasonality_table, seasonal_factor
+from nearest_lanes import nearest_lane_stats
+from residual_correction import load_residual_table, correction_factor, apply_correction, RESIDUALS_PATH
+from prediction_intervals import load_quantile_models, prediction_interval, QUANTILE_MODELS_PATH
 
 def predict_with_high_confidence(origem_lat, origem_lng, destino_lat, destino_lng, km, mes=None):
+    """
+    Realiza predição de frete com foco em alta confiança e aplica a correção
+    residual aprendida com o feedback da rota no mês (ver residual_correction.py).
+
+    Args:
+        origem_lat, origem_lng, destino_lat, destino_lng (float): Coordenadas da rota
+        km (float): Distância em km
+        mes (int, optional): Mês da cotação (1-12)
+
+    Returns:
+        dict: Resultado da predição com detalhes
+    """
+    if mes is None:
+        mes = datetime.now().month
+    resultado = _predict_uncorrected(origem_lat, origem_lng, destino_lat, destino_lng, km, mes)
+    if resultado.get("error", False):
+        return resultado
+
+    correcao = correction_factor(load_residual_table(RESIDUALS_PATH), float(origem_lat), float(origem_lng),
+                                 float(destino_lat), float(destino_lng), mes)
+    if correcao['factor'] != 1.0:
+        resultado["details"]["uncorrected_prediction"] = resultado["prediction"]
+        resultado["details"]["residual_factor"] = correcao['factor']
+        resultado["details"]["residual_events"] = correcao['events']
+        resultado["prediction"] = float(apply_correction(resultado["prediction"], correcao['factor']))
+    return resultado
+
+def _predict_uncorrected(origem_lat, origem_lng, destino_lat, destino_lng, km, mes=None):
     """
     Realiza predição de frete com foco em alta confiança.
     Esta função aprimorada busca garantir maior precisão mesmo 
@@ -50,24 +83,25 @@ def predict_with_high_confidence(origem_lat, origem_lng, destino_lat, destino_ln
         
         # Primeiro método: busca por rotas geograficamente similares
         # Prioridade máxima (conforme solicitado pelo cliente)
-        rotas_similares = find_similar_routes(
-            origem_lat, origem_lng, destino_lat, destino_lng,
-            historical_data, radius_km=50  # Raio fixo de 50km
+        # Modo top-k: agregados em uma passada e apenas as 3 rotas mais similares
+        resumo = summarize_similar_routes(
+            historical_data, origem_lat, origem_lng, destino_lat, destino_lng,
+            radius_km=50, k=3  # Raio fixo de 50km
         )
+        num_rotas_similares = resumo['num_routes']
         
-        if not rotas_similares.empty and len(rotas_similares) >= 5:
+        # Fator sazonal do mês (tabela gerada no treino): os preços históricos
+        # misturam todos os meses e são ajustados para o mês da cotação
+        sazonal = seasonal_factor(load_seasonality_table(), origem_lat, origem_lng,
+                                  destino_lat, destino_lng, mes)
+        
+        if num_rotas_similares >= 5:
             # Temos rotas similares suficientes para confiança alta
-            # Calcula pesos com base na similaridade
-            pesos = rotas_similares['similarity_score'] / rotas_similares['similarity_score'].sum()
-            
-            # Calcula preço com média ponderada
-            preco_geo = (rotas_similares['Frete Carreteiro'] * pesos).sum()
-            
-            # Arredonda para múltiplo de 5
-            preco_geo_final = round(preco_geo / 5) * 5
+            # Preço com média ponderada pela similaridade, arredondado para múltiplo de 5
+            preco_geo_final = round(resumo['weighted_price'] * sazonal['factor'] / 5) * 5
             
             # Calcula confiança
-            score_medio = rotas_similares['similarity_score'].mean()
+            score_medio = resumo['avg_similarity']
             confianca_geo = min((score_medio / 100) * 1.25, 0.99)  # Máximo 99%
             
             return {
@@ -76,55 +110,37 @@ def predict_with_high_confidence(origem_lat, origem_lng, destino_lat, destino_ln
                 "confidence": float(confianca_geo),
                 "confidence_pct": round(confianca_geo * 100, 1),
                 "method": "geographic_coordinates",
-                "message": f"Predição baseada em {len(rotas_similares)} rotas similares",
+                "message": f"Predição baseada em {num_rotas_similares} rotas similares",
                 "details": {
-                    "num_routes": len(rotas_similares),
+                    "num_routes": num_rotas_similares,
                     "avg_similarity": float(score_medio),
-                    "similar_routes": rotas_similares.head(3).to_dict('records')
+                    "seasonal_factor": sazonal['factor'],
+                    "seasonal_level": sazonal['level'],
+                    "similar_routes": matches_to_frame(historical_data, resumo['top']).to_dict('records')
                 }
             }
         
         # Se temos algumas rotas similares, mas não suficientes para confiança alta
         # Usamos um método híbrido que combina coordenadas com o modelo ML
-        if not rotas_similares.empty:
+        if num_rotas_similares > 0:
             # Extrai valor_por_km médio das rotas similares para melhorar a predição
-            valor_km_medio = rotas_similares['Frete Carreteiro'].sum() / rotas_similares['KM'].sum()
-            
-            # Prepara dados para o modelo ML usando informações das rotas similares
-            input_data = {
-                'KM': km,
-                'Mês': mes,
-                'Trimestre': ((mes - 1) // 3) + 1,
-                'Ano': datetime.now().year,
-                'Lat_Origem': origem_lat,
-                'Lng_Origem': origem_lng,
-                'Lat_Destino': destino_lat,
-                'Lng_Destino': destino_lng,
-                'Valor_por_km': valor_km_medio  # Valor real das rotas similares
-            }
-            
-            # Cria DataFrame para o modelo
-            df_input = pd.DataFrame([input_data])
+            valor_km_medio = resumo['price_sum'] / resumo['km_sum']
             
-            # Garante que todas as features necessárias estão presentes
-            for feature in features:
-                if feature not in df_input.columns:
-                    df_input[feature] = 0
+            # Vetor de features padronizado, com o Valor_por_km real das rotas similares
+            X_scaled = build_feature_row(get_feature_builder(features, scaler), km, mes, datetime.now().year,
+                                         origem_lat, origem_lng, destino_lat, destino_lng,
+                                         valor_por_km=valor_km_medio)
             
-            # Preparação e escalamento
-            X = prepare_data_for_model(df_input, features)
-            X_scaled = scaler.transform(X)
-            
-            # Previsão do modelo ML
+            # Previsão do modelo ML e intervalo de predição (confiança do modelo na rota)
             prediction_ml = model.predict(X_scaled)[0]
+            quantis = load_quantile_models(model, features, QUANTILE_MODELS_PATH)
+            intervalo_ml = prediction_interval(model, X_scaled, [prediction_ml], quantis)
             
             # Arredonda para múltiplo de 5
             prediction_ml_rounded = round(prediction_ml / 5) * 5
             
             # Combina as predições com prioridade para geografia (75% geo, 25% ML)
-            pesos = rotas_similares['similarity_score'] / rotas_similares['similarity_score'].sum()
-            preco_geo = (rotas_similares['Frete Carreteiro'] * pesos).sum()
-            preco_geo_rounded = round(preco_geo / 5) * 5
+            preco_geo_rounded = round(resumo['weighted_price'] * sazonal['factor'] / 5) * 5
             
             # Define pesos para combinar os métodos
             peso_geo = 0.75  # 75% para geografia
@@ -135,47 +151,91 @@ def predict_with_high_confidence(origem_lat, origem_lng, destino_lat, destino_ln
             preco_final_rounded = round(preco_final / 5) * 5
             
             # Calcula confiança combinada
-            score_medio = rotas_similares['similarity_score'].mean()
+            score_medio = resumo['avg_similarity']
             confianca_geo = min(score_medio / 100, 0.95)
-            confianca_ml = 0.85  # Confiança base do modelo ML
+            # Sem intervalo disponível, usa a confiança base do modelo ML
+            confianca_ml = 0.85 if intervalo_ml is None else float(intervalo_ml['confidence'][0])
             
             confianca_final = (confianca_geo * peso_geo) + (confianca_ml * peso_ml)
             
+            detalhes = {
+                "geographic_prediction": float(preco_geo_rounded),
+                "ml_prediction": float(prediction_ml_rounded),
+                "ml_confidence": confianca_ml,
+                "num_routes": num_rotas_similares,
+                "avg_similarity": float(score_medio),
+                "seasonal_factor": sazonal['factor'],
+                "seasonal_level": sazonal['level'],
+                "similar_routes": matches_to_frame(historical_data, resumo['top']).to_dict('records')
+            }
+            if intervalo_ml is not None:
+                detalhes["ml_interval"] = [round(float(intervalo_ml['lower'][0]), 2),
+                                           round(float(intervalo_ml['upper'][0]), 2)]
+            
             return {
                 "error": False,
                 "prediction": float(preco_final_rounded),
                 "confidence": float(confianca_final),
                 "confidence_pct": round(confianca_final * 100, 1),
                 "method": "geographic_priority",
-                "message": f"Predição combinada com prioridade geográfica (baseada em {len(rotas_similares)} rotas similares)",
+                "message": f"Predição combinada com prioridade geográfica (baseada em {num_rotas_similares} rotas similares)",
+                "details": detalhes
+            }
+        
+        # Sem rotas no raio de 50km: usamos as rotas vizinhas mais próximas
+        # (k-nearest no espaço origem+destino, com raio máximo limitado),
+        # combinadas com o modelo ML
+        vizinhas = nearest_lane_stats(historical_data, origem_lat, origem_lng,
+                                      destino_lat, destino_lng, km)
+        
+        if vizinhas['num_lanes'][0] > 0:
+            X_scaled = build_feature_row(get_feature_builder(features, scaler), km, mes, datetime.now().year,
+                                         origem_lat, origem_lng, destino_lat, destino_lng, valor_por_km=0.0)
+            prediction_ml_rounded = round(model.predict(X_scaled)[0] / 5) * 5
+            
+            preco_vizinhas = float(vizinhas['prediction'][0]) * sazonal['factor']
+            preco_final = round((preco_vizinhas * 0.5 + prediction_ml_rounded * 0.5) / 5) * 5
+            
+            # Confiança dada pela vizinhança (quantidade de viagens e proximidade)
+            confianca = float(vizinhas['confidence'][0])
+            num_vizinhas = int(vizinhas['num_lanes'][0])
+            
+            return {
+                "error": False,
+                "prediction": float(preco_final),
+                "confidence": confianca,
+                "confidence_pct": round(confianca * 100, 1),
+                "method": "nearest_lanes",
+                "message": f"Predição baseada nas {num_vizinhas} rotas mais próximas e modelo ML",
                 "details": {
-                    "geographic_prediction": float(preco_geo_rounded),
+                    "nearest_lanes_prediction": float(round(preco_vizinhas / 5) * 5),
                     "ml_prediction": float(prediction_ml_rounded),
-                    "num_routes": len(rotas_similares),
-                    "avg_similarity": float(score_medio),
-                    "similar_routes": rotas_similares.head(3).to_dict('records')
+                    "nearest_lanes": num_vizinhas,
+                    "nearest_lanes_trips": int(vizinhas['num_trips'][0]),
+                    "nearest_distance_km": round(float(vizinhas['nearest_distance'][0]), 1),
+                    "seasonal_factor": sazonal['factor'],
+                    "seasonal_level": sazonal['level']
                 }
             }
         
-        # Se não temos rotas similares, verificamos se os dados históricos têm 
-        # rotas com distâncias similares - este é um padrão que pode ajudar
-        df_distancia_similar = historical_data[
-            (historical_data['KM'] >= 0.9 * km) & 
-            (historical_data['KM'] <= 1.1 * km)
-        ]
+        # Se não há rotas vizinhas, verificamos se os dados históricos têm 
+        # rotas com distâncias similares (0.9·km a 1.1·km) - este é um padrão que pode ajudar
+        # O índice ordenado por KM fornece contagem, média e desvio em O(1)
+        faixa = distance_band_stats(historical_data, km)
+        num_rotas_distancia = int(faixa['count'])
         
-        if len(df_distancia_similar) >= 5:
+        if num_rotas_distancia >= 5:
             # Baseamos a predição na distância similar
-            preco_medio = df_distancia_similar['Frete Carreteiro'].mean()
-            preco_por_km = df_distancia_similar['Valor_por_km'].mean()
+            preco_medio = float(faixa['mean']) * sazonal['factor']
+            preco_por_km = float(faixa['value_per_km_mean'])
             
             # Arredonda para múltiplo de 5
             preco_final = round(preco_medio / 5) * 5
             
             # Calcula confiança baseada no número de rotas com distância similar
             # e na dispersão dos preços
-            num_rotas = len(df_distancia_similar)
-            std_precos = df_distancia_similar['Frete Carreteiro'].std()
+            num_rotas = num_rotas_distancia
+            std_precos = float(faixa['std'])
             cv = std_precos / preco_medio  # Coeficiente de variação
             
             # Confiança inversamente proporcional à variação dos preços
@@ -196,7 +256,9 @@ def predict_with_high_confidence(origem_lat, origem_lng, destino_lat, destino_ln
                     "num_similar_distance_routes": num_rotas,
                     "avg_price": float(preco_medio),
                     "price_per_km": float(preco_por_km),
-                    "price_variation": float(cv)
+                    "price_variation": float(cv),
+                    "seasonal_factor": sazonal['factor'],
+                    "seasonal_level": sazonal['level']
                 }
             }
         
@@ -209,8 +271,8 @@ def predict_with_high_confidence(origem_lat, origem_lng, destino_lat, destino_ln
             "confidence": 0,
             "method": "insufficient_data",
             "details": {
-                "similar_routes_found": len(rotas_similares) if not rotas_similares.empty else 0,
-                "similar_distance_routes_found": len(df_distancia_similar)
+                "similar_routes_found": num_rotas_similares,
+                "similar_distance_routes_found": num_rotas_distancia
             }
         }
         
@@ -0,0 +1,151 @@
+"""
+Módulo de rotas vizinhas (k-nearest lanes) do sistema de fretes.
+Quando nenhuma rota do histórico está a menos de 50km da origem e do destino,
+a predição usa as k rotas mais próximas no espaço combinado origem+destino.
+
+As rotas são projetadas em km (projeção equiretangular centrada no histórico)
+como pontos 4D (x/y da origem, x/y do destino) e indexadas em uma KDTree.
+A distância entre uma consulta e uma rota é sqrt(d_origem² + d_destino²).
+A busca dos k vizinhos amplia o raio progressivamente dentro de uma única
+travessia da árvore, com custo limitado independentemente da distância.
+O preço é a média dos preços das rotas vizinhas, ponderada pelo inverso da
+distância, com cada preço ajustado ao KM da consulta por (km / km_rota)^0.3
+(o frete cresce menos que proporcionalmente à distância).
+"""
+
+import numpy as np
+from sklearn.neighbors import KDTree
+from similarity_index import EARTH_RADIUS_KM, get_similarity_index, cached_for_frame
+
+# Quantidade de rotas vizinhas usadas na estimativa
+KNN_NEIGHBORS = 5
+
+# Distância combinada máxima (km) de uma rota vizinha
+KNN_MAX_DISTANCE_KM = 300.0
+
+# Deslocamento (km) da ponderação 1 / (d + deslocamento)
+KNN_DISTANCE_OFFSET_KM = 10.0
+
+# Elasticidade do preço em relação ao KM no ajuste de cada vizinha
+# (leave-lane-out no histórico: MAPE 19.8% com 0.3, 36.7% com R$/km puro)
+KNN_KM_ELASTICITY = 0.3
+
+def _project(lat, lng, lat_ref):
+    """Projeção equiretangular em km (x = leste, y = norte)."""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lng = np.radians(np.asarray(lng, dtype=np.float64))
+    return lng * np.cos(np.radians(lat_ref)) * EARTH_RADIUS_KM, lat * EARTH_RADIUS_KM
+
+def _lane_points(lat_ref, lat_origem, lng_origem, lat_destino, lng_destino):
+    """Pontos 4D (km) de rotas ou consultas."""
+    xo, yo = _project(lat_origem, lng_origem, lat_ref)
+    xd, yd = _project(lat_destino, lng_destino, lat_ref)
+    return np.column_stack([np.ravel(xo), np.ravel(yo), np.ravel(xd), np.ravel(yd)])
+
+def build_lane_tree(historical_data):
+    """
+    Constrói a KDTree das rotas do histórico (usa os agregados do índice de similaridade).
+
+    Returns:
+        dict: Árvore, latitude de referência da projeção e agregados por rota
+    """
+    index = get_similarity_index(historical_data)
+    origens = index['origin_points'][index['lane_origin']]
+    destinos = index['destination_points'][index['lane_destination']]
+    lat_ref = float(np.mean(np.concatenate([origens[:, 0], destinos[:, 0]]))) if len(origens) else 0.0
+
+    pontos = _lane_points(lat_ref, origens[:, 0], origens[:, 1], destinos[:, 0], destinos[:, 1])
+    return {
+        'tree': KDTree(pontos) if len(pontos) else None,
+        'lat_ref': lat_ref,
+        'count': index['lane_count'],
+        'price_sum': index['lane_price_sum'],
+        'km_sum': index['lane_km_sum'],
+        'row_lane': index['row_lane'],
+    }
+
+def get_lane_tree(historical_data):
+    """Retorna a KDTree de rotas do DataFrame histórico (construída uma única vez)."""
+    return cached_for_frame(historical_data, 'lane_tree', build_lane_tree)
+
+def nearest_lane_stats(historical_data, lat_origem, lng_origem, lat_destino, lng_destino, km,
+                       k=KNN_NEIGHBORS, max_distance_km=KNN_MAX_DISTANCE_KM, exclude=None):
+    """
+    Estimativa pelas k rotas mais próximas no espaço origem+destino.
+    Aceita escalares ou arrays (lote de consultas).
+
+    Args:
+        historical_data (DataFrame): DataFrame com os dados históricos
+        lat_origem, lng_origem, lat_destino, lng_destino: Coordenadas da(s) consulta(s)
+        km: Distância(s) da(s) consulta(s)
+        k (int): Quantidade de rotas vizinhas
+        max_distance_km (float): Distância combinada máxima de uma vizinha
+        exclude (dict, optional): Viagem a excluir de cada consulta (leave-one-out),
+            com arrays 'row' (linha do histórico, -1 para nenhuma), 'price' e 'km'
+
+    Returns:
+        dict: Arrays 'num_lanes', 'num_trips', 'distance' (média ponderada, km),
+              'nearest_distance', 'prediction' (não arredondada, NaN sem
+              vizinhas) e 'confidence'
+    """
+    km = np.atleast_1d(np.asarray(km, dtype=np.float64))
+    n = len(km)
+    resultado = {
+        'num_lanes': np.zeros(n, dtype=np.int64),
+        'num_trips': np.zeros(n),
+        'distance': np.full(n, np.nan),
+        'nearest_distance': np.full(n, np.nan),
+        'prediction': np.full(n, np.nan),
+        'confidence': np.zeros(n),
+    }
+
+    arvore = get_lane_tree(historical_data)
+    if arvore['tree'] is None or n == 0:
+        return resultado
+
+    pontos = _lane_points(arvore['lat_ref'], lat_origem, lng_origem, lat_destino, lng_destino)
+    pontos = np.broadcast_to(pontos, (n, 4)) if len(pontos) == 1 else pontos
+
+    # Uma vizinha extra quando a própria rota da consulta pode ficar vazia
+    n_rotas = len(arvore['count'])
+    k_busca = min(k + (exclude is not None), n_rotas)
+    distancias, rotas = arvore['tree'].query(pontos, k=k_busca)
+
+    count = arvore['count'][rotas]
+    price_sum = arvore['price_sum'][rotas]
+    km_sum = arvore['km_sum'][rotas]
+
+    if exclude is not None:
+        linhas = np.asarray(exclude['row'])
+        propria = np.where(linhas >= 0, arvore['row_lane'][np.maximum(linhas, 0)], -1)
+        mesma = rotas == propria[:, None]
+        count = count - mesma
+        price_sum = price_sum - mesma * np.asarray(exclude['price'], dtype=np.float64)[:, None]
+        km_sum = km_sum - mesma * np.asarray(exclude['km'], dtype=np.float64)[:, None]
+
+    # Vizinhas válidas: com viagens e dentro da distância máxima, até k por consulta
+    validas = (count > 0) & (distancias <= max_distance_km)
+    validas &= np.cumsum(validas, axis=1) <= k
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        peso = validas / (distancias + KNN_DISTANCE_OFFSET_KM)
+        # Preço médio de cada vizinha ajustado ao KM da consulta
+        preco = np.where(validas, price_sum / count * (km[:, None] * count / km_sum) ** KNN_KM_ELASTICITY, 0.0)
+        peso_total = peso.sum(axis=1)
+
+        resultado['num_lanes'] = validas.sum(axis=1)
+        resultado['num_trips'] = (count * validas).sum(axis=1).astype(np.float64)
+        resultado['distance'] = (peso * distancias).sum(axis=1) / peso_total
+        resultado['nearest_distance'] = np.where(validas, distancias, np.inf).min(axis=1)
+        estimativa = (peso * preco).sum(axis=1) / peso_total
+
+    tem = resultado['num_lanes'] > 0
+    resultado['nearest_distance'][~tem] = np.nan
+    resultado['prediction'] = np.where(tem, estimativa, np.nan)
+
+    # Confiança: viagens das vizinhas (satura em 10) e proximidade (1 na mesma
+    # rota, 0 na distância máxima), limitada a 80% (abaixo da busca por similaridade)
+    proximidade = np.clip(1 - resultado['distance'] / max_distance_km, 0.0, 1.0)
+    confianca = (np.minimum(resultado['num_trips'] / 10, 1.0) * 0.4 + proximidade * 0.6) * 0.8
+    resultado['confidence'] = np.where(tem, confianca, 0.0)
+    return resultado
@@ -0,0 +1,193 @@
+"""
+Módulo de predição em lote com múltiplos processos (reprecificação em massa).
+As consultas são divididas em fatias e distribuídas em um pool de processos;
+cada processo aplica batch_predict.predict_batch à sua fatia.
+
+O histórico é colocado uma única vez em memória compartilhada
+(multiprocessing.shared_memory): os processos montam o DataFrame como visão
+sobre o mesmo buffer, sem receber cópias serializadas. O modelo, o scaler e as
+tabelas de sazonalidade e de correção residual são lidos por cada processo
+uma vez, direto dos arquivos em models/. As bibliotecas BLAS/OpenMP de cada
+processo são limitadas a threads_per_worker threads para evitar disputa de
+núcleos.
+"""
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+
+# Consultas por fatia enviada a um processo
+SHARD_SIZE = 5_000
+
+# Variáveis de ambiente das bibliotecas de threads (aplicadas aos processos filhos)
+THREAD_ENV_VARS = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'NUMEXPR_NUM_THREADS']
+
+# Componentes de predição de cada processo
+_worker_state = {}
+
+def share_frame(df):
+    """
+    Copia as colunas numéricas do DataFrame para um bloco de memória compartilhada.
+
+    Returns:
+        SharedMemory: Bloco criado (o chamador deve fechar e remover com unlink)
+        dict: Descrição do bloco (nome, linhas e deslocamento/dtype de cada coluna)
+    """
+    colunas = [c for c in df.columns if pd.api.types.is_numeric_dtype(df[c])]
+    arrays = {c: np.ascontiguousarray(df[c].to_numpy()) for c in colunas}
+
+    layout, deslocamento = [], 0
+    for coluna, array in arrays.items():
+        # Alinha cada coluna em 64 bytes
+        deslocamento = (deslocamento + 63) // 64 * 64
+        layout.append((coluna, array.dtype.str, deslocamento))
+        deslocamento += array.nbytes
+
+    shm = shared_memory.SharedMemory(create=True, size=max(deslocamento, 1))
+    for (coluna, dtype, inicio), array in zip(layout, arrays.values()):
+        np.ndarray(len(df), dtype=dtype, buffer=shm.buf, offset=inicio)[:] = array
+
+    return shm, {'name': shm.name, 'rows': len(df), 'columns': layout}
+
+def attach_frame(spec):
+    """
+    Monta um DataFrame somente leitura sobre o bloco compartilhado (sem copiar).
+
+    Returns:
+        SharedMemory: Bloco anexado (deve permanecer aberto enquanto o DataFrame for usado)
+        DataFrame: Visão das colunas compartilhadas
+    """
+    # Processos 'spawn' usam o mesmo resource_tracker do processo principal,
+    # que remove o bloco (unlink) ao final de predict_batch_parallel
+    shm = shared_memory.SharedMemory(name=spec['name'])
+
+    colunas = {}
+    for coluna, dtype, inicio in spec['columns']:
+        array = np.ndarray(spec['rows'], dtype=dtype, buffer=shm.buf, offset=inicio)
+        array.flags.writeable = False
+        colunas[coluna] = array
+    return shm, pd.DataFrame(colunas, copy=False)
+
+def _init_worker(spec, threads_per_worker):
+    """Anexa o histórico compartilhado e carrega modelo e sazonalidade (uma vez por processo)."""
+    from threadpoolctl import threadpool_limits
+    from predict import load_model_and_scaler
+    from seasonality import load_seasonality_table
+    from residual_correction import load_residual_table
+
+    threadpool_limits(limits=threads_per_worker)
+    shm, historical_data = attach_frame(spec)
+    model, scaler, features, _ = load_model_and_scaler()
+    _worker_state.update({
+        'shm': shm,
+        'historical_data': historical_data,
+        'model': model,
+        'scaler': scaler,
+        'features': features,
+        'seasonality': load_seasonality_table(),
+        'residuals': load_residual_table(),
+    })
+
+def _predict_shard(shard):
+    """Prediz uma fatia de consultas no processo atual."""
+    from batch_predict import predict_batch
+
+    estado = _worker_state
+    resultados = predict_batch(shard['queries'], estado['historical_data'], estado['model'],
+                               estado['scaler'], estado['features'], radius_km=shard['radius_km'],
+                               seasonality=estado['seasonality'], residuals=estado['residuals'])
+    return shard['start'], resultados
+
+def predict_batch_parallel(queries, historical_data, workers=None, threads_per_worker=1,
+                           shard_size=SHARD_SIZE, radius_km=50):
+    """
+    Prediz um lote grande de consultas em paralelo (mesmo resultado de
+    batch_predict.predict_batch com o modelo, a sazonalidade e a correção
+    residual de models/).
+
+    Args:
+        queries (DataFrame): Rotas (ver batch_predict.predict_batch)
+        historical_data (DataFrame): DataFrame com os dados históricos
+        workers (int, optional): Processos (default: número de núcleos)
+        threads_per_worker (int): Limite de threads BLAS/OpenMP por processo
+        shard_size (int): Consultas por fatia
+        radius_km (float): Raio em km para busca (default: 50)
+
+    Returns:
+        dict: DataFrames por método, alinhados com as linhas de queries
+    """
+    workers = workers or os.cpu_count()
+    queries = queries.reset_index(drop=True)
+    fatias = [{'start': i, 'queries': queries.iloc[i:i + shard_size], 'radius_km': radius_km}
+              for i in range(0, len(queries), shard_size)]
+
+    # Processos iniciados com 'spawn' herdam os limites de threads pelo ambiente
+    ambiente = {var: os.environ.get(var) for var in THREAD_ENV_VARS}
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(threads_per_worker)
+
+    inicio = time.perf_counter()
+    shm, spec = share_frame(historical_data)
+    try:
+        partes = []
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker, initargs=(spec, threads_per_worker)) as executor:
+            for start, resultado in executor.map(_predict_shard, fatias):
+                partes.append((start, resultado))
+    finally:
+        shm.close()
+        shm.unlink()
+        for var, valor in ambiente.items():
+            if valor is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = valor
+
+    partes.sort(key=lambda parte: parte[0])
+    metodos = partes[0][1].keys() if partes else []
+    resultados = {metodo: pd.concat([parte[metodo] for _, parte in partes], ignore_index=True)
+                  for metodo in metodos}
+
+    duracao = time.perf_counter() - inicio
+    print(f"Predição paralela: {len(queries)} consultas em {len(fatias)} fatias, {workers} processo(s) "
+          f"× {threads_per_worker} thread(s) em {duracao:.2f}s ({len(queries) / max(duracao, 1e-9):.0f} consultas/s)")
+    return resultados
+
+def main():
+    """
+    Reprecificação em massa a partir de um CSV de consultas:
+    python parallel_batch.py consultas.csv saida.csv [--workers N] [--threads T] [--pipeline standard]
+    O CSV deve ter as colunas Lat_Origem, Lng_Origem, Lat_Destino, Lng_Destino, KM e Mês.
+    """
+    from predict import load_historical_data
+
+    parser = argparse.ArgumentParser(description="Predição de fretes em lote com múltiplos processos")
+    parser.add_argument('input', help="CSV com as consultas")
+    parser.add_argument('output', help="CSV de saída")
+    parser.add_argument('--workers', type=int, default=None, help="Processos (default: núcleos)")
+    parser.add_argument('--threads', type=int, default=1, help="Threads BLAS/OpenMP por processo")
+    parser.add_argument('--shard-size', type=int, default=SHARD_SIZE, help="Consultas por fatia")
+    parser.add_argument('--pipeline', default='standard', choices=['standard', 'high_confidence'],
+                        help="Pipeline de predição")
+    args = parser.parse_args()
+
+    queries = pd.read_csv(args.input)
+    faltando = {'Lat_Origem', 'Lng_Origem', 'Lat_Destino', 'Lng_Destino', 'KM', 'Mês'} - set(queries.columns)
+    if faltando:
+        print(f"Colunas ausentes no CSV de entrada: {', '.join(sorted(faltando))}")
+        sys.exit(1)
+
+    resultados = predict_batch_parallel(queries, load_historical_data(), workers=args.workers,
+                                        threads_per_worker=args.threads, shard_size=args.shard_size)
+    saida = pd.concat([queries.reset_index(drop=True), resultados[args.pipeline]], axis=1)
+    saida.to_csv(args.output, index=False)
+    print(f"Resultados salvos em: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -9,18 +9,48 @@ import sys
 import pandas as pd
 import numpy as np
 import json
+import struct
+import contextlib
 from datetime import datetime
 from joblib import load
 from sklearn.ensemble import RandomForestRegressor
-from data_processor import find_similar_routes, prepare_data_for_model, explain_prediction
+from data_processor import (explain_prediction, compact_historical_frame, frame_memory_report,
+                            get_feature_builder, build_feature_row)
+from similarity_index import summarize_similar_routes, matches_to_frame
+from seasonality import load_seasonality_table, seasonal_factor
+from residual_correction import load_residual_table, correction_factor, apply_correction, RESIDUALS_PATH
+from price_surface import load_price_surface, lookup_surface_price
+from nearest_lanes import nearest_lane_stats
+from feature_store import load_feature_store, lookup_features, LEVEL_CONFIDENCE
+from distill import STUDENT_MODEL_PATH, STUDENT_METADATA_PATH
+from staged_inference import is_staged_model, get_staged_model, register_costs, stages_for_budget, predict_staged
+from prediction_intervals import (load_quantile_models, prediction_interval, interval_models,
+                                  quantile_models_for_budget, DEFAULT_MODEL_CONFIDENCE, QUANTILE_MODELS_PATH)
+
+try:
+    import msgpack
+except ImportError:  # formato 'msgpack' indisponível: usa JSON com o mesmo enquadramento
+    msgpack = None
 
 # Configuração de caminhos
 MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
 MODEL_PATH = os.path.join(MODEL_DIR, 'gb_model.pkl')
 SCALER_PATH = os.path.join(MODEL_DIR, 'gb_scaler.pkl')
 METADATA_PATH = os.path.join(MODEL_DIR, 'gb_model_metadata.json')
+ENHANCED_MODEL_PATH = os.path.join(MODEL_DIR, 'enhanced_gb_model.pkl')
+ENHANCED_SCALER_PATH = os.path.join(MODEL_DIR, 'enhanced_gb_scaler.pkl')
+ENHANCED_METADATA_PATH = os.path.join(MODEL_DIR, 'enhanced_gb_model_metadata.json')
 HISTORICAL_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'attached_assets', 'Libro3_utf8.csv')
 
+# Modelos aprimorados carregados por nível (uma vez por processo)
+_enhanced_models = {}
+
+# Campos de nível superior da resposta do modo arquivo JSON
+RESPONSE_FIELDS = ['success', 'recommendedPrice', 'confidence', 'explanation', 'method', 'details']
+
+# Formatos de saída do modo arquivo JSON (ver encode_response)
+OUTPUT_FORMATS = ['json', 'framed', 'msgpack']
+
 # Cache para dados históricos (carregado sob demanda)
 _historical_data = None
 
@@ -55,9 +85,14 @@ def load_historical_data():
         
         # Adiciona R$ por km
         df['Valor_por_km'] = df['Frete Carreteiro'] / df['KM']
-        
-        print(f"Dados históricos carregados: {len(df)} registros")
-        return df
+
+        # Converte para tipos compactos e descarta as colunas de texto já processadas
+        compacto = compact_historical_frame(df)
+        memoria = frame_memory_report(df, compacto)
+
+        print(f"Dados históricos carregados: {len(compacto)} registros "
+              f"({memoria['bytes_per_row_before']} → {memoria['bytes_per_row_after']} bytes/linha)")
+        return compacto
     except Exception as e:
         print(f"Erro ao carregar dados históricos: {e}")
         raise ValueError("Impossível continuar sem dados históricos")
@@ -81,13 +116,51 @@ def load_model_and_scaler():
         
         features = metadata.get('features', [])
         
+        # Custos da inferência em estágios medidos no treino (orçamento de latência)
+        register_costs(model, metadata.get('staged_inference_costs'))
+        
         print(f"Modelo '{metadata.get('model_type')}' carregado com sucesso")
         return model, scaler, features, metadata
     except Exception as e:
         print(f"Erro ao carregar modelo: {e}")
         raise ValueError(f"Impossível continuar sem o modelo ML: {str(e)}")
 
-def get_most_similar_price(lat_origem, lng_origem, lat_destino, lng_destino, historical_data, radius_km=50):
+def load_enhanced_model(tier='fast', store_version=None):
+    """
+    Carrega o modelo aprimorado (features agregadas da feature store) uma vez por processo.
+    
+    Args:
+        tier (str): 'fast' usa o modelo destilado (distill.py) quando disponível;
+            'full' usa o RandomForest original
+        store_version (str, optional): Versão da feature store da predição; um
+            modelo destilado com outra versão da store (ex.: treino sem --distill)
+            não é usado e a predição cai para o nível 'full'
+    
+    Returns:
+        tuple: (modelo, scaler, features, metadata); metadata['tier'] indica o nível carregado
+    
+    Raises:
+        ValueError: Se o modelo não puder ser carregado
+    """
+    if tier == 'fast' and not os.path.exists(STUDENT_MODEL_PATH):
+        tier = 'full'
+    if tier not in _enhanced_models:
+        try:
+            caminho_modelo, caminho_metadados = ((STUDENT_MODEL_PATH, STUDENT_METADATA_PATH) if tier == 'fast'
+                                                 else (ENHANCED_MODEL_PATH, ENHANCED_METADATA_PATH))
+            with open(caminho_metadados, 'r') as file:
+                metadata = dict(json.load(file), tier=tier)
+            _enhanced_models[tier] = (load(caminho_modelo), load(ENHANCED_SCALER_PATH),
+                                      metadata.get('features', []), metadata)
+        except Exception as e:
+            raise ValueError(f"Impossível carregar o modelo aprimorado: {str(e)}")
+    if (tier == 'fast' and store_version is not None
+            and _enhanced_models[tier][3].get('feature_store_version') != store_version):
+        return load_enhanced_model('full')
+    return _enhanced_models[tier]
+
+def get_most_similar_price(lat_origem, lng_origem, lat_destino, lng_destino, historical_data, radius_km=50,
+                           summary=None, seasonal=None, include_records=True):
     """
     Obtém o preço mais similar com base nas coordenadas, usando ponderação avançada
     que prioriza a localização geográfica sobre a distância.
@@ -99,52 +172,52 @@ def get_most_similar_price(lat_origem, lng_origem, lat_destino, lng_destino, his
         lng_destino (float): Longitude do destino
         historical_data (DataFrame): DataFrame com os dados históricos
         radius_km (int): Raio em km para busca (default: 50)
+        summary (dict, optional): Resultado de summarize_similar_routes já calculado
+        seasonal (dict, optional): Fator sazonal do mês (ver seasonality.seasonal_factor)
+        include_records (bool): Inclui os registros das rotas mais similares ('similar_routes')
         
     Returns:
         float: Preço recomendado
         dict: Detalhes da recomendação
     """
     # Encontra rotas em um raio de 50km (valor fixo conforme solicitado)
-    rotas_similares = find_similar_routes(
-        lat_origem, lng_origem, lat_destino, lng_destino, 
-        historical_data, radius_km=radius_km
-    )
+    # Modo top-k: agregados em uma passada e apenas as 5 rotas mais similares
+    if summary is None:
+        summary = summarize_similar_routes(
+            historical_data, lat_origem, lng_origem, lat_destino, lng_destino,
+            radius_km=radius_km, k=5
+        )
     
-    if rotas_similares.empty:
+    if summary['num_routes'] == 0:
         return None, {"confidence": 0, "num_routes": 0}
     
     # Pesos ponderados pela similaridade - quanto mais similar, mais peso
-    pesos = rotas_similares['similarity_score'] / rotas_similares['similarity_score'].sum()
-    preco_recomendado = (rotas_similares['Frete Carreteiro'] * pesos).sum()
+    # Confiança: número de rotas (saturando em 10+) e score médio (máximo 100)
+    num_rotas = summary['num_routes']
+    score_medio = summary['avg_similarity']
+    confianca = summary['confidence']
     
-    # Calcula confiança baseada no número de rotas e scores
-    num_rotas = len(rotas_similares)
-    score_medio = rotas_similares['similarity_score'].mean()
-    
-    # Fatores de confiança:
-    # 1. Número de rotas (mais é melhor)
-    # 2. Score médio (mais alto é melhor)
-    confianca_n_rotas = min(num_rotas / 10, 1.0)  # Saturando em 10+ rotas
-    confianca_score = score_medio / 100  # Score máximo é 100
-    
-    # Confiança geral (média ponderada)
-    confianca = (confianca_n_rotas * 0.4) + (confianca_score * 0.6)
-    confianca = min(confianca, 1.0)  # Limita a 100%
+    # Ajuste sazonal: o histórico mistura todos os meses
+    fator = 1.0 if seasonal is None else seasonal['factor']
     
     # Arredonda para o múltiplo de 5 mais próximo
-    preco_recomendado = round(preco_recomendado / 5) * 5
+    preco_recomendado = round(summary['weighted_price'] * fator / 5) * 5
     
-    return preco_recomendado, {
+    detalhes = {
         "confidence": confianca,
         "confidence_pct": round(confianca * 100, 1),
         "num_routes": num_rotas,
         "avg_similarity": round(score_medio, 1),
         "price_basis": "similar_routes",
+        "seasonal_factor": fator,
         "message": f"Preço baseado em {num_rotas} rota(s) similar(es) num raio de {radius_km}km",
-        "similar_routes": rotas_similares.head(5).to_dict('records')
     }
+    if include_records:
+        detalhes["similar_routes"] = matches_to_frame(historical_data, summary['top']).to_dict('records')
+    return preco_recomendado, detalhes
 
-def predict_freight_price(origem_lat, origem_lng, destino_lat, destino_lng, km, mes=None, **kwargs):
+def predict_freight_price(origem_lat, origem_lng, destino_lat, destino_lng, km, mes=None,
+                          explain=True, include_similar_routes=True, latency_budget_ms=None, **kwargs):
     """
     Prediz o preço de frete para uma determinada rota usando um sistema de ML natural.
     Prioriza coordenadas geográficas e considera um raio de 50km ao redor dos pontos.
@@ -156,6 +229,11 @@ def predict_freight_price(origem_lat, origem_lng, destino_lat, destino_lng, km,
         destino_lng (float): Longitude do destino
         km (float): Distância em km
         mes (int, optional): Mês da cotação (1-12). Se None, usa o mês atual.
+        explain (bool): Gera a explicação em linguagem natural ('message');
+            se False, 'message' traz apenas o resumo do método
+        include_similar_routes (bool): Inclui os registros das rotas similares nos detalhes
+        latency_budget_ms (float, optional): Orçamento de latência do modelo; para um
+            GradientBoosting, usa apenas os estágios que cabem nele (ver staged_inference)
         **kwargs: Argumentos adicionais
         
     Returns:
@@ -186,61 +264,75 @@ def predict_freight_price(origem_lat, origem_lng, destino_lat, destino_lng, km,
         model, scaler, features, metadata = load_model_and_scaler()
         
         # Busca por rotas similares - ABORDAGEM PRINCIPAL
-        rotas_similares = find_similar_routes(
-            origem_lat, origem_lng, destino_lat, destino_lng, 
-            historical_data, radius_km=50
+        resumo_similares = summarize_similar_routes(
+            historical_data, origem_lat, origem_lng, destino_lat, destino_lng,
+            radius_km=50, k=5
         )
         
-        # Prepara dados para o modelo ML
+        # Fator sazonal do mês (tabela gerada no treino, consulta O(1))
+        sazonal = seasonal_factor(load_seasonality_table(), origem_lat, origem_lng,
+                                  destino_lat, destino_lng, mes)
+        
+        # Vetor de features já padronizado, na ordem dos metadados do modelo
+        # (Valor_por_km = 0: é calculado após a predição)
+        X_scaled = build_feature_row(get_feature_builder(features, scaler), km, mes, datetime.now().year,
+                                     origem_lat, origem_lng, destino_lat, destino_lng, valor_por_km=0.0)
+        
+        # Faz a predição (com orçamento de latência, apenas os primeiros estágios do
+        # GradientBoosting; o orçamento inclui os modelos de quantis do intervalo)
+        quantis = load_quantile_models(model, features, QUANTILE_MODELS_PATH)
+        estagios = None
+        intervalo_omitido = False
+        if latency_budget_ms is not None and is_staged_model(model):
+            compilado = get_staged_model(model)
+            # Orçamento pequeno demais para o intervalo: responde sem ele
+            orcados = quantile_models_for_budget(model, quantis, latency_budget_ms)
+            intervalo_omitido = quantis is not None and orcados is None
+            quantis = orcados
+            estagios = stages_for_budget(compilado, latency_budget_ms,
+                                         n_models=1 + interval_models(model, quantis))
+            prediction = predict_staged(compilado, X_scaled, estagios)[0]
+        else:
+            prediction = model.predict(X_scaled)[0]
+        
+        # Arredonda para múltiplo de 5 mais próximo
+        prediction_rounded = round(prediction / 5) * 5
+        
+        # Intervalo de predição do modelo e confiança derivada dele (padrão sem intervalo)
+        intervalo = prediction_interval(model, X_scaled, [prediction], quantis, n_stages=estagios)
+        model_confidence = (DEFAULT_MODEL_CONFIDENCE if intervalo is None
+                            else float(intervalo['confidence'][0]))
+        
+        # Dados de entrada (para a explicação), com o Valor_por_km da predição
         input_data = {
             'KM': km,
             'Mês': mes,
-            'Trimestre': ((mes - 1) // 3) + 1,
-            'Ano': datetime.now().year,
             'Lat_Origem': origem_lat,
             'Lng_Origem': origem_lng,
             'Lat_Destino': destino_lat,
             'Lng_Destino': destino_lng,
-            'Valor_por_km': 0  # Será calculado após a predição
+            'Valor_por_km': prediction_rounded / km
         }
         
-        # Cria DataFrame com dados de entrada
-        df_input = pd.DataFrame([input_data])
-        
-        # Garante que todas as features necessárias estão presentes
-        for feature in features:
-            if feature not in df_input.columns:
-                df_input[feature] = 0
-        
-        # Prepara dados para o modelo
-        X = prepare_data_for_model(df_input, features)
-        
-        # Escala os dados
-        X_scaled = scaler.transform(X)
-        
-        # Faz a predição
-        prediction = model.predict(X_scaled)[0]
-        
-        # Arredonda para múltiplo de 5 mais próximo
-        prediction_rounded = round(prediction / 5) * 5
-        
-        # Calcula Valor_por_km
-        df_input['Valor_por_km'] = prediction_rounded / km
+        # Sem rotas no raio de 50km: busca as rotas vizinhas mais próximas
+        # (k-nearest no espaço origem+destino, com raio máximo limitado)
+        vizinhas = None
+        if resumo_similares['num_routes'] == 0:
+            vizinhas = nearest_lane_stats(historical_data, origem_lat, origem_lng,
+                                          destino_lat, destino_lng, km)
         
         # Se encontrou rotas similares, combina os resultados para maior precisão
-        if not rotas_similares.empty:
+        if resumo_similares['num_routes'] > 0:
             # Calcula recomendação baseada em rotas similares
             recommended_price, route_details = get_most_similar_price(
                 origem_lat, origem_lng, destino_lat, destino_lng, 
-                historical_data, radius_km=50
+                historical_data, radius_km=50, summary=resumo_similares, seasonal=sazonal,
+                include_records=include_similar_routes
             )
             
             # Avalia a diferença entre as duas previsões
             diff_pct = abs(prediction_rounded - recommended_price) / max(prediction_rounded, recommended_price)
             
-            # Determina a confiança do modelo
-            model_confidence = 0.95  # Confiança padrão do modelo treinado
-            
             # Média ponderada das confianças - prioriza coordenadas geográficas
             confidence_geo = route_details["confidence"]
             
@@ -275,30 +367,80 @@ def predict_freight_price(origem_lat, origem_lng, destino_lat, destino_lng, km,
                 "similarity_confidence": confidence_geo,
                 "model_prediction": float(prediction_rounded),
                 "similarity_prediction": float(recommended_price),
+                "seasonal_factor": sazonal['factor'],
+                "seasonal_level": sazonal['level'],
                 "difference_pct": round(diff_pct * 100, 1),
-                "similar_routes": route_details.get("similar_routes", []),
                 "num_routes": route_details.get("num_routes", 0),
                 "price_source": source,
                 "message": f"Predição baseada em {route_details.get('num_routes', 0)} rota(s) similar(es) e modelo ML"
             }
+            if include_similar_routes:
+                combined_details["similar_routes"] = route_details.get("similar_routes", [])
+        elif vizinhas['num_lanes'][0] > 0:
+            # Sem rotas no raio de 50km: estimativa pelas rotas vizinhas, combinada com o modelo
+            preco_vizinhas = float(vizinhas['prediction'][0]) * sazonal['factor']
+            preco_vizinhas_rounded = round(preco_vizinhas / 5) * 5
+            final_prediction = round((preco_vizinhas * 0.5 + prediction_rounded * 0.5) / 5) * 5
+            # Confiança dada pela vizinhança (quantidade de viagens e proximidade)
+            final_confidence = float(vizinhas['confidence'][0])
+            method = "nearest_lanes"
+            source = "nearest_lanes"
+            
+            combined_details = {
+                "confidence": final_confidence,
+                "confidence_pct": round(final_confidence * 100, 1),
+                "model_prediction": float(prediction_rounded),
+                "nearest_lanes_prediction": float(preco_vizinhas_rounded),
+                "nearest_lanes": int(vizinhas['num_lanes'][0]),
+                "nearest_lanes_trips": int(vizinhas['num_trips'][0]),
+                "nearest_distance_km": round(float(vizinhas['nearest_distance'][0]), 1),
+                "seasonal_factor": sazonal['factor'],
+                "num_routes": 0,
+                "price_source": source,
+                "message": (f"Predição baseada nas {int(vizinhas['num_lanes'][0])} rota(s) mais próxima(s) "
+                            f"(a {vizinhas['nearest_distance'][0]:.0f}km) e modelo ML")
+            }
         else:
-            # Usando apenas o modelo ML quando não há rotas similares
+            # Usando apenas o modelo ML quando não há rotas similares nem vizinhas
             final_prediction = prediction_rounded
-            final_confidence = 0.95  # Confiança padrão do modelo treinado
+            final_confidence = model_confidence
             method = "ml_model"
             source = "ml_model"
             
             combined_details = {
                 "confidence": final_confidence,
                 "confidence_pct": round(final_confidence * 100, 1),
+                "model_confidence": model_confidence,
                 "model_prediction": float(prediction_rounded),
                 "num_routes": 0,
                 "price_source": source,
                 "message": "Predição baseada no modelo ML"
             }
         
-        # Gera explicação natural para a predição
-        explain_text = explain_prediction(final_prediction, combined_details, df_input)
+        if intervalo is not None:
+            combined_details["model_interval"] = [round(float(intervalo['lower'][0]), 2),
+                                                  round(float(intervalo['upper'][0]), 2)]
+            combined_details["model_interval_source"] = intervalo['source']
+        if intervalo_omitido:
+            combined_details["model_interval_skipped"] = "latency_budget"
+        if estagios is not None:
+            combined_details["model_stages"] = estagios
+            combined_details["model_stages_total"] = compilado['n_stages']
+        
+        # Correção residual aprendida com o feedback da rota no mês (sem retreino)
+        correcao = correction_factor(load_residual_table(RESIDUALS_PATH), origem_lat, origem_lng,
+                                     destino_lat, destino_lng, mes)
+        if correcao['factor'] != 1.0:
+            combined_details["uncorrected_prediction"] = float(final_prediction)
+            combined_details["residual_factor"] = correcao['factor']
+            combined_details["residual_events"] = correcao['events']
+            final_prediction = float(apply_correction(final_prediction, correcao['factor']))
+        
+        # Gera explicação natural para a predição (somente quando solicitada)
+        if explain:
+            explain_text = explain_prediction(final_prediction, combined_details, input_data)
+        else:
+            explain_text = combined_details["message"]
         
         return {
             "error": False,
@@ -319,6 +461,192 @@ def predict_freight_price(origem_lat, origem_lng, destino_lat, destino_lng, km,
             "confidence": 0
         }
 
+def predict_enhanced_price(origem_lat, origem_lng, destino_lat, destino_lng, km, mes=None, store=None,
+                           tier='fast'):
+    """
+    Prediz o preço de frete com o modelo aprimorado. As features agregadas
+    (Route_Mean, médias dos clusters e R$/km da rota) vêm da feature store,
+    sem consultar o histórico.
+
+    Args:
+        origem_lat, origem_lng, destino_lat, destino_lng (float): Coordenadas da rota
+        km (float): Distância em km
+        mes (int, optional): Mês da cotação (1-12). Se None, usa o mês atual.
+        store (dict, optional): Feature store (default: a salva em models/)
+        tier (str): 'fast' (modelo destilado, quando disponível) ou 'full' (ver load_enhanced_model)
+
+    Returns:
+        dict: Dicionário com a predição e detalhes (mesmo formato de predict_freight_price)
+    """
+    try:
+        origem_lat, origem_lng = float(origem_lat), float(origem_lng)
+        destino_lat, destino_lng, km = float(destino_lat), float(destino_lng), float(km)
+    except (ValueError, TypeError) as e:
+        return {"error": True, "message": f"Erro de conversão de dados: {str(e)}",
+                "prediction": None, "confidence": 0}
+    mes = datetime.now().month if mes is None else int(mes)
+
+    try:
+        store = load_feature_store() if store is None else store
+        if store is None:
+            raise ValueError("Feature store não encontrada (execute: python feature_store.py build)")
+        model, scaler, features, metadata = load_enhanced_model(tier, store['version'])
+
+        agregados = lookup_features(store, origem_lat, origem_lng, destino_lat, destino_lng, km)
+        X_scaled = build_feature_row(get_feature_builder(features, scaler), km, mes, datetime.now().year,
+                                     origem_lat, origem_lng, destino_lat, destino_lng, aggregates=agregados)
+        prediction = round(model.predict(X_scaled)[0] / 5) * 5
+        confianca = LEVEL_CONFIDENCE[agregados['level']]
+
+        detalhes = {
+            "confidence": confianca,
+            "confidence_pct": round(confianca * 100, 1),
+            "route_mean": round(float(agregados['Route_Mean']), 2),
+            "feature_level": agregados['level'],
+            "feature_trips": agregados['trips'],
+            "feature_store_version": agregados['version'],
+            "model_tier": metadata['tier'],
+            "price_source": "enhanced_model",
+            "message": f"Predição do modelo aprimorado (agregados de nível '{agregados['level']}')",
+        }
+
+        correcao = correction_factor(load_residual_table(RESIDUALS_PATH), origem_lat, origem_lng,
+                                     destino_lat, destino_lng, mes)
+        if correcao['factor'] != 1.0:
+            detalhes["uncorrected_prediction"] = float(prediction)
+            detalhes["residual_factor"] = correcao['factor']
+            detalhes["residual_events"] = correcao['events']
+            prediction = float(apply_correction(prediction, correcao['factor']))
+
+        return {
+            "error": False,
+            "prediction": float(prediction),
+            "confidence": float(confianca),
+            "confidence_pct": round(confianca * 100, 1),
+            "message": detalhes["message"],
+            "details": detalhes,
+            "method": "enhanced_model"
+        }
+    except Exception as e:
+        return {"error": True, "message": f"Erro durante a predição: {str(e)}",
+                "prediction": None, "confidence": 0}
+
+def select_response_fields(server_result, fields=None, include_similar_routes=True):
+    """
+    Reduz a resposta do servidor aos campos solicitados.
+    'success' e 'error' são sempre mantidos.
+
+    Args:
+        server_result (dict): Resposta completa
+        fields (list, optional): Campos de nível superior (default: todos)
+        include_similar_routes (bool): Mantém details.similar_routes
+
+    Returns:
+        dict: Resposta reduzida
+    """
+    if fields is not None:
+        server_result = {chave: valor for chave, valor in server_result.items()
+                         if chave in fields or chave in ('success', 'error')}
+    if not include_similar_routes and 'similar_routes' in server_result.get('details', {}):
+        server_result = dict(server_result, details={chave: valor for chave, valor in server_result['details'].items()
+                                                     if chave != 'similar_routes'})
+    return server_result
+
+def encode_response(server_result, output='json'):
+    """
+    Serializa a resposta no formato de saída solicitado.
+    - 'json': uma linha JSON (formato original, lido pela última linha da saída)
+    - 'framed': cabeçalho de 5 bytes (tipo b'J' + tamanho uint32 big-endian) e o JSON
+    - 'msgpack': mesmo cabeçalho com tipo b'M' e o payload em MessagePack
+      (usa 'framed' com JSON quando o pacote msgpack não está instalado)
+
+    Returns:
+        bytes: Resposta serializada
+    """
+    if output == 'json':
+        return (json.dumps(server_result) + '\n').encode('utf-8')
+
+    if output == 'msgpack' and msgpack is not None:
+        tipo, payload = b'M', msgpack.packb(server_result, use_bin_type=True)
+    else:
+        tipo, payload = b'J', json.dumps(server_result, separators=(',', ':')).encode('utf-8')
+    return tipo + struct.pack('>I', len(payload)) + payload
+
+def write_response(server_result, output='json'):
+    """Escreve a resposta serializada na saída padrão."""
+    sys.stdout.flush()
+    sys.stdout.buffer.write(encode_response(server_result, output))
+    sys.stdout.buffer.flush()
+
+def respond_json_request(input_data):
+    """
+    Atende uma requisição do modo arquivo JSON.
+    Campos opcionais além dos dados da rota:
+    - fields: campos da resposta (ex.: ["recommendedPrice", "confidence"]);
+      a explicação só é gerada quando "explanation" é solicitado
+    - includeSimilarRoutes: inclui details.similar_routes (default: apenas sem 'fields')
+    - precision: "coarse" para responder pela superfície de preços
+    - model: "enhanced" para usar o modelo aprimorado (feature store)
+    - tier: "full" para usar o modelo aprimorado original em vez do destilado
+    - latencyBudgetMs: orçamento de latência do modelo (estágios do GradientBoosting
+      reportados em details.model_stages)
+
+    Returns:
+        dict: Resposta no formato do servidor (antes da seleção de campos)
+    """
+    fields = input_data.get('fields')
+    explicar = fields is None or 'explanation' in fields
+    incluir_rotas = bool(input_data.get('includeSimilarRoutes', fields is None))
+
+    # Extrai as coordenadas e parâmetros essenciais
+    origem_lat = float(input_data.get('originLat', 0))
+    origem_lng = float(input_data.get('originLng', 0))
+    destino_lat = float(input_data.get('destLat', 0))
+    destino_lng = float(input_data.get('destLng', 0))
+    km = float(input_data.get('totalDistance', 0))
+    mes = int(input_data.get('month', datetime.now().month))
+    
+    # Cotação aproximada: responde pela superfície de preços pré-calculada
+    # (sem carregar histórico e modelo) quando a rota está coberta
+    if input_data.get('precision') == 'coarse':
+        celula = lookup_surface_price(load_price_surface(), origem_lat, origem_lng,
+                                      destino_lat, destino_lng, mes)
+        if celula is not None:
+            return {
+                "success": True,
+                "recommendedPrice": celula['prediction'],
+                "confidence": round(celula['confidence'] * 100, 1),
+                "explanation": (f"Cotação aproximada pela superfície de preços "
+                                f"(células de {celula['grid_deg']}°)"),
+                "method": celula['method'],
+                "details": dict(celula, price_source="price_surface")
+            }
+    
+    # Realiza a predição (a explicação usa a rota mais similar, então os
+    # registros são montados sempre que a explicação é solicitada)
+    if input_data.get('model') == 'enhanced':
+        resultado = predict_enhanced_price(origem_lat, origem_lng, destino_lat, destino_lng, km, mes,
+                                           tier=input_data.get('tier', 'fast'))
+    else:
+        orcamento = input_data.get('latencyBudgetMs')
+        resultado = predict_freight_price(origem_lat, origem_lng, destino_lat, destino_lng, km, mes,
+                                          explain=explicar, include_similar_routes=incluir_rotas or explicar,
+                                          latency_budget_ms=None if orcamento is None else float(orcamento))
+    
+    # Formata o resultado para o servidor
+    server_result = {
+        "success": not resultado.get("error", False),
+        "recommendedPrice": resultado.get("prediction"),
+        "confidence": resultado.get("confidence_pct", 0),
+        "explanation": resultado.get("message", ""),
+        "method": resultado.get("method", ""),
+        "details": resultado.get("details", {})
+    }
+    
+    if resultado.get("error", False):
+        server_result["error"] = resultado.get("message", "Erro desconhecido")
+    return server_result
+
 def main():
     """
     Função principal para execução do script.
@@ -329,39 +657,26 @@ def main():
     # Verifica se estamos no modo arquivo JSON (chamada do servidor)
     if len(sys.argv) >= 2 and os.path.exists(sys.argv[1]) and sys.argv[1].endswith('.json'):
         # Modo arquivo JSON - usado pelo servidor Node.js
+        output = 'json'
         try:
             json_file_path = sys.argv[1]
-            print(f"Processando arquivo de entrada: {json_file_path}")
-            
             with open(json_file_path, 'r') as f:
                 input_data = json.load(f)
             
-            # Extrai as coordenadas e parâmetros essenciais
-            origem_lat = float(input_data.get('originLat', 0))
-            origem_lng = float(input_data.get('originLng', 0))
-            destino_lat = float(input_data.get('destLat', 0))
-            destino_lng = float(input_data.get('destLng', 0))
-            km = float(input_data.get('totalDistance', 0))
-            mes = int(input_data.get('month', datetime.now().month))
-            
-            # Realiza a predição
-            resultado = predict_freight_price(origem_lat, origem_lng, destino_lat, destino_lng, km, mes)
-            
-            # Formata o resultado para o servidor
-            server_result = {
-                "success": not resultado.get("error", False),
-                "recommendedPrice": resultado.get("prediction"),
-                "confidence": resultado.get("confidence_pct", 0),
-                "explanation": resultado.get("message", ""),
-                "method": resultado.get("method", ""),
-                "details": resultado.get("details", {})
-            }
+            # Nos formatos binários a saída padrão contém apenas a resposta:
+            # as mensagens de progresso vão para stderr
+            output = input_data.get('output', 'json')
+            if output not in OUTPUT_FORMATS:
+                output = 'json'
+            log = sys.stdout if output == 'json' else sys.stderr
             
-            if resultado.get("error", False):
-                server_result["error"] = resultado.get("message", "Erro desconhecido")
+            with contextlib.redirect_stdout(log):
+                print(f"Processando arquivo de entrada: {json_file_path}")
+                server_result = respond_json_request(input_data)
             
-            # Retorna o resultado como JSON
-            print(json.dumps(server_result))
+            fields = input_data.get('fields')
+            incluir_rotas = bool(input_data.get('includeSimilarRoutes', fields is None))
+            write_response(select_response_fields(server_result, fields, incluir_rotas), output)
             return
             
         except Exception as e:
@@ -369,7 +684,7 @@ def main():
                 "success": False,
                 "error": f"Erro ao processar arquivo JSON: {str(e)}"
             }
-            print(json.dumps(error_result))
+            write_response(error_result, output)
             return
     
     # Modo linha de comando para testes manuais
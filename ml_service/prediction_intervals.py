@@ -0,0 +1,273 @@
+"""
+Módulo de intervalos de predição do modelo ML.
+Substitui a confiança fixa do modelo por uma incerteza calculada por
+requisição, a partir do próprio ensemble:
+- GradientBoosting: modelos de quantis (perda 'quantile', mesmos
+  hiperparâmetros) treinados junto com o modelo principal e servidos pela
+  travessia compilada de staged_inference (poucos µs por modelo)
+- RandomForest: dispersão das predições das árvores, obtidas em uma única
+  travessia vetorizada de todas as árvores (sem chamar cada árvore)
+
+A confiança é derivada da largura relativa do intervalo:
+1 - (superior - inferior) / (2 × predição), limitada a
+[MIN_CONFIDENCE, MAX_CONFIDENCE]. Sem intervalo disponível (modelos de
+quantis ainda não treinados), usa DEFAULT_MODEL_CONFIDENCE.
+"""
+
+import os
+import sys
+import time
+import hashlib
+import tempfile
+import weakref
+import joblib
+import numpy as np
+from sklearn.base import clone
+from staged_inference import (is_staged_model, get_staged_model, predict_staged, compile_trees,
+                              tree_outputs, estimated_latency_ms, SMALL_BATCH_ROWS, MIN_STAGES)
+
+# Caminho dos modelos de quantis (ao lado do modelo)
+QUANTILE_MODELS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'gb_quantile_models.pkl')
+
+# Quantis dos limites inferior e superior (intervalo de 80%)
+INTERVAL_QUANTILES = (0.1, 0.9)
+
+# Limites da confiança derivada do intervalo
+MIN_CONFIDENCE = 0.5
+MAX_CONFIDENCE = 0.95
+
+# Confiança usada quando não há intervalo disponível para o modelo
+DEFAULT_MODEL_CONFIDENCE = 0.95
+
+# Modelos de quantis carregados (por caminho), florestas compiladas e
+# impressões digitais dos modelos principais (sem manter vivos os modelos
+# descartados: predict carrega o modelo a cada predição)
+_loaded_quantile_models = {}
+_compiled_forests = weakref.WeakKeyDictionary()
+_fingerprints = weakref.WeakKeyDictionary()
+
+def is_forest_model(model):
+    """Indica se o modelo é um RandomForest de regressão (árvores independentes)."""
+    return hasattr(model, 'estimators_') and not hasattr(model, 'learning_rate')
+
+def train_quantile_models(model, X, y, sample_weight=None, quantiles=INTERVAL_QUANTILES):
+    """
+    Treina os modelos de quantis com os hiperparâmetros do GradientBoosting principal.
+
+    Args:
+        model (GradientBoostingRegressor): Modelo principal (não precisa estar treinado)
+        X (ndarray): Features padronizadas do conjunto de treino
+        y (array): Valores reais
+        sample_weight (array, optional): Peso de cada linha
+        quantiles (tuple): Quantis dos limites inferior e superior
+
+    Returns:
+        dict: 'quantiles' e 'models' (um modelo por quantil)
+    """
+    modelos = [clone(model).set_params(loss='quantile', alpha=q).fit(X, y, sample_weight=sample_weight)
+               for q in quantiles]
+    return {'quantiles': list(quantiles), 'models': modelos}
+
+def model_fingerprint(model):
+    """
+    Impressão digital do GradientBoosting principal: hash das árvores
+    (features, limiares e valores) e do valor inicial, calculado uma vez por modelo.
+
+    Returns:
+        str: Hash, ou None se o modelo não é um GradientBoosting
+    """
+    if not is_staged_model(model):
+        return None
+    if model not in _fingerprints:
+        inicial = 0.0 if model.init_ == 'zero' else model.init_.predict(np.zeros((1, model.n_features_in_)))[0]
+        conteudo = hashlib.sha1(np.float64(inicial).tobytes())
+        for arvore in model.estimators_[:, 0]:
+            for array in (arvore.tree_.feature, arvore.tree_.threshold, arvore.tree_.value):
+                conteudo.update(array.tobytes())
+        _fingerprints[model] = conteudo.hexdigest()[:12]
+    return _fingerprints[model]
+
+def save_quantile_models(quantile_models, model, features, path=QUANTILE_MODELS_PATH):
+    """Salva os modelos de quantis com as features e a impressão digital do modelo principal."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Escrita atômica: o serviço nunca lê um arquivo pela metade e cada versão é um novo arquivo
+    descritor, temporario = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    os.close(descritor)
+    try:
+        joblib.dump(dict(quantile_models, features=list(features), model_fingerprint=model_fingerprint(model)),
+                    temporario)
+        os.replace(temporario, path)
+    except BaseException:
+        os.unlink(temporario)
+        raise
+    _loaded_quantile_models.pop(path, None)
+    print(f"Modelos de quantis salvos em: {path}")
+
+def load_quantile_models(model, features, path=QUANTILE_MODELS_PATH):
+    """
+    Carrega os modelos de quantis (uma vez por processo e por versão do
+    arquivo: um novo treino é recarregado sem reiniciar o serviço).
+
+    Args:
+        model: Modelo principal carregado
+        features (list): Features do modelo principal
+
+    Returns:
+        dict: Modelos de quantis, ou None se não existem ou foram treinados
+              junto com outro modelo principal (ex.: um gb_model*.pkl antigo
+              restaurado ou um treino que não gerou novos quantis)
+    """
+    try:
+        estado = os.stat(path)
+    except FileNotFoundError:
+        return None
+    versao = (estado.st_ino, estado.st_mtime_ns, estado.st_size)
+    if path not in _loaded_quantile_models or _loaded_quantile_models[path][0] != versao:
+        _loaded_quantile_models[path] = (versao, joblib.load(path))
+    carregados = _loaded_quantile_models[path][1]
+    if carregados['features'] != list(features) or carregados.get('model_fingerprint') != model_fingerprint(model):
+        return None
+    return carregados
+
+def _forest_tree_predictions(model, X):
+    """Predição de cada árvore do RandomForest: matriz n × n_árvores."""
+    if len(X) > SMALL_BATCH_ROWS:
+        return np.column_stack([arvore.predict(X) for arvore in model.estimators_])
+    if model not in _compiled_forests:
+        _compiled_forests[model] = compile_trees([arvore.tree_ for arvore in model.estimators_])
+    return tree_outputs(_compiled_forests[model], X, len(model.estimators_))
+
+def interval_confidence(prediction, lower, upper):
+    """Confiança derivada da largura relativa do intervalo."""
+    prediction = np.asarray(prediction, dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        meia_largura = (np.asarray(upper) - np.asarray(lower)) / (2 * np.abs(prediction))
+    return np.clip(np.nan_to_num(1 - meia_largura, nan=MIN_CONFIDENCE), MIN_CONFIDENCE, MAX_CONFIDENCE)
+
+def interval_models(model, quantile_models):
+    """Modelos adicionais avaliados pelo intervalo (para o orçamento de latência)."""
+    return len(quantile_models['models']) if quantile_models is not None and is_staged_model(model) else 0
+
+def quantile_models_for_budget(model, quantile_models, latency_budget_ms, n_rows=1):
+    """
+    Modelos de quantis que cabem no orçamento de latência junto com o modelo.
+    Se nem com MIN_STAGES estágios os três modelos cabem, o intervalo é omitido.
+
+    Returns:
+        dict: Modelos de quantis, ou None se o intervalo não cabe no orçamento
+    """
+    adicionais = interval_models(model, quantile_models)
+    if latency_budget_ms is None or adicionais == 0:
+        return quantile_models
+    custo = estimated_latency_ms(get_staged_model(model), MIN_STAGES, n_rows) * (1 + adicionais)
+    return quantile_models if custo <= latency_budget_ms else None
+
+def prediction_interval(model, X, prediction, quantile_models=None, quantiles=INTERVAL_QUANTILES,
+                        n_stages=None):
+    """
+    Intervalo de predição e confiança de um lote (já padronizado).
+
+    Args:
+        model: Modelo principal
+        X (ndarray): Matriz n × n_features padronizada
+        prediction (array): Predições do modelo principal para X
+        quantile_models (dict, optional): Modelos de quantis (GradientBoosting)
+        quantiles (tuple): Quantis da dispersão das árvores (RandomForest)
+        n_stages (int, optional): Estágios dos modelos de quantis (os mesmos da
+            predição com orçamento de latência; default: todos)
+
+    Returns:
+        dict: Arrays 'lower', 'upper' e 'confidence' e 'source' ('quantile_models'
+              ou 'tree_spread'), ou None se não há intervalo para o modelo
+    """
+    prediction = np.asarray(prediction, dtype=np.float64)
+    if quantile_models is not None and is_staged_model(model):
+        inferior, superior = (predict_staged(get_staged_model(modelo), X, n_stages)
+                              for modelo in quantile_models['models'])
+        fonte = 'quantile_models'
+    elif is_forest_model(model):
+        inferior, superior = np.percentile(_forest_tree_predictions(model, X),
+                                           [q * 100 for q in quantiles], axis=1)
+        fonte = 'tree_spread'
+    else:
+        return None
+
+    # Quantis estimados separadamente podem cruzar a predição: o intervalo sempre a contém
+    inferior, superior = np.minimum(inferior, prediction), np.maximum(superior, prediction)
+    return {
+        'lower': inferior,
+        'upper': superior,
+        'confidence': interval_confidence(prediction, inferior, superior),
+        'source': fonte,
+    }
+
+def interval_report(model, X, y, sample_weight=None, quantile_models=None, repeats=200):
+    """
+    Cobertura, largura relativa e custo de latência do intervalo em um conjunto de avaliação.
+
+    Returns:
+        dict: 'coverage' (fração dos valores reais dentro do intervalo),
+              'mean_width_pct', 'mean_confidence' e 'single_overhead_ms'
+              (tempo adicional do intervalo em uma predição individual),
+              ou None se não há intervalo para o modelo
+    """
+    y = np.asarray(y, dtype=np.float64)
+    w = np.ones(len(y)) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+    predicao = model.predict(X)
+    intervalo = prediction_interval(model, X, predicao, quantile_models)
+    if intervalo is None:
+        return None
+
+    linha = X[:1]
+    prediction_interval(model, linha, predicao[:1], quantile_models)
+    inicio = time.perf_counter()
+    for _ in range(repeats):
+        prediction_interval(model, linha, predicao[:1], quantile_models)
+    sobrecarga = (time.perf_counter() - inicio) / repeats * 1000
+
+    dentro = (y >= intervalo['lower']) & (y <= intervalo['upper'])
+    return {
+        'source': intervalo['source'],
+        'quantiles': list(quantile_models['quantiles'] if quantile_models else INTERVAL_QUANTILES),
+        'coverage': round(float(np.average(dentro, weights=w)), 4),
+        'mean_width_pct': round(float(np.average((intervalo['upper'] - intervalo['lower']) / predicao,
+                                                 weights=w)), 4),
+        'mean_confidence': round(float(np.average(intervalo['confidence'], weights=w)), 4),
+        'single_overhead_ms': round(sobrecarga, 4),
+    }
+
+def print_interval_report(report):
+    """Exibe o relatório do intervalo de predição."""
+    inferior, superior = report['quantiles']
+    print(f"Intervalo de predição ({report['source']}, quantis {inferior:.2f}-{superior:.2f}): "
+          f"cobertura {report['coverage'] * 100:.1f}%, largura média {report['mean_width_pct'] * 100:.1f}%, "
+          f"confiança média {report['mean_confidence'] * 100:.1f}%, "
+          f"custo por predição {report['single_overhead_ms']:.3f}ms")
+
+def main():
+    """
+    Cobertura e custo do intervalo do modelo atual, avaliados no histórico:
+    python prediction_intervals.py
+    """
+    from predict import load_historical_data, load_model_and_scaler
+    from data_processor import get_feature_builder, build_feature_matrix
+
+    model, scaler, features, _ = load_model_and_scaler()
+    historico = load_historical_data()
+    X = build_feature_matrix(
+        get_feature_builder(features, scaler), historico['KM'].to_numpy(dtype=np.float64),
+        historico['Mês'].to_numpy(), historico['Ano'].to_numpy(),
+        historico['Lat_Origem'].to_numpy(dtype=np.float64), historico['Lng_Origem'].to_numpy(dtype=np.float64),
+        historico['Lat_Destino'].to_numpy(dtype=np.float64), historico['Lng_Destino'].to_numpy(dtype=np.float64),
+        valor_por_km=historico['Valor_por_km'].to_numpy(dtype=np.float64))
+
+    report = interval_report(model, X, historico['Frete Carreteiro'],
+                             quantile_models=load_quantile_models(model, features))
+    if report is None:
+        print(f"Sem intervalo para o modelo atual (modelos de quantis não encontrados em {QUANTILE_MODELS_PATH}; "
+              f"execute: python train.py)")
+        sys.exit(1)
+    print_interval_report(report)
+
+if __name__ == "__main__":
+    main()
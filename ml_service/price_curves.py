@@ -0,0 +1,184 @@
+"""
+Módulo de curvas de preço (simulações "e se") do sistema de fretes.
+Retorna, em uma única chamada, a curva de 12 meses de uma rota ou os preços
+ao longo de uma faixa de distâncias, para apoio à precificação de contratos.
+A busca por rotas similares é feita uma vez e o modelo ML é avaliado em
+uma única predição vetorizada (ver batch_predict.predict_curve).
+"""
+
+import os
+import sys
+import json
+import time
+import numpy as np
+from datetime import datetime
+from predict import load_historical_data, load_model_and_scaler
+from batch_predict import predict_curve
+from seasonality import load_seasonality_table
+from residual_correction import load_residual_table
+
+# Pipelines disponíveis: 'standard' (predict.py) e 'high_confidence' (improved_prediction.py)
+CURVE_PIPELINES = ['standard', 'high_confidence']
+
+def price_curve(origem_lat, origem_lng, destino_lat, destino_lng, km, months=None, kms=None,
+                pipeline='standard'):
+    """
+    Calcula os preços de uma rota para vários meses e/ou distâncias.
+
+    Args:
+        origem_lat (float): Latitude da origem
+        origem_lng (float): Longitude da origem
+        destino_lat (float): Latitude do destino
+        destino_lng (float): Longitude do destino
+        km (float): Distância em km (usada quando kms não é informado)
+        months (list, optional): Meses avaliados (default: 1 a 12)
+        kms (list, optional): Distâncias avaliadas (default: [km])
+        pipeline (str): 'standard' ou 'high_confidence'
+
+    Returns:
+        dict: Resultado com um ponto por cenário (mês, km, predição, confiança e método)
+    """
+    try:
+        origem_lat = float(origem_lat)
+        origem_lng = float(origem_lng)
+        destino_lat = float(destino_lat)
+        destino_lng = float(destino_lng)
+        months = list(range(1, 13)) if months is None else [int(m) for m in months]
+        kms = [float(km)] if kms is None else [float(k) for k in kms]
+    except (ValueError, TypeError) as e:
+        return {
+            "error": True,
+            "message": f"Erro de conversão de dados: {str(e)}",
+            "points": []
+        }
+
+    if pipeline not in CURVE_PIPELINES:
+        return {
+            "error": True,
+            "message": f"Pipeline desconhecido: {pipeline} (use {', '.join(CURVE_PIPELINES)})",
+            "points": []
+        }
+    if any(m < 1 or m > 12 for m in months) or any(k <= 0 for k in kms):
+        return {
+            "error": True,
+            "message": "Meses devem estar entre 1 e 12 e distâncias devem ser positivas",
+            "points": []
+        }
+
+    try:
+        historical_data = load_historical_data()
+        model, scaler, features, metadata = load_model_and_scaler()
+
+        inicio = time.perf_counter()
+        cenarios, resultados = predict_curve(
+            historical_data, model, scaler, features,
+            origem_lat, origem_lng, destino_lat, destino_lng,
+            months, kms, radius_km=50, seasonality=load_seasonality_table(),
+            residuals=load_residual_table()
+        )
+        pred = resultados[pipeline]
+        duracao = time.perf_counter() - inicio
+
+        points = []
+        for mes, distancia, preco, confianca, metodo in zip(
+                cenarios['Mês'], cenarios['KM'], pred['prediction'], pred['confidence'], pred['method']):
+            coberto = not np.isnan(preco)
+            points.append({
+                "month": int(mes),
+                "km": float(distancia),
+                "prediction": float(preco) if coberto else None,
+                "confidence": float(confianca),
+                "confidence_pct": round(float(confianca) * 100, 1),
+                "method": str(metodo)
+            })
+
+        return {
+            "error": False,
+            "pipeline": pipeline,
+            "num_routes": int(pred['num_routes'].iloc[0]) if len(pred) else 0,
+            "points": points,
+            "message": f"{len(points)} cenário(s) calculado(s) em {duracao * 1000:.1f}ms"
+        }
+
+    except Exception as e:
+        return {
+            "error": True,
+            "message": f"Erro durante o cálculo da curva: {str(e)}",
+            "points": []
+        }
+
+def _parse_km_range(texto):
+    """Converte 'inicio:fim:passo' na lista de distâncias (fim incluído)."""
+    inicio, fim, passo = (float(v) for v in texto.split(':'))
+    return list(np.arange(inicio, fim + passo / 2, passo))
+
+def main():
+    """
+    Função principal para execução do script.
+    Suporta dois modos de execução:
+    1. Modo arquivo JSON: recebe um arquivo JSON como primeiro argumento
+       (campos de predict.py e, opcionalmente, 'months', 'kmValues' e 'pipeline')
+    2. Modo linha de comando: origem_lat origem_lng destino_lat destino_lng km [inicio:fim:passo]
+    """
+    if len(sys.argv) >= 2 and os.path.exists(sys.argv[1]) and sys.argv[1].endswith('.json'):
+        try:
+            with open(sys.argv[1], 'r') as f:
+                input_data = json.load(f)
+
+            resultado = price_curve(
+                input_data.get('originLat', 0), input_data.get('originLng', 0),
+                input_data.get('destLat', 0), input_data.get('destLng', 0),
+                input_data.get('totalDistance', 0),
+                months=input_data.get('months'),
+                kms=input_data.get('kmValues'),
+                pipeline=input_data.get('pipeline', 'standard')
+            )
+
+            server_result = {
+                "success": not resultado.get("error", False),
+                "pipeline": resultado.get("pipeline"),
+                "numRoutes": resultado.get("num_routes", 0),
+                "points": resultado.get("points", []),
+                "explanation": resultado.get("message", "")
+            }
+            if resultado.get("error", False):
+                server_result["error"] = resultado.get("message", "Erro desconhecido")
+
+            print(json.dumps(server_result))
+            return
+
+        except Exception as e:
+            print(json.dumps({
+                "success": False,
+                "error": f"Erro ao processar arquivo JSON: {str(e)}"
+            }))
+            return
+
+    if len(sys.argv) < 6:
+        print("Uso: python price_curves.py origem_lat origem_lng destino_lat destino_lng distancia_km [inicio:fim:passo]")
+        print("     OU")
+        print("     python price_curves.py arquivo_input.json")
+        return
+
+    origem_lat, origem_lng, destino_lat, destino_lng, km = (float(v) for v in sys.argv[1:6])
+    if len(sys.argv) >= 7:
+        # Varredura de distâncias no mês atual
+        resultado = price_curve(origem_lat, origem_lng, destino_lat, destino_lng, km,
+                                months=[datetime.now().month], kms=_parse_km_range(sys.argv[6]))
+    else:
+        # Curva de 12 meses
+        resultado = price_curve(origem_lat, origem_lng, destino_lat, destino_lng, km)
+
+    print("\n=== Curva de Preços ===")
+    if resultado.get("error", False):
+        print(f"ERRO: {resultado.get('message', 'Erro desconhecido')}")
+        return
+
+    print(resultado['message'])
+    for ponto in resultado['points']:
+        preco = '-' if ponto['prediction'] is None else f"R$ {ponto['prediction']:.2f}"
+        print(f"Mês {ponto['month']:2d} | {ponto['km']:7.1f} km | {preco:>10} | "
+              f"{ponto['confidence_pct']:5.1f}% | {ponto['method']}")
+
+if __name__ == "__main__":
+    main()
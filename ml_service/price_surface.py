@@ -0,0 +1,350 @@
+"""
+Módulo da superfície de preços pré-calculada do sistema de fretes.
+Um processo offline avalia o pipeline de predição (predict.py) em uma grade
+de células de origem × células de destino, cobrindo a região do histórico,
+para todos os meses. O resultado é salvo em um arquivo de arrays compacto
+(.npz) com preço, confiança e método de cada célula.
+
+Cotações aproximadas e mapas de calor são respondidos com um acesso ao array;
+cotações precisas continuam usando o pipeline completo.
+"""
+
+import os
+import sys
+import json
+import time
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+# Caminho da superfície (ao lado do modelo)
+SURFACE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'price_surface.npz')
+
+# Tamanho da célula da grade (graus) e margem ao redor dos pontos do histórico
+SURFACE_GRID_DEG = 0.25
+SURFACE_MARGIN_DEG = 0.5
+
+# Máximo de cenários (pares de células × meses) avaliados por bloco
+MAX_SCENARIOS_PER_BLOCK = 200_000
+
+# Métodos do pipeline padrão (código = posição na lista)
+SURFACE_METHODS = ['ml_model', 'geographic_coordinates', 'combined_geo_priority', 'combined_balanced',
+                   'nearest_lanes']
+
+# Superfície carregada (por caminho), reutilizada entre consultas do mesmo processo
+_loaded_surfaces = {}
+
+# Componentes de predição de cada processo de cálculo
+_worker_state = {}
+
+def _grid_axis(valores, grid_deg, margin_deg):
+    """Centros das células que cobrem os valores com a margem informada."""
+    inicio = np.floor((np.min(valores) - margin_deg) / grid_deg) * grid_deg
+    fim = np.ceil((np.max(valores) + margin_deg) / grid_deg) * grid_deg
+    n = int(round((fim - inicio) / grid_deg))
+    return inicio + (np.arange(n) + 0.5) * grid_deg
+
+def build_surface_grid(historical_data, grid_deg=SURFACE_GRID_DEG, margin_deg=SURFACE_MARGIN_DEG):
+    """
+    Define as grades de origem e de destino a partir da região do histórico.
+
+    Returns:
+        dict: Centros das células ('origin_lat', 'origin_lng', 'dest_lat', 'dest_lng')
+              e o tamanho da célula
+    """
+    return {
+        'grid_deg': float(grid_deg),
+        'origin_lat': _grid_axis(historical_data['Lat_Origem'].to_numpy(np.float64), grid_deg, margin_deg),
+        'origin_lng': _grid_axis(historical_data['Lng_Origem'].to_numpy(np.float64), grid_deg, margin_deg),
+        'dest_lat': _grid_axis(historical_data['Lat_Destino'].to_numpy(np.float64), grid_deg, margin_deg),
+        'dest_lng': _grid_axis(historical_data['Lng_Destino'].to_numpy(np.float64), grid_deg, margin_deg),
+    }
+
+def estimate_detour_factor(historical_data):
+    """
+    Fator entre a distância rodoviária (KM) e a distância em linha reta,
+    usado para estimar o KM de cada par de células (mediana do histórico).
+    """
+    from similarity_index import haversine_km
+
+    reta = haversine_km(historical_data['Lat_Origem'], historical_data['Lng_Origem'],
+                        historical_data['Lat_Destino'], historical_data['Lng_Destino'])
+    validos = reta > 1
+    return float(np.median(historical_data['KM'].to_numpy(np.float64)[validos] / reta[validos]))
+
+def _init_surface_worker():
+    """Carrega histórico, modelo e sazonalidade uma vez por processo."""
+    from predict import load_historical_data, load_model_and_scaler
+    from seasonality import load_seasonality_table
+
+    model, scaler, features, _ = load_model_and_scaler()
+    _worker_state.update({
+        'historical_data': load_historical_data(),
+        'model': model,
+        'scaler': scaler,
+        'features': features,
+        'seasonality': load_seasonality_table(),
+    })
+
+def _evaluate_surface_block(bloco):
+    """
+    Avalia o pipeline padrão para um bloco de células de origem × todas as
+    células de destino × meses. A busca por rotas similares é feita uma vez
+    por par de células e replicada para os meses.
+    """
+    from similarity_index import haversine_km, cached_for_frame
+    from batch_predict import build_lane_table, batch_similarity_stats, predict_from_stats
+    from data_processor import distance_band_stats
+    from nearest_lanes import nearest_lane_stats
+
+    estado = _worker_state
+    historical_data = estado['historical_data']
+    lanes = cached_for_frame(historical_data, 'lane_table', build_lane_table)
+
+    lat_o, lng_o = bloco['origin_lat'], bloco['origin_lng']
+    lat_d, lng_d = bloco['dest_lat'], bloco['dest_lng']
+    meses = np.asarray(bloco['months'], dtype=np.int64)
+
+    # Pares (origem, destino) do bloco, em ordem origem-major
+    pares_o = np.repeat(np.arange(len(lat_o)), len(lat_d))
+    pares_d = np.tile(np.arange(len(lat_d)), len(lat_o))
+    km = haversine_km(lat_o[pares_o], lng_o[pares_o], lat_d[pares_d], lng_d[pares_d]) * bloco['detour_factor']
+    km = np.maximum(km, 1.0)
+
+    stats = batch_similarity_stats(lanes, lat_o[pares_o], lng_o[pares_o], lat_d[pares_d], lng_d[pares_d])
+    band = distance_band_stats(historical_data, km)
+    nearest = nearest_lane_stats(historical_data, lat_o[pares_o], lng_o[pares_o],
+                                 lat_d[pares_d], lng_d[pares_d], km)
+
+    n_pares = len(pares_o)
+    cenarios = pd.DataFrame({
+        'Lat_Origem': np.tile(lat_o[pares_o], len(meses)),
+        'Lng_Origem': np.tile(lng_o[pares_o], len(meses)),
+        'Lat_Destino': np.tile(lat_d[pares_d], len(meses)),
+        'Lng_Destino': np.tile(lng_d[pares_d], len(meses)),
+        'KM': np.tile(km, len(meses)),
+        'Mês': np.repeat(meses, n_pares),
+    })
+    resultado = predict_from_stats(
+        cenarios,
+        {name: np.tile(valores, len(meses)) for name, valores in stats.items()},
+        {name: np.tile(valores, len(meses)) for name, valores in band.items()},
+        {name: np.tile(valores, len(meses)) for name, valores in nearest.items()},
+        estado['model'], estado['scaler'], estado['features'],
+        seasonality=estado['seasonality']
+    )['standard']
+
+    forma = (len(meses), len(lat_o), len(lat_d))
+    codigos = {metodo: i for i, metodo in enumerate(SURFACE_METHODS)}
+    return {
+        'start': bloco['start'],
+        'km': km.reshape(len(lat_o), len(lat_d)).astype(np.float32),
+        'price': resultado['prediction'].to_numpy(np.float32).reshape(forma),
+        'confidence': np.round(resultado['confidence'].to_numpy() * 100).astype(np.uint8).reshape(forma),
+        'method': resultado['method'].map(codigos).to_numpy(np.uint8).reshape(forma),
+        'num_routes': np.minimum(stats['num_routes'], np.iinfo(np.uint16).max)
+                        .astype(np.uint16).reshape(len(lat_o), len(lat_d)),
+    }
+
+def build_price_surface(grid_deg=SURFACE_GRID_DEG, months=None, max_workers=None,
+                        path=SURFACE_PATH):
+    """
+    Calcula a superfície de preços em paralelo e salva em .npz.
+
+    Cada célula de origem/destino é representada pelo seu centro; o KM do par
+    é a distância em linha reta multiplicada pelo fator de desvio do histórico.
+
+    Args:
+        grid_deg (float): Tamanho da célula (graus)
+        months (list, optional): Meses calculados (default: 1 a 12)
+        max_workers (int, optional): Processos paralelos (default: todos os núcleos)
+        path (str): Arquivo de saída
+
+    Returns:
+        dict: Resumo da superfície (formato, tempo, distribuição dos métodos)
+    """
+    from predict import load_historical_data
+
+    inicio = time.perf_counter()
+    meses = list(range(1, 13)) if months is None else [int(m) for m in months]
+
+    historical_data = load_historical_data()
+    grade = build_surface_grid(historical_data, grid_deg)
+    detour = estimate_detour_factor(historical_data)
+
+    # Grade de origem achatada (célula = linha × coluna)
+    origem_lat, origem_lng = (g.ravel() for g in np.meshgrid(grade['origin_lat'], grade['origin_lng'],
+                                                              indexing='ij'))
+    destino_lat, destino_lng = (g.ravel() for g in np.meshgrid(grade['dest_lat'], grade['dest_lng'],
+                                                                indexing='ij'))
+
+    n_o, n_d, n_m = len(origem_lat), len(destino_lat), len(meses)
+    por_bloco = max(1, MAX_SCENARIOS_PER_BLOCK // (n_d * n_m))
+    blocos = [{
+        'start': i,
+        'origin_lat': origem_lat[i:i + por_bloco],
+        'origin_lng': origem_lng[i:i + por_bloco],
+        'dest_lat': destino_lat,
+        'dest_lng': destino_lng,
+        'months': meses,
+        'detour_factor': detour,
+    } for i in range(0, n_o, por_bloco)]
+
+    print(f"Superfície de preços: {n_o} células de origem × {n_d} de destino × {n_m} meses "
+          f"({n_o * n_d * n_m} cenários, {len(blocos)} blocos)")
+
+    price = np.empty((n_m, n_o, n_d), dtype=np.float32)
+    confidence = np.empty((n_m, n_o, n_d), dtype=np.uint8)
+    method = np.empty((n_m, n_o, n_d), dtype=np.uint8)
+    km = np.empty((n_o, n_d), dtype=np.float32)
+    num_routes = np.empty((n_o, n_d), dtype=np.uint16)
+
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(),
+                             initializer=_init_surface_worker) as executor:
+        for parte in executor.map(_evaluate_surface_block, blocos):
+            fatia = slice(parte['start'], parte['start'] + parte['km'].shape[0])
+            price[:, fatia] = parte['price']
+            confidence[:, fatia] = parte['confidence']
+            method[:, fatia] = parte['method']
+            km[fatia] = parte['km']
+            num_routes[fatia] = parte['num_routes']
+
+    metadata = {
+        'created_at': datetime.now().isoformat(),
+        'pipeline': 'standard',
+        'grid_deg': grade['grid_deg'],
+        'detour_factor': detour,
+        'methods': SURFACE_METHODS,
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.savez_compressed(
+        path,
+        price=price, confidence=confidence, method=method, km=km, num_routes=num_routes,
+        months=np.asarray(meses, dtype=np.int8),
+        origin_lat=grade['origin_lat'], origin_lng=grade['origin_lng'],
+        dest_lat=grade['dest_lat'], dest_lng=grade['dest_lng'],
+        metadata=np.array(json.dumps(metadata))
+    )
+    _loaded_surfaces.pop(path, None)
+
+    contagem = np.bincount(method.ravel(), minlength=len(SURFACE_METHODS))
+    resumo = {
+        'shape': [n_m, n_o, n_d],
+        'seconds': round(time.perf_counter() - inicio, 2),
+        'file_mb': round(os.path.getsize(path) / 1e6, 2),
+        'methods': {m: int(c) for m, c in zip(SURFACE_METHODS, contagem)},
+    }
+    print(f"Superfície salva em: {path} ({resumo['file_mb']} MB, {resumo['seconds']}s)")
+    return resumo
+
+def load_price_surface(path=SURFACE_PATH):
+    """
+    Carrega a superfície de preços (uma vez por processo).
+
+    Returns:
+        dict: Arrays da superfície e metadados, ou None se ainda não foi gerada
+    """
+    if path not in _loaded_surfaces:
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as dados:
+            surface = {nome: dados[nome] for nome in dados.files if nome != 'metadata'}
+            surface['metadata'] = json.loads(str(dados['metadata']))
+        _loaded_surfaces[path] = surface
+    return _loaded_surfaces[path]
+
+def _cell_index(centros, valor, grid_deg):
+    """Índice da célula que contém o valor (-1 se estiver fora da grade)."""
+    i = int(np.floor((float(valor) - (centros[0] - grid_deg / 2)) / grid_deg))
+    return i if 0 <= i < len(centros) else -1
+
+def _cell_of(surface, lat, lng, prefixo):
+    """Índice achatado da célula de origem ou destino (-1 se fora da grade)."""
+    grid_deg = surface['metadata']['grid_deg']
+    i = _cell_index(surface[f'{prefixo}_lat'], lat, grid_deg)
+    j = _cell_index(surface[f'{prefixo}_lng'], lng, grid_deg)
+    if i < 0 or j < 0:
+        return -1
+    return i * len(surface[f'{prefixo}_lng']) + j
+
+def _month_index(surface, mes):
+    """Posição do mês na superfície (-1 se o mês não foi calculado)."""
+    posicoes = np.nonzero(surface['months'] == int(mes))[0]
+    return int(posicoes[0]) if len(posicoes) else -1
+
+def lookup_surface_price(surface, lat_origem, lng_origem, lat_destino, lng_destino, mes):
+    """
+    Cotação aproximada: preço da célula de origem × célula de destino no mês.
+
+    Returns:
+        dict: Preço, confiança, método, KM estimado e número de rotas da célula,
+              ou None se as coordenadas ou o mês estiverem fora da superfície
+    """
+    if surface is None:
+        return None
+
+    o = _cell_of(surface, lat_origem, lng_origem, 'origin')
+    d = _cell_of(surface, lat_destino, lng_destino, 'dest')
+    m = _month_index(surface, mes)
+    if o < 0 or d < 0 or m < 0 or np.isnan(surface['price'][m, o, d]):
+        return None
+
+    return {
+        'prediction': float(surface['price'][m, o, d]),
+        'confidence': float(surface['confidence'][m, o, d]) / 100,
+        'method': surface['metadata']['methods'][int(surface['method'][m, o, d])],
+        'km_estimate': float(surface['km'][o, d]),
+        'num_routes': int(surface['num_routes'][o, d]),
+        'grid_deg': surface['metadata']['grid_deg'],
+    }
+
+def surface_heatmap(surface, lat_origem, lng_origem, mes):
+    """
+    Mapa de calor dos preços a partir de uma origem: todas as células de
+    destino no mês informado (uma fatia do array).
+
+    Returns:
+        dict: Centros das células de destino ('lat', 'lng') e matrizes
+              'price' e 'confidence' (destino_lat × destino_lng), ou None
+    """
+    if surface is None:
+        return None
+
+    o = _cell_of(surface, lat_origem, lng_origem, 'origin')
+    m = _month_index(surface, mes)
+    if o < 0 or m < 0:
+        return None
+
+    forma = (len(surface['dest_lat']), len(surface['dest_lng']))
+    return {
+        'lat': surface['dest_lat'],
+        'lng': surface['dest_lng'],
+        'price': surface['price'][m, o].reshape(forma),
+        'confidence': surface['confidence'][m, o].reshape(forma) / 100,
+    }
+
+def main():
+    """
+    Gera a superfície de preços: python price_surface.py [--grid 0.25] [--workers N]
+    ou consulta uma rota: python price_surface.py origem_lat origem_lng destino_lat destino_lng [mes]
+    """
+    import argparse
+
+    if len(sys.argv) >= 5 and not sys.argv[1].startswith('--'):
+        lat_o, lng_o, lat_d, lng_d = (float(v) for v in sys.argv[1:5])
+        mes = int(sys.argv[5]) if len(sys.argv) >= 6 else datetime.now().month
+        resultado = lookup_surface_price(load_price_surface(), lat_o, lng_o, lat_d, lng_d, mes)
+        print(json.dumps(resultado if resultado is not None else {"error": "Fora da superfície de preços"}))
+        return
+
+    parser = argparse.ArgumentParser(description="Cálculo da superfície de preços")
+    parser.add_argument('--grid', type=float, default=SURFACE_GRID_DEG, help="Tamanho da célula (graus)")
+    parser.add_argument('--workers', type=int, default=None, help="Processos paralelos")
+    args = parser.parse_args()
+
+    resumo = build_price_surface(grid_deg=args.grid, max_workers=args.workers)
+    print(json.dumps(resumo, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Módulo de correção residual online do sistema de fretes.
+Aprende com o feedback dos usuários (preço sugerido × recomendação original)
+sem retreinar o modelo: para cada rota canônica (data_processor.lane_key) e
+mês, mantém a média exponencialmente ponderada do resíduo log(sugerido / base),
+onde base é a recomendação sem a correção vigente.
+
+Cada evento de feedback atualiza uma única entrada (O(1)); a tabela é salva
+em JSON compacto ao lado do modelo e aplicada na predição como um fator
+multiplicativo, encolhido em direção a 1.0 quando há poucos eventos.
+"""
+
+import os
+import sys
+import json
+import time
+import fcntl
+import tempfile
+import numpy as np
+from datetime import datetime
+from data_processor import lane_key
+
+# Caminho da tabela (ao lado do modelo)
+RESIDUALS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'residual_corrections.json')
+
+# Meia-vida da média exponencial, em eventos de feedback da mesma rota e mês
+RESIDUAL_HALF_LIFE = 20
+
+# Eventos equivalentes sem correção no encolhimento (fator = exp(r · n / (n + K)),
+# com n = total de eventos da rota no mês)
+RESIDUAL_SHRINKAGE = 3
+
+# Limite da correção aplicada (fator entre 1 / (1 + x) e 1 + x)
+MAX_CORRECTION = 0.25
+
+# Razão sugerido / recomendado aceita (fora disso o feedback é descartado)
+MAX_FEEDBACK_RATIO = 3.0
+
+# Tabelas carregadas (por caminho) com a versão do arquivo, recarregadas quando ele muda
+_loaded_tables = {}
+
+def residual_key(lat_origem, lng_origem, lat_destino, lng_destino, mes):
+    """Chave da entrada de uma rota canônica em um mês: "lane|mês"."""
+    return f"{lane_key(lat_origem, lng_origem, lat_destino, lng_destino)}|{int(mes)}"
+
+def new_residual_table(half_life=RESIDUAL_HALF_LIFE, shrinkage=RESIDUAL_SHRINKAGE):
+    """
+    Cria uma tabela de resíduos vazia.
+
+    Returns:
+        dict: Parâmetros e 'entries' (chave → [resíduo médio, peso efetivo,
+              total de eventos, timestamp])
+    """
+    return {
+        'half_life': half_life,
+        'shrinkage': shrinkage,
+        'updated_at': None,
+        'events': 0,
+        'entries': {},
+    }
+
+def _entry_factor(table, entrada):
+    """Fator de correção de uma entrada [resíduo, peso, eventos, timestamp]."""
+    if entrada is None:
+        return 1.0
+    residuo, eventos = entrada[0], entrada[2]
+    limite = np.log1p(MAX_CORRECTION)
+    return float(np.exp(np.clip(residuo * eventos / (eventos + table['shrinkage']), -limite, limite)))
+
+def correction_factor(table, lat_origem, lng_origem, lat_destino, lng_destino, mes):
+    """
+    Fator de correção de uma rota em um mês.
+
+    Returns:
+        dict: 'factor' (1.0 sem feedback) e 'events' (total de eventos)
+    """
+    entrada = None if table is None else table['entries'].get(
+        residual_key(lat_origem, lng_origem, lat_destino, lng_destino, mes))
+    return {
+        'factor': _entry_factor(table, entrada),
+        'events': 0 if entrada is None else int(entrada[2]),
+    }
+
+def correction_factors(table, lat_origem, lng_origem, lat_destino, lng_destino, meses):
+    """
+    Versão em lote de correction_factor.
+
+    Returns:
+        ndarray: Fator de cada consulta
+    """
+    fatores = np.ones(len(meses))
+    if table is None or not table['entries']:
+        return fatores
+    for i, chave in enumerate(zip(lat_origem, lng_origem, lat_destino, lng_destino, meses)):
+        fatores[i] = _entry_factor(table, table['entries'].get(residual_key(*chave)))
+    return fatores
+
+def apply_correction(price, factor):
+    """Aplica o fator a um preço (ou array de preços), mantendo o arredondamento em múltiplos de 5."""
+    return np.round(np.asarray(price, dtype=np.float64) * factor / 5) * 5
+
+def update_residual(table, lat_origem, lng_origem, lat_destino, lng_destino, mes,
+                    recommended, actual, timestamp=None):
+    """
+    Registra um evento de feedback na tabela (O(1)).
+    A recomendação original já pode conter a correção vigente; o resíduo é
+    medido em relação à recomendação sem ela.
+
+    Args:
+        table (dict): Tabela de resíduos (ver new_residual_table)
+        lat_origem, lng_origem, lat_destino, lng_destino (float): Coordenadas da rota
+        mes (int): Mês da cotação (1-12)
+        recommended (float): Recomendação exibida ao usuário (já com a correção vigente)
+        actual (float): Preço sugerido pelo usuário
+        timestamp (float, optional): Momento do evento (default: agora)
+
+    Returns:
+        dict: 'accepted', 'factor' (correção após o evento), 'events' e 'message'
+    """
+    recommended, actual, mes = float(recommended), float(actual), int(mes)
+    if mes < 1 or mes > 12:
+        return {'accepted': False, 'message': f"Mês inválido: {mes}"}
+    if not (recommended > 0 and actual > 0):
+        return {'accepted': False, 'message': "Preços devem ser positivos"}
+    if not (1 / MAX_FEEDBACK_RATIO <= actual / recommended <= MAX_FEEDBACK_RATIO):
+        return {'accepted': False,
+                'message': f"Razão sugerido/recomendado fora do limite ({actual / recommended:.2f})"}
+
+    chave = residual_key(lat_origem, lng_origem, lat_destino, lng_destino, mes)
+    entrada = table['entries'].get(chave)
+    residuo_atual, peso_atual, eventos = (0.0, 0.0, 0) if entrada is None else entrada[:3]
+
+    # Resíduo em relação à recomendação sem a correção vigente
+    base = recommended / _entry_factor(table, entrada)
+    residuo = np.log(actual / base)
+
+    # Média exponencial sem viés inicial: o peso efetivo satura em 1 / (1 - decaimento)
+    decaimento = 0.5 ** (1 / table['half_life'])
+    peso = peso_atual * decaimento + 1
+    residuo_medio = (residuo_atual * peso_atual * decaimento + residuo) / peso
+
+    table['entries'][chave] = [round(float(residuo_medio), 5), round(float(peso), 3), int(eventos) + 1,
+                               int(timestamp if timestamp is not None else time.time())]
+    table['events'] += 1
+    table['updated_at'] = datetime.now().isoformat()
+
+    fator = _entry_factor(table, table['entries'][chave])
+    return {
+        'accepted': True,
+        'factor': fator,
+        'events': int(eventos) + 1,
+        'message': f"Correção da rota no mês {mes}: {(fator - 1) * 100:+.1f}%",
+    }
+
+def save_residual_table(table, path=RESIDUALS_PATH):
+    """Salva a tabela em JSON compacto (escrita atômica, com arquivo temporário exclusivo)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    descritor, temporario = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(descritor, 'w') as f:
+            json.dump(table, f, separators=(',', ':'))
+        os.replace(temporario, path)
+    except BaseException:
+        os.unlink(temporario)
+        raise
+    _loaded_tables.pop(path, None)
+
+def load_residual_table(path=RESIDUALS_PATH):
+    """
+    Carrega a tabela de resíduos, relendo o arquivo somente quando ele muda
+    (correções gravadas por outro processo passam a valer na próxima predição).
+
+    Returns:
+        dict: Tabela de resíduos, ou None se ainda não há feedback registrado
+    """
+    try:
+        estado = os.stat(path)
+    except FileNotFoundError:
+        _loaded_tables.pop(path, None)
+        return None
+
+    # Cada gravação substitui o arquivo (novo inode): mesmo com o mesmo mtime, a mudança é detectada
+    versao = (estado.st_ino, estado.st_mtime_ns, estado.st_size)
+    carregada = _loaded_tables.get(path)
+    if carregada is None or carregada[0] != versao:
+        with open(path, 'r') as f:
+            carregada = (versao, json.load(f))
+        _loaded_tables[path] = carregada
+    return carregada[1]
+
+def record_feedback(feedback, path=RESIDUALS_PATH):
+    """
+    Registra um feedback no formato do servidor e salva a tabela.
+    Cada evento pode vir de um processo diferente: a leitura, a atualização e
+    a gravação acontecem sob um lock exclusivo no arquivo "<tabela>.lock",
+    para que eventos simultâneos não se sobrescrevam.
+
+    Args:
+        feedback (dict): Campos originLat, originLng, destLat, destLng, month,
+            originalRecommendation e userSuggestedPrice
+
+    Returns:
+        dict: Resultado de update_residual
+    """
+    try:
+        campos = [float(feedback[campo]) for campo in ('originLat', 'originLng', 'destLat', 'destLng')]
+        mes = int(feedback.get('month', datetime.now().month))
+        recomendado = float(feedback['originalRecommendation'])
+        sugerido = float(feedback['userSuggestedPrice'])
+    except (KeyError, ValueError, TypeError) as e:
+        return {'accepted': False, 'message': f"Feedback incompleto: {str(e)}"}
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.lock", 'w') as trava:
+        fcntl.flock(trava, fcntl.LOCK_EX)
+        table = load_residual_table(path)
+        table = new_residual_table() if table is None else table
+        resultado = update_residual(table, *campos, mes, recomendado, sugerido)
+        if resultado['accepted']:
+            save_residual_table(table, path)
+    return resultado
+
+def main():
+    """
+    Registra feedback ou consulta a correção de uma rota:
+    python residual_correction.py feedback.json   (ou o JSON via stdin)
+    python residual_correction.py origem_lat origem_lng destino_lat destino_lng [mes]
+    """
+    if len(sys.argv) >= 5:
+        coordenadas = [float(v) for v in sys.argv[1:5]]
+        table = load_residual_table()
+        meses = [int(sys.argv[5])] if len(sys.argv) >= 6 else range(1, 13)
+        for mes in meses:
+            correcao = correction_factor(table, *coordenadas, mes)
+            print(f"Mês {mes:2d}: fator {correcao['factor']:.3f}  eventos {correcao['events']}")
+        return
+
+    if len(sys.argv) >= 2:
+        with open(sys.argv[1], 'r') as f:
+            feedback = json.load(f)
+    else:
+        feedback = json.load(sys.stdin)
+
+    print(json.dumps(record_feedback(feedback)))
+
+if __name__ == "__main__":
+    main()
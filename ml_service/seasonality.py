@@ -0,0 +1,265 @@
+"""
+Módulo de sazonalidade do sistema de fretes.
+Materializa, no treino, a tabela de fatores mensais de preço por rota e por
+região (células de uma grade de coordenadas), com contagens e dispersão.
+A tabela é salva junto ao modelo e consultada na predição com uma busca
+em dicionário (O(1)), sem reler o histórico.
+
+O fator de um mês é a razão entre o R$/km médio do mês e o R$/km médio do
+grupo (rota ou região). Fatores com poucas viagens são encolhidos em
+direção ao nível superior: rota → região → 1.0 (sem efeito sazonal).
+"""
+
+import os
+import sys
+import json
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from data_processor import lane_key
+
+# Caminho da tabela (ao lado do modelo)
+SEASONALITY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'seasonality.json')
+
+# Tamanho da célula da grade regional (graus)
+REGION_GRID_DEG = 0.5
+
+# Viagens equivalentes do nível superior no encolhimento (fator = (n·f + K·f_pai) / (n + K))
+SHRINKAGE_TRIPS = 10
+
+# Colunas de coordenadas que identificam uma rota
+LANE_COLUMNS = ['Lat_Origem', 'Lng_Origem', 'Lat_Destino', 'Lng_Destino']
+
+# Tabela carregada (por caminho), reutilizada entre predições do mesmo processo
+_loaded_tables = {}
+
+def region_key(lat_origem, lng_origem, lat_destino, lng_destino, grid_deg=REGION_GRID_DEG):
+    """
+    Gera a chave da região de uma rota: célula da grade da origem → célula do destino.
+
+    Returns:
+        str: Chave no formato "i,j>k,l" (índices inteiros das células)
+    """
+    celulas = [int(np.floor(float(v) / grid_deg)) for v in (lat_origem, lng_origem, lat_destino, lng_destino)]
+    return f"{celulas[0]},{celulas[1]}>{celulas[2]},{celulas[3]}"
+
+def seasonality_sums(df, sample_weight=None, grid_deg=REGION_GRID_DEG):
+    """
+    Somas de R$/km (Σw, Σw·v, Σw·v²) por rota e mês. As somas de blocos
+    diferentes podem ser concatenadas e finalizadas juntas (treino em blocos).
+
+    Args:
+        df (DataFrame): Dados com coordenadas, 'Mês' e 'Valor_por_km'
+        sample_weight (array, optional): Peso de cada linha
+        grid_deg (float): Tamanho da célula da grade regional
+
+    Returns:
+        DataFrame: Uma linha por rota e mês com 'lane', 'region', 'month', 'w', 'wv', 'wv2'
+    """
+    w = np.ones(len(df)) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+    v = df['Valor_por_km'].to_numpy(dtype=np.float64)
+
+    codigos = df.groupby(LANE_COLUMNS, sort=False).ngroup().to_numpy()
+    unicos = df[LANE_COLUMNS].drop_duplicates()
+    lanes = np.array([lane_key(*c) for c in unicos.itertuples(index=False)], dtype=object)
+    regioes = np.array([region_key(*c, grid_deg=grid_deg) for c in unicos.itertuples(index=False)],
+                       dtype=object)
+
+    somas = pd.DataFrame({
+        'lane': lanes[codigos],
+        'region': regioes[codigos],
+        'month': df['Mês'].to_numpy().astype(np.int64),
+        'w': w,
+        'wv': w * v,
+        'wv2': w * v ** 2,
+    })
+    return somas.groupby(['lane', 'region', 'month'], as_index=False, sort=False)[['w', 'wv', 'wv2']].sum()
+
+def _monthly_factors(somas, grupo):
+    """
+    Fatores mensais brutos de um nível (rota ou região): média do mês sobre a
+    média do grupo, contagem (peso) e desvio padrão da razão viagem/média.
+    """
+    por_mes = somas.groupby([grupo, 'month'], sort=False)[['w', 'wv', 'wv2']].sum()
+    total = por_mes.groupby(level=0)[['w', 'wv']].sum()
+    media_grupo = (total['wv'] / total['w']).rename('group_mean')
+
+    por_mes = por_mes.join(media_grupo, on=grupo)
+    media_mes = por_mes['wv'] / por_mes['w']
+    var_mes = np.maximum(por_mes['wv2'] / por_mes['w'] - media_mes ** 2, 0.0)
+
+    return pd.DataFrame({
+        'raw_factor': media_mes / por_mes['group_mean'],
+        'count': por_mes['w'],
+        'std': np.sqrt(var_mes) / por_mes['group_mean'],
+    })
+
+def _shrink(raw_factor, count, parent_factor, shrinkage):
+    """Encolhe o fator bruto em direção ao fator do nível superior."""
+    return (count * raw_factor + shrinkage * parent_factor) / (count + shrinkage)
+
+def _month_arrays(fatores, chave, pai=None, shrinkage=SHRINKAGE_TRIPS):
+    """Converte os fatores de um grupo em listas de 12 meses (índice 0 = janeiro)."""
+    fator = np.ones(12) if pai is None else np.asarray(pai['factor'], dtype=np.float64).copy()
+    count = np.zeros(12)
+    std = [None] * 12
+    for (_, mes), linha in fatores.loc[[chave]].iterrows():
+        i = int(mes) - 1
+        pai_mes = 1.0 if pai is None else pai['factor'][i]
+        fator[i] = _shrink(linha['raw_factor'], linha['count'], pai_mes, shrinkage)
+        count[i] = linha['count']
+        std[i] = round(float(linha['std']), 4)
+    return {
+        'factor': [round(float(f), 4) for f in fator],
+        'count': [round(float(c), 1) for c in count],
+        'std': std,
+    }
+
+def finalize_seasonality(somas, grid_deg=REGION_GRID_DEG, shrinkage=SHRINKAGE_TRIPS):
+    """
+    Monta a tabela de sazonalidade a partir das somas (ver seasonality_sums).
+
+    Returns:
+        dict: Tabela com 'lanes' e 'regions' (chave → listas de 12 meses de
+              'factor', 'count' e 'std') e os parâmetros de construção
+    """
+    somas = somas.groupby(['lane', 'region', 'month'], as_index=False, sort=False)[['w', 'wv', 'wv2']].sum()
+
+    fatores_regiao = _monthly_factors(somas, 'region')
+    fatores_rota = _monthly_factors(somas, 'lane')
+
+    regioes = {chave: _month_arrays(fatores_regiao, chave, shrinkage=shrinkage)
+               for chave in fatores_regiao.index.get_level_values(0).unique()}
+
+    regiao_da_rota = somas.drop_duplicates('lane').set_index('lane')['region']
+    lanes = {}
+    for chave in fatores_rota.index.get_level_values(0).unique():
+        regiao = regiao_da_rota[chave]
+        lanes[chave] = dict(_month_arrays(fatores_rota, chave, pai=regioes[regiao], shrinkage=shrinkage),
+                            region=regiao)
+
+    return {
+        'created_at': datetime.now().isoformat(),
+        'grid_deg': grid_deg,
+        'shrinkage_trips': shrinkage,
+        'n_trips': round(float(somas['w'].sum()), 1),
+        'lanes': lanes,
+        'regions': regioes,
+    }
+
+def build_seasonality_table(df, sample_weight=None, grid_deg=REGION_GRID_DEG, shrinkage=SHRINKAGE_TRIPS):
+    """
+    Constrói a tabela de sazonalidade de um DataFrame de treino.
+
+    Args:
+        df (DataFrame): Dados de treino (ver train.load_data)
+        sample_weight (array, optional): Peso de cada linha
+        grid_deg (float): Tamanho da célula da grade regional
+        shrinkage (float): Viagens equivalentes do nível superior no encolhimento
+
+    Returns:
+        dict: Tabela de sazonalidade (ver finalize_seasonality)
+    """
+    return finalize_seasonality(seasonality_sums(df, sample_weight, grid_deg),
+                                grid_deg=grid_deg, shrinkage=shrinkage)
+
+def save_seasonality_table(table, path=SEASONALITY_PATH):
+    """Salva a tabela de sazonalidade em JSON e descarta a versão em memória."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(table, f)
+    _loaded_tables.pop(path, None)
+    print(f"Tabela de sazonalidade salva em: {path} "
+          f"({len(table['lanes'])} rotas, {len(table['regions'])} regiões)")
+
+def load_seasonality_table(path=SEASONALITY_PATH):
+    """
+    Carrega a tabela de sazonalidade (uma vez por processo).
+
+    Returns:
+        dict: Tabela de sazonalidade, ou None se ainda não foi gerada pelo treino
+    """
+    if path not in _loaded_tables:
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as f:
+            _loaded_tables[path] = json.load(f)
+    return _loaded_tables[path]
+
+def seasonal_profile(table, lat_origem, lng_origem, lat_destino, lng_destino):
+    """
+    Perfil sazonal (12 meses) de uma rota: usa a rota exata quando conhecida,
+    senão a região da rota, senão fatores neutros.
+
+    Returns:
+        dict: 'level' ('lane', 'region' ou 'none') e listas 'factor', 'count' e 'std'
+    """
+    if table is not None:
+        perfil = table['lanes'].get(lane_key(lat_origem, lng_origem, lat_destino, lng_destino))
+        if perfil is not None:
+            return dict(perfil, level='lane')
+
+        regiao = region_key(lat_origem, lng_origem, lat_destino, lng_destino, grid_deg=table['grid_deg'])
+        perfil = table['regions'].get(regiao)
+        if perfil is not None:
+            return dict(perfil, level='region', region=regiao)
+
+    return {'level': 'none', 'factor': [1.0] * 12, 'count': [0.0] * 12, 'std': [None] * 12}
+
+def seasonal_factor(table, lat_origem, lng_origem, lat_destino, lng_destino, mes):
+    """
+    Fator sazonal de uma rota em um mês (ver seasonal_profile).
+
+    Returns:
+        dict: 'factor', 'count', 'std' e 'level' do mês consultado
+    """
+    perfil = seasonal_profile(table, lat_origem, lng_origem, lat_destino, lng_destino)
+    i = int(mes) - 1
+    return {
+        'factor': perfil['factor'][i],
+        'count': perfil['count'][i],
+        'std': perfil['std'][i],
+        'level': perfil['level'],
+    }
+
+def seasonal_factors(table, lat_origem, lng_origem, lat_destino, lng_destino, meses):
+    """
+    Versão em lote de seasonal_factor (uma busca por rota distinta).
+
+    Returns:
+        ndarray: Fator de cada consulta
+    """
+    fatores = np.ones(len(meses))
+    if table is None:
+        return fatores
+
+    perfis = {}
+    for i, (lat_o, lng_o, lat_d, lng_d, mes) in enumerate(
+            zip(lat_origem, lng_origem, lat_destino, lng_destino, meses)):
+        chave = (lat_o, lng_o, lat_d, lng_d)
+        if chave not in perfis:
+            perfis[chave] = seasonal_profile(table, lat_o, lng_o, lat_d, lng_d)['factor']
+        fatores[i] = perfis[chave][int(mes) - 1]
+    return fatores
+
+def main():
+    """Exibe o perfil sazonal de uma rota: python seasonality.py lat_o lng_o lat_d lng_d"""
+    if len(sys.argv) < 5:
+        print("Uso: python seasonality.py origem_lat origem_lng destino_lat destino_lng")
+        return
+
+    table = load_seasonality_table()
+    if table is None:
+        print(f"Tabela de sazonalidade não encontrada em {SEASONALITY_PATH} (execute train.py)")
+        return
+
+    perfil = seasonal_profile(table, *[float(v) for v in sys.argv[1:5]])
+    print(f"Perfil sazonal (nível: {perfil['level']})")
+    for mes in range(12):
+        std = perfil['std'][mes]
+        print(f"Mês {mes + 1:2d}: fator {perfil['factor'][mes]:.3f}  "
+              f"viagens {perfil['count'][mes]:6.0f}  "
+              f"desvio {'-' if std is None else f'{std:.3f}'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Serviço residente de predição de fretes (FastAPI).
+Mantém histórico, modelo e tabelas auxiliares carregados em memória e
+atende as cotações com o mesmo pipeline de predict.py, em lote: requisições
+concorrentes são agrupadas em micro-lotes (ver batching.py) e avaliadas com
+uma única busca vetorizada por rotas similares e uma única chamada ao modelo.
+Cotações idênticas simultâneas (ver quote_key) são calculadas uma única vez.
+
+Execução: python service.py  (porta em ML_SERVICE_PORT, default 8001)
+"""
+
+import os
+import time
+import threading
+import pandas as pd
+from datetime import datetime
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from predict import load_historical_data, load_model_and_scaler
+from batch_predict import predict_batch
+from seasonality import load_seasonality_table
+from residual_correction import load_residual_table, record_feedback
+from batching import MicroBatcher, MAX_BATCH_SIZE, MAX_WAIT_MS
+
+# Origem do preço de cada método (mesmos valores de predict_freight_price)
+PRICE_SOURCES = {
+    'geographic_coordinates': 'similar_routes',
+    'combined_geo_priority': 'combined',
+    'combined_balanced': 'combined',
+    'nearest_lanes': 'nearest_lanes',
+    'ml_model': 'ml_model',
+}
+
+# Componentes carregados na inicialização do serviço
+_state = {}
+
+# Serializa as gravações da tabela de correção residual
+_feedback_lock = threading.Lock()
+
+def load_service_state():
+    """Carrega histórico, modelo e sazonalidade e aquece os índices do histórico."""
+    model, scaler, features, metadata = load_model_and_scaler()
+    _state.update({
+        'historical_data': load_historical_data(),
+        'model': model,
+        'scaler': scaler,
+        'features': features,
+        'metadata': metadata,
+        'seasonality': load_seasonality_table(),
+    })
+    # Constrói os índices (rotas, faixa de KM, KDTree) antes da primeira requisição
+    predict_quotes([{'originLat': -25.5, 'originLng': -54.6, 'destLat': -25.5,
+                     'destLng': -54.6, 'totalDistance': 100}])
+
+def parse_quote(input_data):
+    """
+    Converte uma requisição (mesmo formato do JSON de predict.py) em uma consulta.
+
+    Returns:
+        dict: Consulta com coordenadas, KM e mês
+
+    Raises:
+        ValueError: Se algum campo não puder ser convertido
+    """
+    mes = int(input_data.get('month', datetime.now().month))
+    if mes < 1 or mes > 12:
+        raise ValueError(f"Mês inválido: {mes}")
+    return {
+        'Lat_Origem': float(input_data.get('originLat', 0)),
+        'Lng_Origem': float(input_data.get('originLng', 0)),
+        'Lat_Destino': float(input_data.get('destLat', 0)),
+        'Lng_Destino': float(input_data.get('destLng', 0)),
+        'KM': float(input_data.get('totalDistance', 0)),
+        'Mês': mes,
+    }
+
+def quote_key(input_data):
+    """
+    Chave normalizada de uma requisição para o agrupamento de requisições
+    idênticas em andamento (coordenadas com 5 casas, KM com 1 casa e mês).
+
+    Returns:
+        tuple: Chave, ou None se a requisição for inválida (avaliada isoladamente)
+    """
+    try:
+        consulta = parse_quote(input_data)
+    except (ValueError, TypeError):
+        return None
+    return (round(consulta['Lat_Origem'], 5), round(consulta['Lng_Origem'], 5),
+            round(consulta['Lat_Destino'], 5), round(consulta['Lng_Destino'], 5),
+            round(consulta['KM'], 1), consulta['Mês'])
+
+def _method_message(method, num_routes, num_lanes, nearest_distance):
+    """Resumo do método da predição (mesmas mensagens de predict_freight_price)."""
+    if method in ('geographic_coordinates', 'combined_geo_priority', 'combined_balanced'):
+        return f"Predição baseada em {num_routes} rota(s) similar(es) e modelo ML"
+    if method == 'nearest_lanes':
+        return f"Predição baseada nas {num_lanes} rota(s) mais próxima(s) (a {nearest_distance:.0f}km) e modelo ML"
+    return "Predição baseada no modelo ML"
+
+def _explanation(prediction, confidence, message):
+    """Explicação resumida da predição (formato de data_processor.explain_prediction)."""
+    if confidence < 0.5:
+        confianca_texto = "baixa"
+    elif confidence < 0.8:
+        confianca_texto = "moderada"
+    else:
+        confianca_texto = "alta"
+    return (
+        f"Preço recomendado: R$ {prediction:.2f}\n"
+        f"Confiança: {round(confidence * 100, 1)}% ({confianca_texto})\n"
+        f"{message}\n"
+    )
+
+def predict_quotes(requests):
+    """
+    Prediz um lote de cotações com o pipeline padrão (predict.py).
+    Requisições inválidas recebem erro individual sem afetar as demais.
+
+    Args:
+        requests (list): Requisições no formato do JSON de predict.py
+
+    Returns:
+        list: Resultados no formato do servidor, na mesma ordem
+    """
+    resultados = [None] * len(requests)
+    consultas, posicoes = [], []
+    for i, input_data in enumerate(requests):
+        try:
+            consultas.append(parse_quote(input_data))
+            posicoes.append(i)
+        except (ValueError, TypeError) as e:
+            resultados[i] = {"success": False, "error": f"Erro de conversão de dados: {str(e)}"}
+
+    if consultas:
+        try:
+            queries = pd.DataFrame(consultas)
+            # A tabela de correção residual é relida quando o arquivo muda (feedback recente)
+            pred = predict_batch(queries, _state['historical_data'], _state['model'], _state['scaler'],
+                                 _state['features'], seasonality=_state['seasonality'],
+                                 residuals=load_residual_table())['standard']
+        except Exception as e:
+            erro = {"success": False, "error": f"Erro durante a predição: {str(e)}"}
+            for i in posicoes:
+                resultados[i] = erro
+            return resultados
+
+        for i, preco, confianca, metodo, num_rotas, num_vizinhas, distancia in zip(
+                posicoes, pred['prediction'], pred['confidence'], pred['method'], pred['num_routes'],
+                pred['num_lanes'], pred['nearest_distance']):
+            confianca = float(confianca)
+            mensagem = _method_message(str(metodo), int(num_rotas), int(num_vizinhas), float(distancia))
+            resultados[i] = {
+                "success": True,
+                "recommendedPrice": float(preco),
+                "confidence": round(confianca * 100, 1),
+                "explanation": _explanation(float(preco), confianca, mensagem),
+                "method": str(metodo),
+                "details": {
+                    "confidence": confianca,
+                    "confidence_pct": round(confianca * 100, 1),
+                    "num_routes": int(num_rotas),
+                    "price_source": PRICE_SOURCES.get(str(metodo), str(metodo)),
+                }
+            }
+    return resultados
+
+batcher = MicroBatcher(predict_quotes,
+                       max_batch_size=int(os.environ.get('ML_BATCH_SIZE', MAX_BATCH_SIZE)),
+                       max_wait_ms=float(os.environ.get('ML_BATCH_WAIT_MS', MAX_WAIT_MS)),
+                       key_fn=quote_key)
+
+@asynccontextmanager
+async def lifespan(app):
+    """Carrega os componentes e inicia o consumidor de micro-lotes."""
+    load_service_state()
+    await batcher.start()
+    yield
+    await batcher.stop()
+
+app = FastAPI(title="Serviço de predição de fretes", lifespan=lifespan)
+
+@app.get("/health")
+async def health():
+    """Estado do serviço e estatísticas dos micro-lotes."""
+    return {
+        "status": "ok",
+        "model": _state.get('metadata', {}).get('model_type'),
+        "historical_rows": len(_state['historical_data']) if 'historical_data' in _state else 0,
+        "batching": batcher.stats,
+    }
+
+@app.post("/predict")
+async def predict(input_data: dict):
+    """
+    Cotação individual (agrupada com requisições concorrentes em micro-lotes;
+    requisições idênticas em andamento compartilham o mesmo resultado).
+    """
+    return await batcher.submit(input_data)
+
+@app.post("/predict/batch")
+def predict_many(requests: list[dict]):
+    """Lote explícito de cotações (avaliado diretamente em uma única chamada)."""
+    inicio = time.perf_counter()
+    resultados = predict_quotes(requests)
+    return {"results": resultados, "elapsed_ms": round((time.perf_counter() - inicio) * 1000, 1)}
+
+@app.post("/feedback")
+def feedback(input_data: dict):
+    """Registra um feedback na correção residual (vale a partir da próxima cotação)."""
+    with _feedback_lock:
+        return record_feedback(input_data)
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host=os.environ.get('ML_SERVICE_HOST', '127.0.0.1'),
+                port=int(os.environ.get('ML_SERVICE_PORT', 8001)))
@@ -0,0 +1,378 @@
+"""
+Módulo de índice espacial para a busca de rotas similares.
+Mantém visões NumPy das coordenadas do histórico, agrupadas por ponto de
+origem, ponto de destino e rota, para que cada busca calcule distâncias
+apenas sobre os pontos distintos e aloque memória proporcional às
+viagens encontradas (e não ao tamanho do histórico).
+
+As distâncias são calculadas com haversine vetorizada (esfera), que difere
+da distância geodésica do geopy (elipsoide WGS-84) em até ~0,6% (cerca de
+0,3 km a 50 km; na região do histórico, de -0,22% a +0,55%). Essa diferença
+decidiria se rotas próximas do limite do raio entram ou não na busca; por
+isso, as distâncias dentro dessa margem do raio são recalculadas com a
+geodésica (ver geodesic_near_radius) e as rotas encontradas são as mesmas
+da busca geodésica original. A pontuação de similaridade usa a distância
+haversine (diferença desprezível na ponderação).
+"""
+
+import weakref
+import numpy as np
+from geopy.distance import geodesic
+
+# Raio médio da Terra (km) usado nos cálculos vetorizados de distância
+EARTH_RADIUS_KM = 6371.0088
+
+# Diferença relativa máxima entre haversine e a distância geodésica (com folga)
+HAVERSINE_MAX_ERROR = 0.006
+
+# Resultado compacto da busca: linha (posição no histórico), distâncias e pontuação
+SIMILAR_ROUTE_DTYPE = np.dtype([
+    ('row', np.int64),
+    ('distancia_origem', np.float32),
+    ('distancia_destino', np.float32),
+    ('similarity_score', np.float32),
+])
+
+# Índices construídos por DataFrame histórico (chave: id do DataFrame)
+_frame_cache = {}
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """
+    Calcula a distância em km entre pares de coordenadas (fórmula de haversine).
+    Aceita escalares ou arrays NumPy e respeita as regras de broadcasting,
+    permitindo calcular matrizes de distância consulta × histórico de uma vez.
+
+    Args:
+        lat1, lng1: Latitude/longitude do(s) primeiro(s) ponto(s)
+        lat2, lng2: Latitude/longitude do(s) segundo(s) ponto(s)
+
+    Returns:
+        ndarray: Distâncias em km
+    """
+    lat1 = np.radians(np.asarray(lat1, dtype=np.float64))
+    lng1 = np.radians(np.asarray(lng1, dtype=np.float64))
+    lat2 = np.radians(np.asarray(lat2, dtype=np.float64))
+    lng2 = np.radians(np.asarray(lng2, dtype=np.float64))
+
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def geodesic_near_radius(dist, lat1, lng1, lat2, lng2, radii, candidates=None):
+    """
+    Recalcula com a distância geodésica (geopy) as distâncias haversine que
+    estão a menos de HAVERSINE_MAX_ERROR de algum dos raios, onde a diferença
+    entre as duas decide se o ponto está dentro ou fora. As demais (a grande
+    maioria) ficam com a haversine vetorizada.
+
+    Args:
+        dist (ndarray): Distâncias haversine (atualizadas no próprio array)
+        lat1, lng1, lat2, lng2: Coordenadas que geraram dist (com broadcasting)
+        radii (float or sequence): Raio(s) da busca em km
+        candidates (ndarray, optional): Máscara das posições que ainda podem
+            ficar dentro do raio (ex.: a outra ponta da rota também está perto)
+
+    Returns:
+        ndarray: dist, com as distâncias próximas do raio geodésicas
+    """
+    raios = np.atleast_1d(np.asarray(radii, dtype=np.float64))
+    perto = np.zeros(dist.shape, dtype=bool)
+    for raio in raios:
+        perto |= np.abs(dist - raio) <= raio * HAVERSINE_MAX_ERROR
+    if candidates is not None:
+        perto &= candidates
+    if perto.any():
+        # Cada par de pontos distinto é calculado uma vez (rotas podem compartilhar a mesma origem)
+        pares = np.column_stack([np.broadcast_to(c, dist.shape)[perto] for c in (lat1, lng1, lat2, lng2)])
+        distintos, inverso = np.unique(pares, axis=0, return_inverse=True)
+        geodesicas = np.array([geodesic((a, b), (c, d)).kilometers for a, b, c, d in distintos])
+        dist[perto] = geodesicas[inverso.ravel()]
+    return dist
+
+def cached_for_frame(historical_data, name, builder):
+    """
+    Retorna uma estrutura derivada do DataFrame histórico, construindo-a
+    apenas na primeira chamada. A entrada é descartada quando o DataFrame
+    deixa de existir. O histórico deve ser tratado como somente leitura.
+
+    Args:
+        historical_data (DataFrame): DataFrame com os dados históricos
+        name (str): Nome da estrutura (ex.: 'similarity_index')
+        builder (callable): Função que recebe o DataFrame e constrói a estrutura
+
+    Returns:
+        object: Estrutura construída por builder
+    """
+    chave = id(historical_data)
+    entrada = _frame_cache.get(chave)
+    if entrada is None or entrada['ref']() is not historical_data:
+        entrada = {'ref': weakref.ref(historical_data), 'items': {}}
+        _frame_cache[chave] = entrada
+        weakref.finalize(historical_data, _frame_cache.pop, chave, None)
+
+    if name not in entrada['items']:
+        entrada['items'][name] = builder(historical_data)
+    return entrada['items'][name]
+
+def _unique_points(lat, lng):
+    """Pontos distintos e o índice do ponto de cada linha."""
+    pontos, inverso = np.unique(np.column_stack([lat, lng]), axis=0, return_inverse=True)
+    return pontos, inverso.ravel()
+
+def build_similarity_index(historical_data):
+    """
+    Constrói o índice de busca a partir das colunas de coordenadas.
+
+    Args:
+        historical_data (DataFrame): DataFrame com os dados históricos
+
+    Returns:
+        dict: Pontos distintos de origem/destino, rotas (pares origem-destino),
+              as linhas de cada rota em formato CSR ('lane_offsets', 'lane_rows')
+              e os agregados por rota (contagem, soma de preços e de km)
+    """
+    origens, origem_id = _unique_points(historical_data['Lat_Origem'].to_numpy(),
+                                        historical_data['Lng_Origem'].to_numpy())
+    destinos, destino_id = _unique_points(historical_data['Lat_Destino'].to_numpy(),
+                                          historical_data['Lng_Destino'].to_numpy())
+
+    pares = origem_id.astype(np.int64) * len(destinos) + destino_id
+    rotas, row_lane = np.unique(pares, return_inverse=True)
+    row_lane = row_lane.ravel()
+
+    lane_rows = np.argsort(row_lane, kind='stable')
+    lane_count = np.bincount(row_lane, minlength=len(rotas))
+    lane_offsets = np.concatenate(([0], np.cumsum(lane_count)))
+
+    precos = historical_data['Frete Carreteiro'].to_numpy(dtype=np.float64)
+    kms = historical_data['KM'].to_numpy(dtype=np.float64)
+
+    return {
+        'origin_points': origens,
+        'destination_points': destinos,
+        'lane_origin': (rotas // len(destinos)).astype(np.int64),
+        'lane_destination': (rotas % len(destinos)).astype(np.int64),
+        'lane_offsets': lane_offsets,
+        'lane_rows': lane_rows,
+        'row_lane': row_lane,
+        'lane_count': lane_count.astype(np.float64),
+        'lane_price_sum': np.bincount(row_lane, weights=precos, minlength=len(rotas)),
+        'lane_km_sum': np.bincount(row_lane, weights=kms, minlength=len(rotas)),
+    }
+
+def get_similarity_index(historical_data):
+    """Retorna o índice de busca do DataFrame histórico (construído uma única vez)."""
+    return cached_for_frame(historical_data, 'similarity_index', build_similarity_index)
+
+def _lane_distances(index, lat_origem, lng_origem, lat_destino, lng_destino, radii):
+    """
+    Distâncias da consulta até a origem e o destino de cada rota do índice
+    (geodésicas perto dos raios, ver geodesic_near_radius).
+    """
+    origens, destinos = index['origin_points'], index['destination_points']
+    dist_origem = geodesic_near_radius(haversine_km(lat_origem, lng_origem, origens[:, 0], origens[:, 1]),
+                                       lat_origem, lng_origem, origens[:, 0], origens[:, 1], radii)
+    dist_destino = geodesic_near_radius(haversine_km(lat_destino, lng_destino, destinos[:, 0], destinos[:, 1]),
+                                        lat_destino, lng_destino, destinos[:, 0], destinos[:, 1], radii)
+    return dist_origem[index['lane_origin']], dist_destino[index['lane_destination']]
+
+def _expand_lanes(index, lanes, limit=None):
+    """Linhas do histórico pertencentes às rotas informadas (CSR), até limit linhas."""
+    inicio = index['lane_offsets'][lanes]
+    contagem = index['lane_offsets'][lanes + 1] - inicio
+    if limit is not None:
+        anteriores = np.cumsum(contagem) - contagem
+        contagem = np.clip(limit - anteriores, 0, contagem)
+    total = int(contagem.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64), contagem
+
+    deslocamento = np.repeat(inicio - np.concatenate(([0], np.cumsum(contagem)[:-1])), contagem)
+    return index['lane_rows'][deslocamento + np.arange(total)], contagem
+
+def search_similar_routes(historical_data, lat_origem, lng_origem, lat_destino, lng_destino, radius_km=50):
+    """
+    Busca de baixo nível por rotas similares (mesmo critério de find_similar_routes).
+    Trabalha sobre o índice de coordenadas sem copiar o DataFrame.
+
+    Args:
+        historical_data (DataFrame): DataFrame com os dados históricos
+        lat_origem, lng_origem, lat_destino, lng_destino (float): Coordenadas da consulta
+        radius_km (float): Raio em km para busca (default: 50)
+
+    Returns:
+        ndarray: Array estruturado (SIMILAR_ROUTE_DTYPE) com uma entrada por
+                 viagem encontrada, agrupadas por rota
+    """
+    if len(historical_data) == 0:
+        return np.zeros(0, dtype=SIMILAR_ROUTE_DTYPE)
+
+    index = get_similarity_index(historical_data)
+    dist_origem, dist_destino = _lane_distances(index, lat_origem, lng_origem, lat_destino, lng_destino,
+                                                radius_km)
+
+    rotas = np.nonzero((dist_origem <= radius_km) & (dist_destino <= radius_km))[0]
+    score = _lane_scores(dist_origem, dist_destino, radius_km)
+    return _matches_for_lanes(index, rotas, dist_origem, dist_destino, score)
+
+def _lane_scores(dist_origem, dist_destino, radius_km):
+    """Pontuação de similaridade de cada rota (máximo 100: 50 origem + 50 destino)."""
+    return (1 - dist_origem / radius_km) * 50 + (1 - dist_destino / radius_km) * 50
+
+def _matches_for_lanes(index, rotas, dist_origem, dist_destino, score, limit=None):
+    """Monta o array estruturado com as viagens das rotas informadas (na ordem dada)."""
+    linhas, contagem = _expand_lanes(index, rotas, limit=limit)
+
+    resultado = np.empty(len(linhas), dtype=SIMILAR_ROUTE_DTYPE)
+    resultado['row'] = linhas
+    resultado['distancia_origem'] = np.repeat(dist_origem[rotas], contagem)
+    resultado['distancia_destino'] = np.repeat(dist_destino[rotas], contagem)
+    resultado['similarity_score'] = np.repeat(score[rotas], contagem)
+    return resultado
+
+def summarize_similar_routes(historical_data, lat_origem, lng_origem, lat_destino, lng_destino,
+                             radius_km=50, k=5):
+    """
+    Busca por rotas similares em modo top-k: calcula os agregados usados pela
+    predição (preço ponderado pela similaridade, score médio e confiança) em
+    uma única passada pelas rotas encontradas e retorna apenas as k viagens
+    mais similares, selecionadas com argpartition (sem ordenar todas).
+
+    Args:
+        historical_data (DataFrame): DataFrame com os dados históricos
+        lat_origem, lng_origem, lat_destino, lng_destino (float): Coordenadas da consulta
+        radius_km (float): Raio em km para busca (default: 50)
+        k (int): Quantidade de viagens mais similares retornadas
+
+    Returns:
+        dict: 'num_routes', 'score_sum', 'avg_similarity', 'weighted_price'
+              (não arredondado), 'price_sum', 'km_sum', 'confidence' (mesma
+              fórmula de get_most_similar_price) e 'top' (array estruturado com
+              até k viagens, da mais para a menos similar)
+    """
+    resumo = {
+        'num_routes': 0, 'score_sum': 0.0, 'avg_similarity': 0.0, 'weighted_price': None,
+        'price_sum': 0.0, 'km_sum': 0.0, 'confidence': 0.0,
+        'top': np.zeros(0, dtype=SIMILAR_ROUTE_DTYPE),
+    }
+    if len(historical_data) == 0:
+        return resumo
+
+    index = get_similarity_index(historical_data)
+    dist_origem, dist_destino = _lane_distances(index, lat_origem, lng_origem, lat_destino, lng_destino,
+                                                radius_km)
+
+    rotas = np.nonzero((dist_origem <= radius_km) & (dist_destino <= radius_km))[0]
+    if len(rotas) == 0:
+        return resumo
+
+    score = _lane_scores(dist_origem, dist_destino, radius_km)
+    contagem = index['lane_count'][rotas]
+    num_rotas = int(contagem.sum())
+    score_total = float(np.dot(score[rotas], contagem))
+
+    resumo['num_routes'] = num_rotas
+    resumo['score_sum'] = score_total
+    resumo['avg_similarity'] = score_total / num_rotas
+    resumo['price_sum'] = float(index['lane_price_sum'][rotas].sum())
+    resumo['km_sum'] = float(index['lane_km_sum'][rotas].sum())
+    if score_total > 0:
+        resumo['weighted_price'] = float(np.dot(score[rotas], index['lane_price_sum'][rotas]) / score_total)
+    else:
+        resumo['weighted_price'] = resumo['price_sum'] / num_rotas
+
+    # Confiança: número de rotas (satura em 10) e score médio (máximo 100)
+    confianca = min(num_rotas / 10, 1.0) * 0.4 + (resumo['avg_similarity'] / 100) * 0.6
+    resumo['confidence'] = min(confianca, 1.0)
+
+    # As k melhores viagens estão nas k rotas de maior pontuação
+    if k is not None and k < len(rotas):
+        melhores = rotas[np.argpartition(-score[rotas], k - 1)[:k]]
+    else:
+        melhores = rotas
+    melhores = melhores[np.lexsort((melhores, -score[melhores]))]
+    resumo['top'] = _matches_for_lanes(index, melhores, dist_origem, dist_destino, score, limit=k)
+    return resumo
+
+def summarize_by_radius(historical_data, lat_origem, lng_origem, lat_destino, lng_destino,
+                        radii=(10, 30, 50, 100, 150)):
+    """
+    Agregados da busca por rotas similares para vários raios de uma só vez.
+    As distâncias até as rotas são calculadas uma única vez; cada raio só
+    aplica a sua máscara e a sua pontuação (matriz raios × rotas).
+
+    Args:
+        historical_data (DataFrame): DataFrame com os dados históricos
+        lat_origem, lng_origem, lat_destino, lng_destino (float): Coordenadas da consulta
+        radii (sequence): Raios em km
+
+    Returns:
+        dict: Arrays alinhados com radii: 'radius', 'num_routes', 'avg_similarity',
+              'weighted_price' (NaN sem rotas) e 'confidence' (mesmas fórmulas de
+              summarize_similar_routes)
+    """
+    raios = np.asarray(radii, dtype=np.float64)
+    resumo = {
+        'radius': raios,
+        'num_routes': np.zeros(len(raios), dtype=np.int64),
+        'avg_similarity': np.zeros(len(raios)),
+        'weighted_price': np.full(len(raios), np.nan),
+        'confidence': np.zeros(len(raios)),
+    }
+    if len(historical_data) == 0 or len(raios) == 0:
+        return resumo
+
+    index = get_similarity_index(historical_data)
+    dist_origem, dist_destino = _lane_distances(index, lat_origem, lng_origem, lat_destino, lng_destino, raios)
+
+    # Apenas rotas dentro do maior raio participam
+    candidatas = np.nonzero(np.maximum(dist_origem, dist_destino) <= raios.max())[0]
+    if len(candidatas) == 0:
+        return resumo
+
+    d_o = dist_origem[candidatas][None, :]
+    d_d = dist_destino[candidatas][None, :]
+    r = raios[:, None]
+    dentro = (d_o <= r) & (d_d <= r)
+    score = _lane_scores(d_o, d_d, r) * dentro
+
+    contagem = index['lane_count'][candidatas]
+    num_rotas = dentro @ contagem
+    score_total = score @ contagem
+    precos = index['lane_price_sum'][candidatas]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        score_medio = np.where(num_rotas > 0, score_total / num_rotas, 0.0)
+        ponderado = np.where(score_total > 0, (score @ precos) / score_total, (dentro @ precos) / num_rotas)
+
+    resumo['num_routes'] = num_rotas.astype(np.int64)
+    resumo['avg_similarity'] = score_medio
+    resumo['weighted_price'] = np.where(num_rotas > 0, ponderado, np.nan)
+    confianca = np.minimum(num_rotas / 10, 1.0) * 0.4 + (score_medio / 100) * 0.6
+    resumo['confidence'] = np.where(num_rotas > 0, np.minimum(confianca, 1.0), 0.0)
+    return resumo
+
+def matches_to_frame(historical_data, matches, columns=('Frete Carreteiro', 'KM', 'Mês')):
+    """
+    Monta a visão em DataFrame (registros) de um resultado de busca, ordenada
+    da maior para a menor similaridade. Só deve ser chamada quando o chamador
+    precisa dos registros completos.
+
+    Args:
+        historical_data (DataFrame): DataFrame com os dados históricos
+        matches (ndarray): Resultado de search_similar_routes
+        columns (tuple): Colunas do histórico incluídas nos registros
+
+    Returns:
+        DataFrame: Colunas do histórico + distancia_origem, distancia_destino
+                   e similarity_score
+    """
+    ordem = np.argsort(-matches['similarity_score'], kind='stable')
+    selecionados = matches[ordem]
+
+    registros = historical_data.iloc[selecionados['row']][list(columns)]
+    return registros.assign(
+        distancia_origem=selecionados['distancia_origem'].astype(np.float64),
+        distancia_destino=selecionados['distancia_destino'].astype(np.float64),
+        similarity_score=selecionados['similarity_score'].astype(np.float64),
+    )
@@ -0,0 +1,312 @@
+"""
+Módulo de inferência em estágios (staged) do GradientBoosting.
+A predição de um GradientBoosting é a soma das contribuições das árvores
+(estágios); parar após as k primeiras árvores troca precisão por tempo.
+
+Para poucas linhas (requisições individuais), as árvores são compiladas em
+arrays planos (feature, limiar, filhos e valor de cada nó, com a taxa de
+aprendizado já aplicada) e percorridas de forma vetorizada para todas as
+linhas e árvores ao mesmo tempo, sem a validação de entrada do scikit-learn
+a cada chamada. Para lotes maiores, o staged_predict do próprio scikit-learn
+(Cython) é interrompido no estágio k. O custo fixo e o custo por linha e por
+estágio de cada caminho são usados para escolher k dentro de um orçamento de
+latência.
+
+No treino, staged_accuracy_table mede a perda de precisão por k (staged_predict
+no conjunto de teste, em uma única passada) e os custos são medidos uma vez;
+ambos são gravados nos metadados do modelo. Na predição, os custos gravados
+são registrados ao carregar o modelo (register_costs): o mesmo orçamento
+resulta sempre nos mesmos estágios, sem medir nada durante a requisição.
+"""
+
+import sys
+import time
+import weakref
+import itertools
+import numpy as np
+
+# Menor quantidade de estágios usada em qualquer orçamento
+MIN_STAGES = 10
+
+# Quantidades de estágios avaliadas na tabela de precisão
+STAGE_GRID = [5, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100, 150, 200, 300, 500]
+
+# Até quantas linhas a travessia compilada é mais rápida que o staged_predict
+SMALL_BATCH_ROWS = 32
+
+# Modelos compilados e custos gravados no treino, por modelo carregado (sem
+# manter vivos os modelos descartados: predict carrega o modelo a cada predição)
+_compiled_models = weakref.WeakKeyDictionary()
+_registered_costs = weakref.WeakKeyDictionary()
+
+def is_staged_model(model):
+    """Indica se o modelo é um GradientBoosting de regressão (árvores em estágios)."""
+    return hasattr(model, 'estimators_') and hasattr(model, 'learning_rate') and hasattr(model, 'init_')
+
+def compile_trees(arvores, scale=1.0):
+    """
+    Compila árvores de regressão do scikit-learn em arrays planos.
+
+    Args:
+        arvores (list): Objetos tree_ das árvores
+        scale (float): Multiplicador dos valores das folhas (taxa de aprendizado)
+
+    Returns:
+        dict: Arrays dos nós (n_árvores × máx. de nós) e profundidade máxima
+    """
+    n_arvores, max_nos = len(arvores), max(arvore.node_count for arvore in arvores)
+
+    feature = np.zeros((n_arvores, max_nos), dtype=np.int64)
+    threshold = np.full((n_arvores, max_nos), np.inf)
+    indices = np.arange(max_nos)
+    left = np.tile(indices, (n_arvores, 1))
+    right = np.tile(indices, (n_arvores, 1))
+    value = np.zeros((n_arvores, max_nos))
+
+    for t, arvore in enumerate(arvores):
+        n = arvore.node_count
+        internos = arvore.children_left[:n] >= 0
+        # Folhas apontam para si mesmas: a travessia fica parada após alcançá-las
+        feature[t, :n] = np.where(internos, arvore.feature[:n], 0)
+        threshold[t, :n] = np.where(internos, arvore.threshold[:n], np.inf)
+        left[t, :n] = np.where(internos, arvore.children_left[:n], indices[:n])
+        right[t, :n] = np.where(internos, arvore.children_right[:n], indices[:n])
+        value[t, :n] = arvore.value[:n, 0, 0] * scale
+
+    return {
+        'feature': feature,
+        'threshold': threshold,
+        'left': left,
+        'right': right,
+        'value': value,
+        'depth': max(arvore.max_depth for arvore in arvores),
+    }
+
+def tree_outputs(compiled, X, k):
+    """
+    Valor da folha alcançada em cada uma das k primeiras árvores compiladas,
+    em uma travessia vetorizada de todas as linhas e árvores juntas.
+
+    Returns:
+        ndarray: Matriz n × k
+    """
+    # As árvores do scikit-learn comparam as features em float32
+    X = np.asarray(X, dtype=np.float32)
+    arvores = np.arange(k)
+    feature, threshold = compiled['feature'][:k], compiled['threshold'][:k]
+    left, right = compiled['left'][:k], compiled['right'][:k]
+    nos = np.zeros((len(X), k), dtype=np.int64)
+    for _ in range(compiled['depth']):
+        valores = np.take_along_axis(X, feature[arvores, nos], axis=1)
+        nos = np.where(valores <= threshold[arvores, nos], left[arvores, nos], right[arvores, nos])
+    return compiled['value'][arvores, nos]
+
+def compile_staged_model(model, calibrate=True):
+    """
+    Compila as árvores do GradientBoosting em arrays planos.
+
+    Args:
+        model (GradientBoostingRegressor): Modelo treinado
+        calibrate (bool): Mede o custo por linha e por estágio (sem medir, os
+            custos são os registrados para o modelo ou medidos no primeiro uso)
+
+    Returns:
+        dict: Arrays dos nós (ver compile_trees), valor inicial, total de
+              estágios e custos
+    """
+    n_features = model.n_features_in_
+    inicial = 0.0 if model.init_ == 'zero' else float(model.init_.predict(np.zeros((1, n_features)))[0])
+
+    compiled = compile_trees([estimador.tree_ for estimador in model.estimators_[:, 0]], model.learning_rate)
+    compiled.update({
+        'init': inicial,
+        'n_stages': len(model.estimators_),
+        'n_features': n_features,
+        # Referência fraca: o modelo compilado fica no cache enquanto o modelo existir
+        'model': weakref.ref(model),
+        'costs': _registered_costs.get(model),
+    })
+    if calibrate:
+        calibrate_costs(compiled)
+    return compiled
+
+def get_staged_model(model):
+    """Retorna o modelo compilado (compilado uma vez por modelo carregado)."""
+    if model not in _compiled_models:
+        _compiled_models[model] = compile_staged_model(model, calibrate=False)
+    return _compiled_models[model]
+
+def register_costs(model, costs):
+    """
+    Registra para o modelo carregado os custos medidos no treino (metadados
+    'staged_inference_costs'). Sem custos gravados (modelo antigo), eles são
+    medidos no primeiro uso.
+    """
+    if costs is None or not is_staged_model(model):
+        return
+    _registered_costs[model] = costs
+    if model in _compiled_models:
+        _compiled_models[model]['costs'] = costs
+
+def staged_costs(compiled):
+    """Custos do modelo compilado (gravados no treino, ou medidos uma vez se não houver)."""
+    if compiled['costs'] is None:
+        calibrate_costs(compiled)
+    return compiled['costs']
+
+def _predict_compiled(compiled, X, k):
+    """Soma das k primeiras árvores compiladas (ver tree_outputs)."""
+    saida = np.full(len(X), compiled['init'])
+    if k == 0 or len(X) == 0:
+        return saida
+    return saida + tree_outputs(compiled, X, k).sum(axis=1)
+
+def _predict_sklearn(compiled, X, k):
+    """staged_predict do scikit-learn interrompido no estágio k."""
+    if k == 0:
+        return np.full(len(X), compiled['init'])
+    return next(itertools.islice(compiled['model']().staged_predict(X), k - 1, None))
+
+def _path(n_rows):
+    """Caminho de predição usado para um lote de n_rows linhas."""
+    return 'compiled' if n_rows <= SMALL_BATCH_ROWS else 'sklearn'
+
+def predict_staged(compiled, X, n_stages=None):
+    """
+    Predição com as n_stages primeiras árvores (mesmo resultado de staged_predict).
+
+    Args:
+        compiled (dict): Modelo compilado (ver compile_staged_model)
+        X (ndarray): Matriz n × n_features (já padronizada)
+        n_stages (int, optional): Estágios usados (default: todos)
+
+    Returns:
+        ndarray: Predições
+    """
+    k = compiled['n_stages'] if n_stages is None else int(min(max(n_stages, 0), compiled['n_stages']))
+    if _path(len(X)) == 'compiled':
+        return _predict_compiled(compiled, X, k)
+    return _predict_sklearn(compiled, X, k)
+
+def calibrate_costs(compiled, repeats=20):
+    """
+    Mede, para cada caminho, o custo fixo de uma chamada e o custo por linha
+    e por estágio (µs), preenchendo 'costs' do modelo compilado.
+    """
+    X = np.random.default_rng(0).normal(size=(4 * SMALL_BATCH_ROWS, compiled['n_features']))
+    total = compiled['n_stages']
+
+    def tempo(funcao, X, k):
+        funcao(compiled, X, k)
+        inicio = time.perf_counter()
+        for _ in range(repeats):
+            funcao(compiled, X, k)
+        return (time.perf_counter() - inicio) / repeats * 1e6
+
+    custos = {}
+    for caminho, funcao, linhas in (('compiled', _predict_compiled, SMALL_BATCH_ROWS),
+                                    ('sklearn', _predict_sklearn, len(X))):
+        base = tempo(funcao, X[:1], 1)
+        por_estagio = max(tempo(funcao, X[:linhas], total) - tempo(funcao, X[:linhas], 1), 0.0)
+        custos[caminho] = {'base_us': round(base, 2),
+                           'stage_row_us': round(por_estagio / (linhas * max(total - 1, 1)), 5)}
+    compiled['costs'] = custos
+    return compiled
+
+def estimated_latency_ms(compiled, n_stages, n_rows=1):
+    """Latência estimada (ms) de uma predição com n_stages estágios para n_rows linhas."""
+    custo = staged_costs(compiled)[_path(n_rows)]
+    return (custo['base_us'] + custo['stage_row_us'] * n_stages * n_rows) / 1000
+
+def stages_for_budget(compiled, latency_budget_ms, n_rows=1, min_stages=MIN_STAGES, n_models=1):
+    """
+    Quantidade de estágios que cabe no orçamento de latência (pelo custo medido).
+    Nunca usa menos que min_stages, mesmo que o orçamento seja menor.
+
+    Args:
+        n_models (int): Modelos do mesmo formato avaliados com os mesmos
+            estágios dentro do orçamento (ex.: modelos de quantis do intervalo)
+
+    Returns:
+        int: Estágios a usar
+    """
+    if latency_budget_ms is None:
+        return compiled['n_stages']
+    custo = staged_costs(compiled)[_path(n_rows)]
+    disponivel = latency_budget_ms * 1000 - custo['base_us'] * n_models
+    k = int(disponivel / max(custo['stage_row_us'] * max(n_rows, 1) * n_models, 1e-9))
+    return int(min(max(k, min(min_stages, compiled['n_stages'])), compiled['n_stages']))
+
+def staged_accuracy_table(model, X, y, sample_weight=None, grid=STAGE_GRID):
+    """
+    Perda de precisão por quantidade de estágios, em uma única passada de staged_predict.
+
+    Args:
+        model (GradientBoostingRegressor): Modelo treinado
+        X (ndarray): Features padronizadas do conjunto de avaliação
+        y (array): Valores reais
+        sample_weight (array, optional): Peso de cada linha
+
+    Returns:
+        list: Uma linha por k com 'stages', 'mae', 'mape', 'mae_loss' (aumento
+              do MAE em relação ao modelo completo) e 'latency_ms' (estimada
+              para uma requisição individual)
+    """
+    y = np.asarray(y, dtype=np.float64)
+    w = np.ones(len(y)) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+    total = model.n_estimators_
+    ks = sorted({k for k in grid if k < total} | {total})
+    compiled = get_staged_model(model)
+
+    linhas = []
+    for k, predicao in enumerate(model.staged_predict(X), start=1):
+        if k not in ks:
+            continue
+        erro = np.abs(predicao - y)
+        linhas.append({
+            'stages': k,
+            'mae': round(float(np.average(erro, weights=w)), 3),
+            'mape': round(float(np.average(erro / np.abs(y), weights=w)), 5),
+            'latency_ms': round(estimated_latency_ms(compiled, k), 4),
+        })
+    mae_total = linhas[-1]['mae']
+    for linha in linhas:
+        linha['mae_loss'] = round(linha['mae'] - mae_total, 3)
+    return linhas
+
+def print_accuracy_table(table):
+    """Exibe a tabela de precisão por estágios."""
+    print(f"{'estágios':>9} {'MAE':>8} {'perda MAE':>10} {'MAPE':>8} {'latência':>10}")
+    for linha in table:
+        print(f"{linha['stages']:>9} {linha['mae']:>8.2f} {linha['mae_loss']:>+10.2f} "
+              f"{linha['mape'] * 100:>7.2f}% {linha['latency_ms']:>8.3f}ms")
+
+def main():
+    """
+    Tabela de precisão por estágios do modelo atual, avaliada no histórico:
+    python staged_inference.py
+    """
+    from predict import load_historical_data, load_model_and_scaler
+    from data_processor import get_feature_builder, build_feature_matrix
+
+    model, scaler, features, _ = load_model_and_scaler()
+    if not is_staged_model(model):
+        print("O modelo atual não é um GradientBoosting")
+        sys.exit(1)
+
+    historico = load_historical_data()
+    X = build_feature_matrix(
+        get_feature_builder(features, scaler), historico['KM'].to_numpy(dtype=np.float64),
+        historico['Mês'].to_numpy(), historico['Ano'].to_numpy(),
+        historico['Lat_Origem'].to_numpy(dtype=np.float64), historico['Lng_Origem'].to_numpy(dtype=np.float64),
+        historico['Lat_Destino'].to_numpy(dtype=np.float64), historico['Lng_Destino'].to_numpy(dtype=np.float64),
+        valor_por_km=historico['Valor_por_km'].to_numpy(dtype=np.float64))
+
+    compiled = get_staged_model(model)
+    for caminho, custo in staged_costs(compiled).items():
+        print(f"Custo medido ({caminho}): {custo['base_us']:.1f}µs por chamada + "
+              f"{custo['stage_row_us']:.3f}µs por linha e estágio ({compiled['n_stages']} estágios)")
+    print_accuracy_table(staged_accuracy_table(model, X, historico['Frete Carreteiro']))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Script para testar os clusters de origens e destinos.
+Verifica a atribuição individual contra a em lote, a atualização incremental
+com novas viagens (comparada ao reagrupamento completo), a persistência e o
+uso dos clusters na feature store.
+"""
+
+import sys
+import os
+import time
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from ml_service.predict import load_historical_data
+from ml_service.clustering import (fit_clusters, assign_cluster, assign_clusters, update_clusters,
+                                   save_clusters, load_clusters, SIDE_COLUMNS)
+from ml_service.feature_store import build_feature_store, lookup_features, join_features, AGGREGATE_FEATURES
+
+def inertia(clusters, df):
+    """Distância quadrática média (km²) de cada ponto ao seu centroide, somada nos dois lados."""
+    return sum(np.mean(assign_clusters(clusters, lado, df[lat], df[lng])[1] ** 2)
+               for lado, (lat, lng) in SIDE_COLUMNS.items())
+
+def test_assignment():
+    """Atribuição individual e em lote devem coincidir; o ajuste é determinístico."""
+    print("\n=== Teste de Atribuição aos Clusters ===")
+    historico = load_historical_data()
+    clusters = fit_clusters(historico)
+    assert fit_clusters(historico)['version'] == clusters['version']
+
+    for lado, (lat, lng) in SIDE_COLUMNS.items():
+        lote, _ = assign_clusters(clusters, lado, historico[lat], historico[lng])
+        individual = [assign_cluster(clusters, lado, a, b)
+                      for a, b in zip(historico[lat].iloc[::20], historico[lng].iloc[::20])]
+        assert list(lote[::20]) == individual
+
+    inicio = time.perf_counter()
+    for _ in range(2000):
+        assign_cluster(clusters, 'origin', -25.1, -54.2)
+    print(f"Atribuição: {(time.perf_counter() - inicio) / 2000 * 1e6:.1f} µs por ponto "
+          f"({len(clusters['origin']['centroids'])} origens, {len(clusters['dest']['centroids'])} destinos)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        caminho = os.path.join(tmp, 'clusters.json')
+        save_clusters(clusters, caminho)
+        assert load_clusters(caminho)['version'] == clusters['version']
+
+def test_incremental_update():
+    """Atualizar com novas viagens deve se aproximar do reagrupamento completo."""
+    print("\n=== Teste da Atualização Incremental ===")
+    historico = load_historical_data()
+    antigas = np.random.default_rng(0).random(len(historico)) < 0.8
+
+    completo = fit_clusters(historico)
+    incremental = fit_clusters(historico[antigas])
+    versao = incremental['version']
+
+    inicio = time.perf_counter()
+    novos = update_clusters(incremental, historico[~antigas])
+    duracao = (time.perf_counter() - inicio) * 1000
+    print(f"{int((~antigas).sum())} viagens novas em {duracao:.1f}ms (clusters novos: {novos}) | "
+          f"inércia: incremental {inertia(incremental, historico):.0f} km², "
+          f"reagrupamento {inertia(completo, historico):.0f} km²")
+    assert incremental['version'] != versao
+    assert inertia(incremental, historico) <= inertia(completo, historico) * 1.5
+
+    # Um ponto distante de todos os centroides abre um novo cluster
+    distante = pd.DataFrame({'Lat_Origem': [-10.0], 'Lng_Origem': [-48.0],
+                             'Lat_Destino': [-25.0], 'Lng_Destino': [-50.0]})
+    antes = len(incremental['origin']['centroids'])
+    assert update_clusters(incremental, distante)['origin'] == 1
+    assert assign_cluster(incremental, 'origin', -10.0, -48.0) == antes
+
+def test_store_with_clusters():
+    """A feature store com clusters incorporados: busca individual igual à junção em lote."""
+    print("\n=== Teste da Feature Store com Clusters ===")
+    historico = load_historical_data()
+    store = build_feature_store(historico, clusters=fit_clusters(historico))
+    assert store['version'] == build_feature_store(historico, clusters=fit_clusters(historico))['version']
+
+    consultas = historico[['Lat_Origem', 'Lng_Origem', 'Lat_Destino', 'Lng_Destino', 'KM']].iloc[::40]
+    juntos = join_features(store, consultas)
+    for i, linha in enumerate(consultas.itertuples(index=False)):
+        individual = lookup_features(store, *linha)
+        assert all(np.isclose(individual[nome], juntos[nome][i]) for nome in AGGREGATE_FEATURES)
+    print(f"Store {store['version']}: {len(store['origin_clusters'])} clusters de origem, "
+          f"{len(store['dest_clusters'])} de destino")
+
+def main():
+    """Função principal"""
+    test_assignment()
+    test_incremental_update()
+    test_store_with_clusters()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Script para testar a destilação do modelo aprimorado.
+Verifica os limites de erro do aluno em relação ao professor, o tamanho e a
+latência, e o uso do aluno como nível rápido de predict_enhanced_price.
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import ml_service.predict as predict
+from ml_service.train import load_data
+from ml_service.feature_store import build_feature_store
+from ml_service.distill import distill_enhanced_model, save_student, print_report
+
+def test_distillation():
+    """O aluno deve ficar próximo do professor, ser menor e mais rápido, e ser servido no nível rápido."""
+    print("\n=== Teste da Destilação ===")
+    historico = load_data()
+    store = build_feature_store(historico)
+    teacher, scaler, features, _ = predict.load_enhanced_model('full')
+
+    student, report = distill_enhanced_model(historico, store, teacher, scaler, features, per_trip=1)
+    print_report(report)
+    # Limites medidos em rotas inteiras fora do ajuste (mais exigente que pontos soltos)
+    assert report['n_holdout_lanes'] > 0
+    assert report['holdout_vs_teacher']['mape'] < 0.05
+    assert report['history_mape']['student'] < report['history_mape']['teacher'] + 0.01
+    assert report['size_bytes']['student'] < report['size_bytes']['teacher'] / 4
+    assert report['single_latency_ms']['student'] < report['single_latency_ms']['teacher']
+
+    caminhos = (predict.STUDENT_MODEL_PATH, predict.STUDENT_METADATA_PATH)
+    with tempfile.TemporaryDirectory() as tmp:
+        predict.STUDENT_MODEL_PATH = os.path.join(tmp, 'student.pkl')
+        predict.STUDENT_METADATA_PATH = os.path.join(tmp, 'student.json')
+        try:
+            save_student(student, report, features, store, predict.STUDENT_MODEL_PATH,
+                         predict.STUDENT_METADATA_PATH)
+            predict._enhanced_models.pop('fast', None)
+
+            rota = historico.iloc[0]
+            argumentos = (rota['Lat_Origem'], rota['Lng_Origem'], rota['Lat_Destino'], rota['Lng_Destino'],
+                          rota['KM'], int(rota['Mês']))
+            rapido = predict.predict_enhanced_price(*argumentos, store=store)
+            completo = predict.predict_enhanced_price(*argumentos, store=store, tier='full')
+            print(f"Nível rápido: R$ {rapido['prediction']:.2f} | completo: R$ {completo['prediction']:.2f} "
+                  f"| real: R$ {rota['Frete Carreteiro']:.2f}")
+            assert rapido['details']['model_tier'] == 'fast' and completo['details']['model_tier'] == 'full'
+            assert np.isclose(rapido['prediction'], completo['prediction'], rtol=0.1)
+
+            # Uma store de outra versão (retreino sem --distill) não usa o aluno antigo
+            outra = dict(store, version='outra-versao')
+            desatualizado = predict.predict_enhanced_price(*argumentos, store=outra)
+            assert desatualizado['details']['model_tier'] == 'full'
+        finally:
+            predict.STUDENT_MODEL_PATH, predict.STUDENT_METADATA_PATH = caminhos
+            predict._enhanced_models.pop('fast', None)
+
+def main():
+    """Função principal"""
+    test_distillation()
+
+if __name__ == "__main__":
+    main()
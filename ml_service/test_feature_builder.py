@@ -0,0 +1,71 @@
+"""
+Script para testar o construtor vetorial de features.
+Verifica que os vetores coincidem com o caminho via DataFrame + scaler e
+compara o tempo de montagem de uma entrada do modelo.
+"""
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from ml_service.predict import load_model_and_scaler
+from ml_service.data_processor import (prepare_data_for_model, get_feature_builder,
+                                       build_feature_row, build_feature_matrix)
+
+def _via_dataframe(scaler, features, km, mes, ano, lat_o, lng_o, lat_d, lng_d, valor_por_km):
+    """Entrada do modelo montada como antes (DataFrame de uma linha + scaler.transform)."""
+    df_input = pd.DataFrame({
+        'KM': km, 'Mês': mes, 'Trimestre': (np.asarray(mes) - 1) // 3 + 1, 'Ano': ano,
+        'Lat_Origem': lat_o, 'Lng_Origem': lng_o, 'Lat_Destino': lat_d, 'Lng_Destino': lng_d,
+        'Valor_por_km': valor_por_km,
+    }, index=range(len(np.atleast_1d(km))))
+    for feature in features:
+        if feature not in df_input.columns:
+            df_input[feature] = 0
+    return scaler.transform(prepare_data_for_model(df_input, features))
+
+def test_feature_builder():
+    """Vetores individuais e em lote devem ser idênticos aos do caminho via DataFrame."""
+    print("\n=== Teste do Construtor de Features ===")
+    model, scaler, features, _ = load_model_and_scaler()
+    builder = get_feature_builder(features, scaler)
+    assert get_feature_builder(features, scaler) is builder
+
+    rng = np.random.default_rng(0)
+    n = 500
+    consultas = (rng.uniform(50, 900, n), rng.integers(1, 13, n), np.full(n, 2025),
+                 rng.uniform(-27, -23, n), rng.uniform(-56, -50, n),
+                 rng.uniform(-27, -23, n), rng.uniform(-56, -50, n), rng.uniform(0, 2, n))
+
+    esperado = _via_dataframe(scaler, features, *consultas)
+    assert np.array_equal(build_feature_matrix(builder, *consultas), esperado)
+    for i in range(0, n, 50):
+        assert np.array_equal(build_feature_row(builder, *[c[i] for c in consultas]), esperado[i:i + 1])
+
+    linha = [c[0] for c in consultas]
+    inicio = time.perf_counter()
+    for _ in range(200):
+        _via_dataframe(scaler, features, *linha)
+    tempo_df = (time.perf_counter() - inicio) / 200
+    inicio = time.perf_counter()
+    for _ in range(200):
+        X = build_feature_row(builder, *linha)
+    tempo_vetor = (time.perf_counter() - inicio) / 200
+    inicio = time.perf_counter()
+    for _ in range(200):
+        model.predict(X)
+    tempo_modelo = (time.perf_counter() - inicio) / 200
+
+    print(f"Montagem da entrada: {tempo_df * 1e6:.0f}µs (DataFrame) → {tempo_vetor * 1e6:.1f}µs "
+          f"(vetor); predição do modelo: {tempo_modelo * 1e6:.0f}µs")
+    assert tempo_vetor < tempo_df
+
+def main():
+    """Função principal"""
+    test_feature_builder()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Script para testar a feature store do modelo aprimorado.
+Verifica a versão, a busca individual contra a junção em lote, a predição
+individual contra a predição em lote e a precisão no histórico.
+"""
+
+import sys
+import os
+import time
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from ml_service.predict import load_historical_data, load_enhanced_model, predict_enhanced_price
+from ml_service.batch_predict import predict_enhanced_batch
+from ml_service.feature_store import (build_feature_store, save_feature_store, load_feature_store,
+                                      lookup_features, join_features, AGGREGATE_FEATURES)
+
+COLUNAS = ['Lat_Origem', 'Lng_Origem', 'Lat_Destino', 'Lng_Destino', 'KM', 'Mês']
+
+def test_store_lookup():
+    """Busca individual e junção em lote devem coincidir; a versão depende só do conteúdo."""
+    print("\n=== Teste da Feature Store ===")
+    historico = load_historical_data()
+    store = build_feature_store(historico)
+    assert build_feature_store(historico)['version'] == store['version']
+    assert build_feature_store(historico.iloc[1:])['version'] != store['version']
+
+    with tempfile.TemporaryDirectory() as tmp:
+        caminho = os.path.join(tmp, 'store.json')
+        save_feature_store(store, caminho)
+        assert load_feature_store(caminho)['lanes'] == store['lanes']
+
+    consultas = historico[COLUNAS].iloc[::50].reset_index(drop=True)
+    juntos = join_features(store, consultas)
+    for i in range(0, len(consultas), 7):
+        individual = lookup_features(store, *consultas.iloc[i][COLUNAS[:5]])
+        assert individual['level'] == juntos['level'][i] == 'lane'
+        assert all(np.isclose(individual[nome], juntos[nome][i]) for nome in AGGREGATE_FEATURES)
+
+    # Rota sem histórico: R$/km do nível superior × KM
+    fora = lookup_features(store, -10.0, -40.0, -11.0, -41.0, 200)
+    assert fora['level'] == 'global' and np.isclose(fora['Route_Mean'], store['global'][1] * 200)
+
+    inicio = time.perf_counter()
+    for _ in range(1000):
+        lookup_features(store, -25.1, -54.2, -24.3, -51.2, 300)
+    print(f"Busca: {(time.perf_counter() - inicio) * 1000:.1f} µs por consulta "
+          f"({len(store['lanes'])} rotas, versão {store['version']})")
+
+def test_enhanced_predictions():
+    """Predição individual e em lote do modelo aprimorado devem coincidir."""
+    print("\n=== Teste do Modelo Aprimorado ===")
+    historico = load_historical_data()
+    store = build_feature_store(historico)
+    model, scaler, features, _ = load_enhanced_model()
+
+    consultas = historico[COLUNAS].reset_index(drop=True)
+    inicio = time.perf_counter()
+    lote = predict_enhanced_batch(consultas, store, model, scaler, features)
+    duracao = time.perf_counter() - inicio
+
+    for i in range(0, len(consultas), 400):
+        linha = consultas.iloc[i]
+        individual = predict_enhanced_price(*linha[COLUNAS[:5]], int(linha['Mês']), store=store)
+        assert not individual['error']
+        assert individual['prediction'] == lote['prediction'][i]
+        assert individual['details']['feature_store_version'] == store['version']
+
+    real = historico['Frete Carreteiro'].to_numpy()
+    mape = np.mean(np.abs(lote['prediction'].to_numpy() - real) / real)
+    print(f"Lote: {len(consultas)} consultas em {duracao * 1000:.0f}ms | MAPE no histórico: {mape * 100:.2f}%")
+    assert mape < 0.10
+
+def main():
+    """Função principal"""
+    test_store_lookup()
+    test_enhanced_predictions()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Script para testar a ingestão de feedback exportado (JSONL) para o treino.
+Verifica a validação, a deduplicação contra o histórico e o arquivo de rejeitos.
+"""
+
+import sys
+import os
+import json
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ml_service.train import load_data
+from ml_service.feedback_ingest import ingest_feedback
+
+def _feedback(doc_id, preco, km=219, lat_o=-24.48545, lng_o=-54.83175, data='2025-05-10T12:00:00Z', **extra):
+    """Documento no formato da coleção ml_feedback."""
+    return dict({
+        'id': doc_id,
+        'originalRecommendation': 4000,
+        'userSuggestedPrice': preco,
+        'isHelpful': False,
+        'metadata': {'distance': km, 'originLat': lat_o, 'originLng': lng_o,
+                     'destLat': -24.72896, 'destLng': -53.73445, 'month': 5},
+        'createdAt': data,
+    }, **extra)
+
+def test_feedback_ingest():
+    """Amostras válidas devem ser aceitas e as demais rejeitadas com o motivo."""
+    print("\n=== Teste da Ingestão de Feedback ===")
+    historico = load_data()
+    viagem = {k: (v.item() if hasattr(v, 'item') else v) for k, v in historico.iloc[0].items()}
+    data_viagem = f"{viagem['Ano']}-{viagem['Mês']:02d}-{int(viagem['Data Saída'].split('/')[0]):02d}T10:00:00Z"
+
+    linhas = [
+        json.dumps(_feedback('a', 120)),
+        json.dumps(_feedback('b', 125, data='2025-05-11T08:00:00Z')),
+        json.dumps(_feedback('a', 120)),                                   # documento repetido
+        json.dumps(_feedback('c', 120)),                                   # mesma viagem de 'a'
+        json.dumps(_feedback('d', viagem['Frete Carreteiro'], km=viagem['KM'],
+                             lat_o=viagem['Lat_Origem'], lng_o=viagem['Lng_Origem'],
+                             data=data_viagem,
+                             metadata={'distance': viagem['KM'], 'originLat': viagem['Lat_Origem'],
+                                       'originLng': viagem['Lng_Origem'], 'destLat': viagem['Lat_Destino'],
+                                       'destLng': viagem['Lng_Destino']})),  # já no histórico
+        json.dumps(_feedback('e', 99999)),                                 # R$/km implausível
+        json.dumps({'id': 'f', 'originalRecommendation': 4000, 'wasRejected': True,
+                    'totalDistance': 219, 'createdAt': '2025-05-10T12:00:00Z'}),  # sem preço
+        json.dumps({'id': 'g', 'driverPayment': 130, 'totalDistance': 219,
+                    'createdAt': '2025-05-10T12:00:00Z'}),                # sem coordenadas
+        '{"id": "h", "userSuggestedPrice": ',                             # JSON inválido
+    ]
+
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho = os.path.join(pasta, 'feedback.jsonl')
+        with open(caminho, 'w') as f:
+            f.write('\n'.join(linhas) + '\n')
+
+        amostras, stats = ingest_feedback(caminho, historico, weight=2.0, batch_size=4)
+        with open(stats['reject_path']) as f:
+            rejeitos = [json.loads(linha) for linha in f]
+
+    assert stats['read'] == len(linhas)
+    assert stats['accepted'] == 2 and len(amostras) == 2
+    assert sorted(amostras['Frete Carreteiro']) == [120, 125]
+    assert (amostras['sample_weight'] == 2.0).all() and (amostras['Mês'] == 5).all()
+    assert stats['reject_reasons'] == {
+        'documento repetido': 1, 'viagem duplicada': 2, 'R$/km fora da faixa do histórico': 1,
+        'sem preço sugerido': 1, 'sem coordenadas': 1, 'JSON inválido': 1,
+    }
+    assert sorted(r['line'] for r in rejeitos) == [3, 4, 5, 6, 7, 8, 9]
+
+def main():
+    """Função principal"""
+    test_feedback_ingest()
+
+if __name__ == "__main__":
+    main()
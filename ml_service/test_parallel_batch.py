@@ -0,0 +1,57 @@
+"""
+Script para testar a predição em lote com múltiplos processos.
+Verifica que o histórico em memória compartilhada e a divisão em fatias
+produzem exatamente os resultados de batch_predict.predict_batch.
+"""
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+from ml_service.predict import load_historical_data, load_model_and_scaler
+from ml_service.seasonality import load_seasonality_table
+from ml_service.batch_predict import predict_batch
+from ml_service.parallel_batch import share_frame, attach_frame, predict_batch_parallel
+
+def test_shared_frame():
+    """O DataFrame montado sobre a memória compartilhada deve ser igual ao original."""
+    print("\n=== Teste do Histórico Compartilhado ===")
+    historico = load_historical_data()
+    shm, spec = share_frame(historico)
+    try:
+        anexo, visao = attach_frame(spec)
+        colunas = [coluna for coluna, _, _ in spec['columns']]
+        print(f"{len(colunas)} colunas, {len(visao)} linhas, {shm.size / 1e6:.1f} MB")
+        pd.testing.assert_frame_equal(visao, historico[colunas].reset_index(drop=True))
+        del visao
+        anexo.close()
+    finally:
+        shm.close()
+        shm.unlink()
+
+def test_parallel_matches_batch():
+    """A predição paralela deve coincidir com a predição em lote de um único processo."""
+    print("\n=== Teste da Predição Paralela ===")
+    historico = load_historical_data()
+    model, scaler, features, _ = load_model_and_scaler()
+    consultas = historico[['Lat_Origem', 'Lng_Origem', 'Lat_Destino', 'Lng_Destino', 'KM', 'Mês']] \
+        .sample(2000, replace=True, random_state=0).reset_index(drop=True)
+
+    inicio = time.perf_counter()
+    esperado = predict_batch(consultas, historico, model, scaler, features,
+                             seasonality=load_seasonality_table())
+    print(f"Um processo: {time.perf_counter() - inicio:.2f}s")
+
+    resultados = predict_batch_parallel(consultas, historico, workers=2, shard_size=500)
+    for metodo, tabela in esperado.items():
+        pd.testing.assert_frame_equal(resultados[metodo], tabela.reset_index(drop=True))
+
+def main():
+    """Função principal"""
+    test_shared_frame()
+    test_parallel_matches_batch()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Script para testar os intervalos de predição do modelo ML.
+Verifica a cobertura dos modelos de quantis, a dispersão das árvores do
+RandomForest em uma única travessia, a confiança derivada do intervalo nas
+predições individual e em lote, e o custo de latência do intervalo.
+"""
+
+import sys
+import os
+import gc
+import time
+import weakref
+import tempfile
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.model_selection import train_test_split
+import ml_service.predict as predict
+import ml_service.batch_predict as batch_predict
+from ml_service.predict import load_model_and_scaler, load_historical_data, load_enhanced_model
+from ml_service.data_processor import get_feature_builder, build_feature_matrix, build_feature_row
+from ml_service.staged_inference import predict_staged, estimated_latency_ms, MIN_STAGES
+from ml_service.feature_store import build_feature_store
+from ml_service.distill import enhanced_inputs
+from ml_service.prediction_intervals import (train_quantile_models, save_quantile_models, prediction_interval,
+                                             interval_report, print_interval_report, _forest_tree_predictions,
+                                             MIN_CONFIDENCE, MAX_CONFIDENCE)
+
+def historical_matrix():
+    """Histórico e matriz de features padronizada do modelo atual."""
+    model, scaler, features, _ = load_model_and_scaler()
+    historico = load_historical_data()
+    X = build_feature_matrix(
+        get_feature_builder(features, scaler), historico['KM'].to_numpy(dtype=np.float64),
+        historico['Mês'].to_numpy(), historico['Ano'].to_numpy(),
+        historico['Lat_Origem'].to_numpy(dtype=np.float64), historico['Lng_Origem'].to_numpy(dtype=np.float64),
+        historico['Lat_Destino'].to_numpy(dtype=np.float64), historico['Lng_Destino'].to_numpy(dtype=np.float64),
+        valor_por_km=historico['Valor_por_km'].to_numpy(dtype=np.float64))
+    return model, features, historico, X
+
+def test_quantile_intervals():
+    """Os modelos de quantis devem cobrir a maior parte das viagens separadas, com custo pequeno."""
+    print("\n=== Teste dos Modelos de Quantis ===")
+    model, _, historico, X = historical_matrix()
+    y = historico['Frete Carreteiro'].to_numpy(dtype=np.float64)
+    X_treino, X_teste, y_treino, y_teste = train_test_split(X, y, test_size=0.2, random_state=42)
+
+    principal = model.__class__(**model.get_params()).fit(X_treino, y_treino)
+    quantis = train_quantile_models(principal, X_treino, y_treino)
+    report = interval_report(principal, X_teste, y_teste, quantile_models=quantis)
+    print_interval_report(report)
+    assert report['source'] == 'quantile_models'
+    assert 0.7 <= report['coverage'] <= 1.0
+    assert report['single_overhead_ms'] < 1.0
+
+    predicao = principal.predict(X_teste)
+    intervalo = prediction_interval(principal, X_teste, predicao, quantis)
+    assert (intervalo['lower'] <= predicao).all() and (predicao <= intervalo['upper']).all()
+    assert ((intervalo['confidence'] >= MIN_CONFIDENCE) & (intervalo['confidence'] <= MAX_CONFIDENCE)).all()
+    # Intervalos mais largos resultam em confiança menor
+    largura = (intervalo['upper'] - intervalo['lower']) / predicao
+    assert intervalo['confidence'][np.argmax(largura)] <= intervalo['confidence'][np.argmin(largura)]
+
+def test_tree_spread():
+    """A travessia única das árvores do RandomForest reproduz a predição de cada árvore."""
+    print("\n=== Teste da Dispersão das Árvores ===")
+    historico = load_historical_data()
+    floresta, scaler, features, _ = load_enhanced_model('full')
+    X, _ = enhanced_inputs(historico, build_feature_store(historico), scaler, features)
+
+    for linhas in (X[:1], X[:8], X[:200]):
+        por_arvore = _forest_tree_predictions(floresta, linhas)
+        esperado = np.column_stack([arvore.predict(linhas) for arvore in floresta.estimators_])
+        assert np.allclose(por_arvore, esperado, rtol=0, atol=1e-8)
+        assert np.allclose(por_arvore.mean(axis=1), floresta.predict(linhas))
+
+    report = interval_report(floresta, X, historico['Frete Carreteiro'])
+    print_interval_report(report)
+    assert report['source'] == 'tree_spread' and report['coverage'] > 0.5
+
+    inicio = time.perf_counter()
+    for _ in range(50):
+        np.column_stack([arvore.predict(X[:1]) for arvore in floresta.estimators_])
+    por_arvore_ms = (time.perf_counter() - inicio) / 50 * 1000
+    print(f"Árvore por árvore: {por_arvore_ms:.2f}ms | travessia única: {report['single_overhead_ms']:.2f}ms")
+    assert report['single_overhead_ms'] < por_arvore_ms
+
+    # A floresta compilada não mantém vivo um modelo descartado
+    descartada = RandomForestRegressor(n_estimators=5, random_state=0).fit(X[:200], historico['Frete Carreteiro'][:200])
+    _forest_tree_predictions(descartada, X[:1])
+    referencia = weakref.ref(descartada)
+    del descartada
+    gc.collect()
+    assert referencia() is None
+
+def test_served_intervals():
+    """Predições individual e em lote usam a confiança derivada do mesmo intervalo."""
+    print("\n=== Teste dos Intervalos nas Predições ===")
+    model, features, historico, X = historical_matrix()
+    y = historico['Frete Carreteiro'].to_numpy(dtype=np.float64)
+
+    rota = historico.iloc[0]
+    argumentos = (rota['Lat_Origem'], rota['Lng_Origem'], rota['Lat_Destino'], rota['Lng_Destino'],
+                  rota['KM'], int(rota['Mês']))
+    caminhos = (predict.QUANTILE_MODELS_PATH, batch_predict.QUANTILE_MODELS_PATH)
+    carregador = predict.load_model_and_scaler
+    carregado = carregador()
+    with tempfile.TemporaryDirectory() as tmp:
+        caminho = os.path.join(tmp, 'quantis.pkl')
+        try:
+            predict.QUANTILE_MODELS_PATH = batch_predict.QUANTILE_MODELS_PATH = caminho
+            # O mesmo modelo em todas as predições: os custos medidos (e o orçamento) não mudam entre chamadas
+            predict.load_model_and_scaler = lambda: carregado
+            model = carregado[0]
+            sem_intervalo = predict.predict_freight_price(*argumentos, explain=False, include_similar_routes=False)
+            assert 'model_interval' not in sem_intervalo['details']
+            assert sem_intervalo['details']['model_confidence'] == 0.95
+            inicio = time.perf_counter()
+            for _ in range(20):
+                predict.predict_freight_price(*argumentos, explain=False, include_similar_routes=False)
+            sem_intervalo_ms = (time.perf_counter() - inicio) / 20 * 1000
+
+            # Modelos de quantis de outro modelo principal (ex.: gb_model*.pkl antigo restaurado) são ignorados
+            outro = model.__class__(**dict(model.get_params(), n_estimators=20)).fit(X, y)
+            save_quantile_models(train_quantile_models(outro, X, y), outro, features, caminho)
+            assert predict.load_quantile_models(model, features, caminho) is None
+            assert 'model_interval' not in predict.predict_freight_price(
+                *argumentos, explain=False, include_similar_routes=False)['details']
+
+            save_quantile_models(train_quantile_models(model, X, y), model, features, caminho)
+            resultado = predict.predict_freight_price(*argumentos, explain=False, include_similar_routes=False)
+            detalhes = resultado['details']
+            inferior, superior = detalhes['model_interval']
+            print(f"Rota de {rota['KM']:.0f}km: R$ {detalhes['model_prediction']:.2f} "
+                  f"[{inferior:.2f}, {superior:.2f}], confiança do modelo {detalhes['model_confidence']:.3f}")
+            assert detalhes['model_interval_source'] == 'quantile_models'
+            assert inferior <= superior and MIN_CONFIDENCE <= detalhes['model_confidence'] <= MAX_CONFIDENCE
+
+            # Com orçamento de latência, os modelos de quantis usam os mesmos estágios do modelo
+            # e o custo deles entra no orçamento; sem espaço para eles, o intervalo é omitido.
+            # O orçamento usa os custos medidos do modelo compilado pelo próprio predict
+            compilado = predict.get_staged_model(model)
+            orcamento = estimated_latency_ms(compilado, 2 * MIN_STAGES) * 3
+            orcado = predict.predict_freight_price(*argumentos, explain=False, include_similar_routes=False,
+                                                   latency_budget_ms=orcamento)['details']
+            scaler = carregado[1]
+            X_rota = build_feature_row(get_feature_builder(features, scaler), rota['KM'], int(rota['Mês']),
+                                       datetime.now().year, *argumentos[:4], valor_por_km=0.0)
+            k = orcado['model_stages']
+            esperado = prediction_interval(model, X_rota, predict_staged(compilado, X_rota, k),
+                                           predict.load_quantile_models(model, features, caminho), n_stages=k)
+            print(f"Orçamento de {orcamento:.3f}ms: {k} estágios nos três modelos")
+            assert MIN_STAGES <= k < model.n_estimators_
+            assert np.allclose(orcado['model_interval'], [esperado['lower'][0], esperado['upper'][0]], atol=0.01)
+
+            apertado = predict.predict_freight_price(*argumentos, explain=False, include_similar_routes=False,
+                                                     latency_budget_ms=0.0)['details']
+            assert apertado['model_interval_skipped'] == 'latency_budget' and 'model_interval' not in apertado
+
+            consultas = historico[['Lat_Origem', 'Lng_Origem', 'Lat_Destino', 'Lng_Destino', 'KM', 'Mês']].head(50)
+            lote = batch_predict.predict_batch(consultas, historico, model, scaler, features)['ml_model']
+            assert np.isclose(lote['confidence'].iloc[0], detalhes['model_confidence'])
+            assert np.isclose(lote['lower'].iloc[0], inferior, atol=0.01)
+            assert (lote['lower'] <= lote['upper']).all()
+            apertado = batch_predict.predict_batch(consultas, historico, model, scaler, features,
+                                                   latency_budget_ms=0.0)['ml_model']
+            assert (apertado['model_interval_skipped'] == 'latency_budget').all() and 'lower' not in apertado
+
+            # Custo do intervalo na predição individual completa
+            inicio = time.perf_counter()
+            for _ in range(20):
+                predict.predict_freight_price(*argumentos, explain=False, include_similar_routes=False)
+            com_intervalo_ms = (time.perf_counter() - inicio) / 20 * 1000
+            print(f"Predição individual: {sem_intervalo_ms:.2f}ms sem intervalo | "
+                  f"{com_intervalo_ms:.2f}ms com intervalo")
+        finally:
+            predict.QUANTILE_MODELS_PATH, batch_predict.QUANTILE_MODELS_PATH = caminhos
+            predict.load_model_and_scaler = carregador
+
+def main():
+    """Função principal"""
+    test_quantile_intervals()
+    test_tree_spread()
+    test_served_intervals()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Script para testar a precisão das predições contra os dados históricos.
+Executa o backtest leave-one-out sobre todo o histórico e grava
+test_results.json no formato esperado pelo servidor (mlTestHandler.ts).
+"""
+
+import os
+import json
+import math
+import argparse
+from datetime import datetime
+from tabulate import tabulate
+
+from predict import load_historical_data, load_model_and_scaler
+from backtest import leave_one_out_backtest, summarize_errors
+
+TEST_RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_results.json')
+
+# Pipeline usado em produção pelo servidor (predict.py)
+PRODUCTION_METHOD = 'standard'
+
+def _json_value(value):
+    """Converte valores NumPy/NaN para tipos aceitos por JSON.parse no servidor."""
+    if isinstance(value, dict):
+        return {k: _json_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_json_value(v) for v in value]
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+def build_scenarios(results, num_scenarios, error_threshold):
+    """
+    Seleciona uma amostra reprodutível de cenários do backtest para exibição.
+
+    Args:
+        results (DataFrame): Saída de leave_one_out_backtest (apenas um método)
+        num_scenarios (int): Quantidade de cenários
+        error_threshold (float): Erro percentual aceitável
+
+    Returns:
+        list: Cenários no formato TestScenario do servidor
+    """
+    amostra = results.sample(n=min(num_scenarios, len(results)), random_state=42)
+
+    cenarios = []
+    for i, row in enumerate(amostra.itertuples(index=False), start=1):
+        origem, destino = row.lane.split('>')
+        cenarios.append({
+            "scenario": i,
+            "originCity": origem,
+            "destinationCity": destino,
+            "totalDistance": float(row.km),
+            "month": int(row.month),
+            "historical_price": float(row.actual),
+            "prediction": float(row.prediction),
+            "rounded_prediction": float(round(row.prediction / 5) * 5),
+            "absolute_diff": round(float(row.abs_error), 2),
+            "percentage_diff": round(float(row.pct_error), 2),
+            "is_acceptable": bool(row.pct_error <= error_threshold),
+            "method": row.method,
+        })
+    return cenarios
+
+def main():
+    """Função principal do script."""
+    parser = argparse.ArgumentParser(description="Backtest leave-one-out das predições de frete")
+    parser.add_argument('--retrain', action='store_true', help="Retreina o modelo antes do teste")
+    parser.add_argument('--scenarios', type=int, default=20, help="Cenários incluídos no relatório")
+    parser.add_argument('--error-threshold', type=float, default=15.0,
+                        help="Erro percentual aceitável (default: 15)")
+    parser.add_argument('--radius', type=float, default=50.0, help="Raio de similaridade em km")
+    args = parser.parse_args()
+
+    print("=== Teste de Predições (backtest leave-one-out) ===")
+
+    if args.retrain:
+        import train
+        train.main([])
+
+    historical_data = load_historical_data()
+    model, scaler, features, metadata = load_model_and_scaler()
+
+    results = leave_one_out_backtest(historical_data, model, scaler, features, radius_km=args.radius)
+
+    por_metodo = summarize_errors(results)
+    print("\nErro por método:")
+    print(tabulate(por_metodo, headers='keys', tablefmt='simple', floatfmt='.2f', showindex=False))
+
+    por_mes = summarize_errors(results[results['evaluated_method'] == PRODUCTION_METHOD], by=['month'])
+    print(f"\nErro por mês ({PRODUCTION_METHOD}):")
+    print(tabulate(por_mes, headers='keys', tablefmt='simple', floatfmt='.2f', showindex=False))
+
+    por_rota = summarize_errors(results, by=['lane'])
+
+    producao = results[results['evaluated_method'] == PRODUCTION_METHOD]
+    aceitaveis = int((producao['pct_error'] <= args.error_threshold).sum())
+    total = int(len(producao))
+
+    test_result = {
+        "timestamp": datetime.now().isoformat(),
+        "total_scenarios": total,
+        "acceptable_predictions": aceitaveis,
+        "accuracy_rate": aceitaveis / total * 100 if total else 0.0,
+        "error_threshold": args.error_threshold,
+        "scenarios": build_scenarios(producao, args.scenarios, args.error_threshold),
+        "summary": {
+            "by_method": por_metodo.to_dict('records'),
+            "by_month": summarize_errors(results, by=['month']).to_dict('records'),
+            "by_lane": por_rota.to_dict('records'),
+        }
+    }
+
+    with open(TEST_RESULTS_FILE, 'w') as f:
+        json.dump(_json_value(test_result), f, indent=2)
+
+    print(f"\nPredições aceitáveis (erro <= {args.error_threshold}%): "
+          f"{aceitaveis}/{total} ({test_result['accuracy_rate']:.1f}%)")
+    print(f"Resultados salvos em: {TEST_RESULTS_FILE}")
+
+if __name__ == "__main__":
+    main()
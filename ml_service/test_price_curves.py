@@ -0,0 +1,62 @@
+"""
+Script para testar as curvas de preço (12 meses e varredura de distâncias).
+Compara cada ponto da curva com a predição individual correspondente.
+"""
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ml_service.price_curves import price_curve
+from ml_service.predict import predict_freight_price
+
+def test_month_curve():
+    """Testa a curva de 12 meses da rota mais comum."""
+    print("\n=== Teste de Curva Mensal ===")
+
+    origem_lat = -24.48545
+    origem_lng = -54.83175
+    destino_lat = -24.72896
+    destino_lng = -53.73445
+    km = 219.0
+
+    inicio = time.perf_counter()
+    curva = price_curve(origem_lat, origem_lng, destino_lat, destino_lng, km)
+    print(f"Curva calculada em {time.perf_counter() - inicio:.2f}s: {curva['message']}")
+
+    assert not curva['error'], curva['message']
+    assert [p['month'] for p in curva['points']] == list(range(1, 13))
+
+    # Confere alguns meses com a predição individual
+    for ponto in curva['points'][::4]:
+        resultado = predict_freight_price(origem_lat, origem_lng, destino_lat, destino_lng, km, ponto['month'])
+        print(f"Mês {ponto['month']:2d}: curva R$ {ponto['prediction']:.2f} | "
+              f"individual R$ {resultado['prediction']:.2f} ({ponto['method']})")
+        assert ponto['prediction'] == resultado['prediction']
+        assert ponto['method'] == resultado['method']
+
+def test_km_sweep():
+    """Testa a varredura de distâncias para uma rota sem histórico próximo."""
+    print("\n=== Teste de Varredura de Distâncias ===")
+
+    kms = [100, 250, 400, 550, 700]
+    curva = price_curve(-25.5, -54.6, -23.4, -51.9, kms[0], months=[3], kms=kms)
+
+    assert not curva['error'], curva['message']
+    assert [p['km'] for p in curva['points']] == kms
+
+    for ponto in curva['points']:
+        resultado = predict_freight_price(-25.5, -54.6, -23.4, -51.9, ponto['km'], 3)
+        print(f"{ponto['km']:6.0f} km: curva R$ {ponto['prediction']:.2f} | "
+              f"individual R$ {resultado['prediction']:.2f}")
+        assert ponto['prediction'] == resultado['prediction']
+
+def main():
+    """Função principal."""
+    print("=== Teste de Curvas de Preço ===")
+    test_month_curve()
+    test_km_sweep()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Script para testar a superfície de preços pré-calculada.
+Gera uma superfície reduzida em um diretório temporário e compara uma
+célula com o pipeline completo no centro da célula.
+"""
+
+import sys
+import os
+import time
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ml_service.price_surface import (build_price_surface, load_price_surface,
+                                      lookup_surface_price, surface_heatmap)
+from ml_service.predict import predict_freight_price
+
+def test_surface_lookup():
+    """Gera a superfície de um mês e confere uma célula com a predição completa."""
+    print("\n=== Teste da Superfície de Preços ===")
+
+    # Rota mais comum do histórico
+    origem_lat = -24.48545
+    origem_lng = -54.83175
+    destino_lat = -24.72896
+    destino_lng = -53.73445
+    mes = 5
+
+    path = os.path.join(tempfile.mkdtemp(), 'price_surface.npz')
+    resumo = build_price_surface(grid_deg=0.5, months=[mes], max_workers=1, path=path)
+    print(f"Superfície {resumo['shape']} em {resumo['seconds']}s ({resumo['file_mb']} MB)")
+
+    surface = load_price_surface(path)
+    inicio = time.perf_counter()
+    celula = lookup_surface_price(surface, origem_lat, origem_lng, destino_lat, destino_lng, mes)
+    print(f"Consulta em {(time.perf_counter() - inicio) * 1e6:.0f}µs: {celula}")
+
+    assert celula is not None
+    assert lookup_surface_price(surface, origem_lat, origem_lng, destino_lat, destino_lng, mes + 1) is None
+    assert lookup_surface_price(surface, 10.0, 10.0, destino_lat, destino_lng, mes) is None
+
+    # Pipeline completo no centro das células, com o KM estimado da superfície
+    meio = surface['metadata']['grid_deg'] / 2
+    centro = [(v // (2 * meio)) * (2 * meio) + meio for v in (origem_lat, origem_lng, destino_lat, destino_lng)]
+    resultado = predict_freight_price(*centro, celula['km_estimate'], mes)
+    print(f"Pipeline completo no centro da célula: R$ {resultado['prediction']:.2f} ({resultado['method']})")
+    assert resultado['prediction'] == celula['prediction']
+    assert resultado['method'] == celula['method']
+
+    mapa = surface_heatmap(surface, origem_lat, origem_lng, mes)
+    print(f"Mapa de calor: {mapa['price'].shape[0]}×{mapa['price'].shape[1]} células de destino")
+
+def main():
+    """Função principal."""
+    print("=== Teste da Superfície de Preços ===")
+    test_surface_lookup()
+
+if __name__ == "__main__":
+    main()
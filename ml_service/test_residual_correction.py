@@ -0,0 +1,116 @@
+"""
+Script para testar a correção residual online a partir do feedback.
+Verifica a média exponencial por rota e mês, a persistência da tabela e a
+aplicação da correção nas predições individual e em lote.
+"""
+
+import sys
+import os
+import tempfile
+import multiprocessing
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import ml_service.predict as predict
+from ml_service.predict import predict_freight_price, load_historical_data, load_model_and_scaler
+from ml_service.batch_predict import predict_batch
+from ml_service.residual_correction import (
+    new_residual_table, update_residual, correction_factor,
+    save_residual_table, load_residual_table, record_feedback
+)
+
+ROTA = (-24.48545, -54.83175, -24.72896, -53.73445)
+
+def _record_events(caminho, eventos):
+    """Registra feedbacks em sequência (executado em um processo separado)."""
+    for _ in range(eventos):
+        record_feedback({'originLat': ROTA[0], 'originLng': ROTA[1], 'destLat': ROTA[2], 'destLng': ROTA[3],
+                         'month': 3, 'originalRecommendation': 4000, 'userSuggestedPrice': 4400}, caminho)
+
+def test_residual_updates():
+    """Feedbacks consistentes devem convergir para a razão sugerida, só na rota e mês corretos."""
+    print("\n=== Teste da Correção Residual ===")
+    table = new_residual_table()
+
+    # A recomendação recebida já inclui a correção vigente; o usuário sempre sugere 10% acima da base
+    base = 4000.0
+    for evento in range(30):
+        fator = correction_factor(table, *ROTA, 5)['factor']
+        resultado = update_residual(table, *ROTA, 5, base * fator, base * 1.10)
+        assert resultado['accepted']
+        if evento in (0, 4, 29):
+            print(f"Evento {evento + 1:2d}: fator {resultado['factor']:.4f} (eventos {resultado['events']})")
+
+    correcao = correction_factor(table, *ROTA, 5)
+    assert abs(correcao['factor'] - 1.10) < 0.015
+    assert correction_factor(table, *ROTA, 6)['factor'] == 1.0
+    assert not update_residual(table, *ROTA, 5, base, base * 10)['accepted']
+
+    # Persistência: a tabela salva é relida com a mesma correção
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho = os.path.join(pasta, 'residual_corrections.json')
+        save_residual_table(table, caminho)
+        print(f"Tabela salva: {os.path.getsize(caminho)} bytes")
+        assert correction_factor(load_residual_table(caminho), *ROTA, 5) == correcao
+
+        resultado = record_feedback({'originLat': ROTA[0], 'originLng': ROTA[1], 'destLat': ROTA[2],
+                                     'destLng': ROTA[3], 'month': 7,
+                                     'originalRecommendation': 4000, 'userSuggestedPrice': 3600}, caminho)
+        assert resultado['accepted'] and resultado['factor'] < 1.0
+        assert correction_factor(load_residual_table(caminho), *ROTA, 7)['factor'] == resultado['factor']
+
+    # Processos simultâneos (um por evento no servidor) não perdem atualizações
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho = os.path.join(pasta, 'residual_corrections.json')
+        processos = [multiprocessing.Process(target=_record_events, args=(caminho, 10)) for _ in range(4)]
+        for processo in processos:
+            processo.start()
+        for processo in processos:
+            processo.join()
+        table = load_residual_table(caminho)
+        print(f"4 processos × 10 eventos: {table['events']} eventos registrados")
+        assert table['events'] == 40 and correction_factor(table, *ROTA, 3)['events'] == 40
+        assert [nome for nome in os.listdir(pasta) if nome.endswith('.tmp')] == []
+
+def test_residual_applied():
+    """A correção deve ser aplicada às predições individual e em lote."""
+    print("\n=== Teste da Aplicação da Correção ===")
+    km, mes = 219.0, 5
+    table = new_residual_table()
+    for _ in range(20):
+        update_residual(table, *ROTA, mes, 1000.0, 1200.0)
+    fator = correction_factor(table, *ROTA, mes)['factor']
+
+    # Tabela em um diretório temporário: a tabela do serviço em models/ não é alterada
+    caminho_original = predict.RESIDUALS_PATH
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho = os.path.join(pasta, 'residual_corrections.json')
+        try:
+            predict.RESIDUALS_PATH = caminho
+            original = predict_freight_price(*ROTA, km, mes)
+            save_residual_table(table, caminho)
+            corrigido = predict_freight_price(*ROTA, km, mes)
+
+            historico = load_historical_data()
+            model, scaler, features, _ = load_model_and_scaler()
+            import pandas as pd
+            consultas = pd.DataFrame([dict(zip(['Lat_Origem', 'Lng_Origem', 'Lat_Destino', 'Lng_Destino'], ROTA),
+                                           KM=km, Mês=mes)])
+            lote = predict_batch(consultas, historico, model, scaler, features,
+                                 residuals=load_residual_table(caminho))['standard']
+        finally:
+            predict.RESIDUALS_PATH = caminho_original
+
+    print(f"Original: R$ {original['prediction']:.2f} | Corrigido: R$ {corrigido['prediction']:.2f} "
+          f"(fator {fator:.3f})")
+    assert corrigido['details']['residual_factor'] == fator
+    assert corrigido['prediction'] == round(original['prediction'] * fator / 5) * 5
+    assert np.isclose(lote['prediction'][0], corrigido['prediction'])
+
+def main():
+    """Função principal"""
+    test_residual_updates()
+    test_residual_applied()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Script para testar os formatos de resposta do modo arquivo JSON de predict.py.
+Verifica a seleção de campos (sem explicação e sem rotas similares quando não
+solicitadas), o enquadramento binário e a redução de bytes e de tempo em
+relação à resposta completa.
+"""
+
+import sys
+import os
+import json
+import time
+import struct
+import tempfile
+import subprocess
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ml_service.predict import (predict_freight_price, load_historical_data, select_response_fields,
+                                encode_response, respond_json_request)
+
+PREDICT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'predict.py')
+
+ROTA = {'originLat': -24.48545, 'originLng': -54.83175, 'destLat': -24.72896,
+        'destLng': -53.73445, 'totalDistance': 120, 'month': 5}
+
+def decode_frame(saida):
+    """Decodifica uma resposta enquadrada (tipo + tamanho uint32 + payload JSON)."""
+    tipo, tamanho = saida[:1], struct.unpack('>I', saida[1:5])[0]
+    assert tipo == b'J' and len(saida) == 5 + tamanho
+    return json.loads(saida[5:])
+
+def test_field_selection():
+    """Somente os campos solicitados; mesmo preço e confiança da resposta completa."""
+    print("\n=== Teste da Seleção de Campos ===")
+    load_historical_data()
+
+    completo = respond_json_request(ROTA)
+    reduzido = select_response_fields(
+        respond_json_request(dict(ROTA, fields=['recommendedPrice', 'confidence'])),
+        ['recommendedPrice', 'confidence'], include_similar_routes=False)
+
+    assert set(reduzido) == {'success', 'recommendedPrice', 'confidence'}
+    assert reduzido['recommendedPrice'] == completo['recommendedPrice']
+    assert reduzido['confidence'] == completo['confidence']
+    assert 'similar_routes' in completo['details']
+
+    # Sem explicação, predict_freight_price não monta os registros das rotas similares
+    resultado = predict_freight_price(ROTA['originLat'], ROTA['originLng'], ROTA['destLat'], ROTA['destLng'],
+                                      ROTA['totalDistance'], ROTA['month'], explain=False,
+                                      include_similar_routes=False)
+    assert 'similar_routes' not in resultado['details']
+    assert resultado['prediction'] == completo['recommendedPrice']
+
+    bytes_completo = len(encode_response(completo))
+    bytes_reduzido = len(encode_response(reduzido, 'framed'))
+    print(f"Resposta completa: {bytes_completo} bytes | Preço e confiança: {bytes_reduzido} bytes")
+    assert bytes_reduzido < bytes_completo / 10
+
+    # Custo de montagem e serialização (histórico já carregado)
+    for nome, campos in [('completa', None), ('reduzida', ['recommendedPrice', 'confidence'])]:
+        inicio = time.perf_counter()
+        for _ in range(20):
+            resposta = respond_json_request(dict(ROTA, fields=campos))
+            encode_response(select_response_fields(resposta, campos, campos is None), 'framed')
+        print(f"Resposta {nome}: {(time.perf_counter() - inicio) / 20 * 1000:.2f} ms por cotação")
+
+def test_framed_cli():
+    """No formato 'framed' a saída padrão contém apenas a resposta enquadrada."""
+    print("\n=== Teste da Resposta Enquadrada ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        caminho = os.path.join(tmp, 'cotacao.json')
+        with open(caminho, 'w') as f:
+            json.dump(dict(ROTA, output='framed', fields=['recommendedPrice', 'confidence']), f)
+        enquadrada = subprocess.run([sys.executable, PREDICT_SCRIPT, caminho], capture_output=True,
+                                    check=True, cwd=os.path.dirname(PREDICT_SCRIPT)).stdout
+
+        with open(caminho, 'w') as f:
+            json.dump(ROTA, f)
+        legado = subprocess.run([sys.executable, PREDICT_SCRIPT, caminho], capture_output=True,
+                                check=True, cwd=os.path.dirname(PREDICT_SCRIPT)).stdout
+
+    resposta = decode_frame(enquadrada)
+    completa = json.loads(legado.decode('utf-8').strip().split('\n')[-1])
+    print(f"Saída enquadrada: {len(enquadrada)} bytes | Saída legada: {len(legado)} bytes")
+    assert resposta == {'success': True, 'recommendedPrice': completa['recommendedPrice'],
+                        'confidence': completa['confidence']}
+
+def main():
+    """Função principal"""
+    test_field_selection()
+    test_framed_cli()
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from ml_service.improved_prediction import predict_with_high_confidence
 from ml_service.predict import load_historical_data
+from ml_service.seasonality import load_seasonality_table, seasonal_profile
 
 def test_monthly_variation():
     """Testa a variação mensal para uma mesma rota."""
@@ -163,6 +164,37 @@ def test_quarterly_variation_multiple_routes():
         print("Predições por trimestre:")
         print(tabulate(trimester_results, headers=["Trimestre", "Predição", "Confiança"], tablefmt='grid'))
 
+def test_seasonality_table():
+    """Consulta a tabela de fatores sazonais gerada no treino para as rotas mais comuns."""
+    print("\n=== Teste da Tabela de Sazonalidade ===")
+    
+    table = load_seasonality_table()
+    if table is None:
+        print("Tabela de sazonalidade não encontrada (execute train.py)")
+        return
+    
+    print(f"Tabela com {len(table['lanes'])} rotas e {len(table['regions'])} regiões")
+    
+    historical_data = load_historical_data()
+    route_counts = historical_data.groupby(['Lat_Origem', 'Lng_Origem', 'Lat_Destino', 'Lng_Destino']).size()
+    top_routes = route_counts.nlargest(3).reset_index()
+    
+    for idx, route in top_routes.iterrows():
+        perfil = seasonal_profile(table, route['Lat_Origem'], route['Lng_Origem'],
+                                  route['Lat_Destino'], route['Lng_Destino'])
+        
+        rows = []
+        for mes in range(12):
+            std = perfil['std'][mes]
+            rows.append([mes + 1, f"{perfil['factor'][mes]:.3f}", f"{perfil['count'][mes]:.0f}",
+                         '-' if std is None else f"{std:.3f}"])
+        
+        print(f"\nRota {idx+1} (nível: {perfil['level']}):")
+        print(tabulate(rows, headers=["Mês", "Fator", "Viagens", "Desvio"], tablefmt='grid'))
+        
+        assert len(perfil['factor']) == 12
+        assert all(f > 0 for f in perfil['factor'])
+
 def main():
     """Função principal."""
     print("=== Análise de Fatores Sazonais no Modelo ===")
@@ -172,6 +204,9 @@ def main():
     
     # Testa variação trimestral em várias rotas
     test_quarterly_variation_multiple_routes()
+    
+    # Consulta a tabela de sazonalidade materializada
+    test_seasonality_table()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
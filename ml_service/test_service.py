@@ -0,0 +1,136 @@
+"""
+Script para testar o serviço residente de predição e os micro-lotes.
+Verifica que requisições concorrentes são agrupadas e que os resultados
+coincidem com a predição individual de predict.py, e que requisições
+idênticas simultâneas são calculadas uma única vez.
+"""
+
+import sys
+import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from ml_service.batching import MicroBatcher
+from ml_service.service import app, batcher
+from ml_service.predict import predict_freight_price
+
+def test_micro_batcher():
+    """Requisições concorrentes devem ser agrupadas e receber o próprio resultado."""
+    print("\n=== Teste de Micro-lotes ===")
+    lotes = []
+
+    def dobra(itens):
+        lotes.append(len(itens))
+        time.sleep(0.01)  # Simula o custo de uma predição em lote
+        return [item * 2 for item in itens]
+
+    async def executa():
+        fila = MicroBatcher(dobra, max_batch_size=16, max_wait_ms=2)
+        await fila.start()
+        resultados = await asyncio.gather(*(fila.submit(i) for i in range(100)))
+        await fila.stop()
+        return resultados
+
+    resultados = asyncio.run(executa())
+    print(f"100 requisições em {len(lotes)} lotes (maior: {max(lotes)})")
+    assert resultados == [i * 2 for i in range(100)]
+    assert len(lotes) < 100 and max(lotes) <= 16
+
+def test_stop_pending():
+    """Ao encerrar, as requisições do lote em processamento e as da fila recebem erro."""
+    print("\n=== Teste do Encerramento com Requisições Pendentes ===")
+
+    def lento(itens):
+        time.sleep(0.2)
+        return itens
+
+    async def executa():
+        fila = MicroBatcher(lento, max_batch_size=4, max_wait_ms=1)
+        await fila.start()
+        tarefas = [asyncio.ensure_future(fila.submit(i)) for i in range(10)]
+        await asyncio.sleep(0.05)  # O primeiro lote está em processamento
+        await fila.stop()
+        return await asyncio.wait_for(asyncio.gather(*tarefas, return_exceptions=True), 1.0)
+
+    resultados = asyncio.run(executa())
+    print(f"{sum(isinstance(r, RuntimeError) for r in resultados)} de 10 requisições encerradas com erro")
+    assert all(isinstance(r, RuntimeError) for r in resultados)
+
+def test_single_flight():
+    """Requisições idênticas em andamento devem compartilhar uma única avaliação."""
+    print("\n=== Teste de Agrupamento de Requisições Idênticas ===")
+    avaliados = []
+
+    def dobra(itens):
+        avaliados.extend(itens)
+        time.sleep(0.01)
+        return [item * 2 for item in itens]
+
+    async def executa():
+        fila = MicroBatcher(dobra, max_batch_size=16, max_wait_ms=2, key_fn=lambda item: item % 5)
+        await fila.start()
+        resultados = await asyncio.gather(*(fila.submit(i % 5) for i in range(50)))
+        # Após a conclusão, a mesma chave volta a ser avaliada
+        repetido = await fila.submit(3)
+        await fila.stop()
+        return resultados, repetido, fila.stats
+
+    resultados, repetido, stats = asyncio.run(executa())
+    print(f"50 requisições (5 distintas): {len(avaliados) - 1} avaliadas, {stats['coalesced']} agrupadas")
+    assert resultados == [(i % 5) * 2 for i in range(50)] and repetido == 6
+    assert sorted(avaliados) == [0, 1, 2, 3, 3, 4]
+    assert stats['coalesced'] == 45
+
+def test_service_predict():
+    """O serviço deve retornar a mesma predição de predict.py."""
+    print("\n=== Teste do Serviço Residente ===")
+    rotas = [
+        (-24.48545, -54.83175, -24.72896, -53.73445, 219.0, 5),
+        (-25.5, -54.6, -23.4, -51.9, 400.0, 3),
+    ]
+
+    with TestClient(app) as client:
+        for lat_o, lng_o, lat_d, lng_d, km, mes in rotas:
+            entrada = {'originLat': lat_o, 'originLng': lng_o, 'destLat': lat_d,
+                       'destLng': lng_d, 'totalDistance': km, 'month': mes}
+
+            inicio = time.perf_counter()
+            resposta = client.post("/predict", json=entrada).json()
+            duracao = (time.perf_counter() - inicio) * 1000
+
+            individual = predict_freight_price(lat_o, lng_o, lat_d, lng_d, km, mes)
+            print(f"Serviço: R$ {resposta['recommendedPrice']:.2f} ({resposta['method']}, {duracao:.1f}ms) | "
+                  f"predict.py: R$ {individual['prediction']:.2f} ({individual['method']})")
+            assert resposta['success']
+            assert resposta['recommendedPrice'] == individual['prediction']
+            assert resposta['method'] == individual['method']
+            # A explicação descreve o método usado (rotas similares, vizinhas ou apenas o modelo)
+            resumo = predict_freight_price(lat_o, lng_o, lat_d, lng_d, km, mes, explain=False)['message']
+            assert resumo in resposta['explanation']
+
+        # Cotações idênticas simultâneas: uma única avaliação
+        entrada = {'originLat': rotas[0][0], 'originLng': rotas[0][1], 'destLat': rotas[0][2],
+                   'destLng': rotas[0][3], 'totalDistance': rotas[0][4], 'month': rotas[0][5]}
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            respostas = list(executor.map(lambda _: client.post("/predict", json=entrada).json(), range(8)))
+        assert all(r['recommendedPrice'] == respostas[0]['recommendedPrice'] for r in respostas)
+
+        lote = client.post("/predict/batch", json=[{'originLat': 'x'}]).json()
+        assert not lote['results'][0]['success']
+
+        print(f"Micro-lotes: {client.get('/health').json()['batching']}")
+    assert batcher.stats['requests'] >= len(rotas)
+
+def main():
+    """Função principal."""
+    print("=== Teste do Serviço de Predição ===")
+    test_micro_batcher()
+    test_stop_pending()
+    test_single_flight()
+    test_service_predict()
+
+if __name__ == "__main__":
+    main()
@@ -4,11 +4,49 @@ Script para testar a busca por rotas similares no raio de 50km.
 
 import sys
 import os
+import numpy as np
 import pandas as pd
+from geopy.distance import geodesic
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from ml_service.data_processor import find_similar_routes
 from ml_service.predict import load_historical_data
+from ml_service.batch_predict import build_lane_table, batch_similarity_stats
+from ml_service.similarity_index import summarize_by_radius, summarize_similar_routes, haversine_km
+
+def test_radius_boundary():
+    """Rotas no limite do raio seguem a distância geodésica (haversine difere em até ~0,6%)."""
+    print("\n=== Teste do Limite do Raio (geodésica × haversine) ===")
+    historical_data = load_historical_data()
+    viagem = historical_data.iloc[0]
+    origem = (viagem['Lat_Origem'], viagem['Lng_Origem'])
+    destino = (viagem['Lat_Destino'], viagem['Lng_Destino'])
+
+    # Erro relativo da haversine a 50km da origem em cada direção
+    rumos = np.arange(0, 360, 5)
+    erros = np.array([haversine_km(*origem, p.latitude, p.longitude) / 50 - 1
+                      for p in (geodesic(kilometers=50).destination(origem, rumo) for rumo in rumos)])
+
+    # Consultas logo fora (haversine subestima) e logo dentro (haversine superestima) do raio geodésico
+    for rumo, erro, dentro in ((rumos[np.argmin(erros)], erros.min(), False),
+                               (rumos[np.argmax(erros)], erros.max(), True)):
+        distancia = 50 * (1 - erro / 2)
+        ponto = geodesic(kilometers=distancia).destination(origem, rumo)
+        consulta = (ponto.latitude, ponto.longitude, *destino)
+        # A haversine sozinha classificaria a rota do lado errado do raio
+        assert (haversine_km(*origem, ponto.latitude, ponto.longitude) <= 50) != dentro
+
+        esperado = sum(
+            geodesic(consulta[:2], (o_lat, o_lng)).km <= 50 and geodesic(consulta[2:], (d_lat, d_lng)).km <= 50
+            for o_lat, o_lng, d_lat, d_lng in historical_data[
+                ['Lat_Origem', 'Lng_Origem', 'Lat_Destino', 'Lng_Destino']].itertuples(index=False)
+        )
+        similares = find_similar_routes(*consulta, historical_data, radius_km=50)
+        resumo = summarize_similar_routes(historical_data, *consulta, radius_km=50)
+        lote = batch_similarity_stats(build_lane_table(historical_data), *([c] for c in consulta), radius_km=50)
+        print(f"Consulta a {distancia:.2f}km da origem: {esperado} viagem(ns) no raio (geodésica), "
+              f"busca: {len(similares)}, lote: {int(lote['num_routes'][0])}")
+        assert len(similares) == resumo['num_routes'] == int(lote['num_routes'][0]) == esperado
 
 def main():
     """Teste de busca por rotas similares."""
@@ -62,18 +100,33 @@ def main():
                 print(f"   - Rota {j+1}: Similaridade {rota['similarity_score']:.1f}/100, Frete R$ {rota['Frete Carreteiro']:.2f}")
                 print(f"     Distância da origem: {rota['distancia_origem']:.1f}km, do destino: {rota['distancia_destino']:.1f}km")
     
-    # Teste com diferentes raios para a rota Assunção - São Paulo
-    print("\n=== Teste com diferentes raios para Assunção → São Paulo ===")
-    coords = test_coords[1]
-    for radius in [10, 30, 50, 100, 150]:
-        similares = find_similar_routes(
-            coords['origem_lat'], coords['origem_lng'],
-            coords['destino_lat'], coords['destino_lng'],
-            historical_data, radius_km=radius
+    # Teste com diferentes raios (uma única consulta para todos os raios)
+    raios = [10, 30, 50, 100, 150]
+    for coords in test_coords:
+        print(f"\n=== Teste com diferentes raios para {coords['nome']} ===")
+        resumo = summarize_by_radius(
+            historical_data, coords['origem_lat'], coords['origem_lng'],
+            coords['destino_lat'], coords['destino_lng'], radii=raios
         )
         
-        count = len(similares)
-        print(f"Raio {radius}km: {count} rota(s) encontrada(s)")
+        for i, radius in enumerate(raios):
+            count = int(resumo['num_routes'][i])
+            if count:
+                print(f"Raio {radius}km: {count} rota(s) encontrada(s), "
+                      f"preço ponderado R$ {resumo['weighted_price'][i]:.2f}, "
+                      f"confiança {resumo['confidence'][i] * 100:.1f}%")
+            else:
+                print(f"Raio {radius}km: {count} rota(s) encontrada(s)")
+            
+            # Mesmo resultado da busca individual por raio
+            similares = find_similar_routes(
+                coords['origem_lat'], coords['origem_lng'],
+                coords['destino_lat'], coords['destino_lng'],
+                historical_data, radius_km=radius
+            )
+            assert count == len(similares)
+
+    test_radius_boundary()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,168 @@
+"""
+Script para testar a inferência em estágios do GradientBoosting.
+Verifica a equivalência com staged_predict nos dois caminhos (compilado e
+scikit-learn), a escolha de estágios pelo orçamento de latência (com os custos
+gravados no treino), a tabela de precisão por estágios e os estágios reportados
+na predição individual e em lote.
+"""
+
+import sys
+import os
+import gc
+import json
+import time
+import weakref
+import tempfile
+import itertools
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import ml_service.predict as predict
+from ml_service.predict import load_model_and_scaler, load_historical_data, predict_freight_price
+from ml_service.batch_predict import predict_batch
+from ml_service.data_processor import get_feature_builder, build_feature_matrix
+from ml_service.staged_inference import (get_staged_model, predict_staged, stages_for_budget,
+                                         estimated_latency_ms, staged_accuracy_table, print_accuracy_table,
+                                         SMALL_BATCH_ROWS, MIN_STAGES)
+
+def historical_matrix():
+    """Histórico e matriz de features padronizada do modelo atual."""
+    model, scaler, features, _ = load_model_and_scaler()
+    historico = load_historical_data()
+    X = build_feature_matrix(
+        get_feature_builder(features, scaler), historico['KM'].to_numpy(dtype=np.float64),
+        historico['Mês'].to_numpy(), historico['Ano'].to_numpy(),
+        historico['Lat_Origem'].to_numpy(dtype=np.float64), historico['Lng_Origem'].to_numpy(dtype=np.float64),
+        historico['Lat_Destino'].to_numpy(dtype=np.float64), historico['Lng_Destino'].to_numpy(dtype=np.float64),
+        valor_por_km=historico['Valor_por_km'].to_numpy(dtype=np.float64))
+    return model, historico, X
+
+def test_staged_equivalence():
+    """Os k primeiros estágios devem reproduzir staged_predict, para poucas linhas e em lote."""
+    print("\n=== Teste da Equivalência com staged_predict ===")
+    model, _, X = historical_matrix()
+    compilado = get_staged_model(model)
+
+    for linhas in (X[:1], X[:SMALL_BATCH_ROWS], X):
+        for k in (0, 1, 10, 37, compilado['n_stages']):
+            esperado = (np.full(len(linhas), compilado['init']) if k == 0 else
+                        next(itertools.islice(model.staged_predict(linhas), k - 1, None)))
+            assert np.allclose(predict_staged(compilado, linhas, k), esperado, rtol=0, atol=1e-8)
+    assert np.allclose(predict_staged(compilado, X[:1]), model.predict(X[:1]), rtol=0, atol=1e-8)
+
+    # Tempo de uma predição individual por quantidade de estágios
+    for k in (MIN_STAGES, compilado['n_stages']):
+        inicio = time.perf_counter()
+        for _ in range(200):
+            predict_staged(compilado, X[:1], k)
+        print(f"{k} estágios: {(time.perf_counter() - inicio) / 200 * 1e6:.0f}µs por predição "
+              f"(estimado: {estimated_latency_ms(compilado, k) * 1000:.0f}µs)")
+
+def test_budget_stages():
+    """Orçamentos maiores usam mais estágios, sempre entre MIN_STAGES e o total."""
+    print("\n=== Teste do Orçamento de Latência ===")
+    model, _, _ = historical_matrix()
+    compilado = get_staged_model(model)
+    total = compilado['n_stages']
+
+    assert stages_for_budget(compilado, None) == total
+    assert stages_for_budget(compilado, 0.0) == MIN_STAGES
+    assert stages_for_budget(compilado, 1000.0) == total
+    orcamentos = [0.0, 0.03, 0.05, 0.07, 0.1, 1000.0]
+    estagios = [stages_for_budget(compilado, orcamento) for orcamento in orcamentos]
+    print(f"Estágios por orçamento (ms) {orcamentos}: {estagios}")
+    assert estagios == sorted(estagios)
+    # Lotes maiores e modelos adicionais (quantis do intervalo) cabem em menos estágios
+    assert stages_for_budget(compilado, 1.0, n_rows=1000) <= stages_for_budget(compilado, 1.0)
+    assert stages_for_budget(compilado, 0.1, n_models=3) <= stages_for_budget(compilado, 0.1)
+
+def test_registered_costs():
+    """Com os custos gravados nos metadados, o mesmo orçamento usa sempre os mesmos estágios."""
+    print("\n=== Teste dos Custos Gravados no Treino ===")
+    model, historico, _ = historical_matrix()
+    rota = historico.iloc[0]
+    argumentos = (rota['Lat_Origem'], rota['Lng_Origem'], rota['Lat_Destino'], rota['Lng_Destino'],
+                  rota['KM'], int(rota['Mês']))
+    # 40µs por chamada: nem com MIN_STAGES os modelos de quantis cabem em 0,05ms,
+    # e o modelo usa (50 - 40) / 0,25 = 40 estágios
+    custos = {'compiled': {'base_us': 40.0, 'stage_row_us': 0.25},
+              'sklearn': {'base_us': 400.0, 'stage_row_us': 0.01}}
+    esperado = min(40, model.n_estimators_)
+
+    with open(predict.METADATA_PATH) as arquivo:
+        metadata = json.load(arquivo)
+    caminho = predict.METADATA_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        predict.METADATA_PATH = os.path.join(tmp, 'metadata.json')
+        try:
+            with open(predict.METADATA_PATH, 'w') as arquivo:
+                json.dump(dict(metadata, staged_inference_costs=custos), arquivo)
+            estagios = [predict_freight_price(*argumentos, explain=False, include_similar_routes=False,
+                                              latency_budget_ms=0.05)['details']['model_stages']
+                        for _ in range(3)]
+        finally:
+            predict.METADATA_PATH = caminho
+    print(f"Estágios com orçamento de 0,05ms: {estagios}")
+    assert estagios == [esperado] * 3
+
+def test_compiled_cache_releases_models():
+    """O cache de modelos compilados não mantém vivos os modelos descartados."""
+    print("\n=== Teste do Cache de Modelos Compilados ===")
+    model, _, X = historical_matrix()
+    predict_staged(get_staged_model(model), X[:1], MIN_STAGES)
+    predict_staged(get_staged_model(model), X, MIN_STAGES)
+    referencia = weakref.ref(model)
+    del model
+    gc.collect()
+    assert referencia() is None
+
+def test_accuracy_table():
+    """A tabela termina no modelo completo (perda 0) e menos estágios não são mais precisos."""
+    print("\n=== Teste da Tabela de Precisão por Estágios ===")
+    model, historico, X = historical_matrix()
+    tabela = staged_accuracy_table(model, X, historico['Frete Carreteiro'])
+    print_accuracy_table(tabela)
+
+    assert tabela[-1]['stages'] == model.n_estimators_ and tabela[-1]['mae_loss'] == 0
+    assert tabela[0]['mae'] > tabela[-1]['mae']
+    assert all(linha['mae_loss'] >= 0 for linha in tabela)
+    assert [linha['latency_ms'] for linha in tabela] == sorted(linha['latency_ms'] for linha in tabela)
+
+def test_budgeted_predictions():
+    """As predições com orçamento reportam os estágios usados (individual e em lote)."""
+    print("\n=== Teste das Predições com Orçamento ===")
+    model, historico, _ = historical_matrix()
+    rota = historico.iloc[0]
+    argumentos = (rota['Lat_Origem'], rota['Lng_Origem'], rota['Lat_Destino'], rota['Lng_Destino'],
+                  rota['KM'], int(rota['Mês']))
+
+    completo = predict_freight_price(*argumentos, explain=False, include_similar_routes=False)
+    assert 'model_stages' not in completo['details']
+    total = predict_freight_price(*argumentos, explain=False, include_similar_routes=False,
+                                  latency_budget_ms=1000.0)
+    assert total['details']['model_stages'] == total['details']['model_stages_total'] == model.n_estimators_
+    assert total['details']['model_prediction'] == completo['details']['model_prediction']
+
+    reduzido = predict_freight_price(*argumentos, explain=False, include_similar_routes=False,
+                                     latency_budget_ms=0.0)
+    print(f"Modelo completo: R$ {completo['details']['model_prediction']:.2f} | "
+          f"{reduzido['details']['model_stages']} estágios: R$ {reduzido['details']['model_prediction']:.2f}")
+    assert reduzido['details']['model_stages'] == MIN_STAGES
+
+    consultas = historico[['Lat_Origem', 'Lng_Origem', 'Lat_Destino', 'Lng_Destino', 'KM', 'Mês']].head(200)
+    _, scaler, features, _ = load_model_and_scaler()
+    lote = predict_batch(consultas, historico, model, scaler, features, latency_budget_ms=0.0)
+    assert (lote['ml_model']['model_stages'] == MIN_STAGES).all()
+    assert 'model_stages' not in predict_batch(consultas, historico, model, scaler, features)['ml_model']
+
+def main():
+    """Função principal"""
+    test_staged_equivalence()
+    test_budget_stages()
+    test_registered_costs()
+    test_compiled_cache_releases_models()
+    test_accuracy_table()
+    test_budgeted_predictions()
+
+if __name__ == "__main__":
+    main()
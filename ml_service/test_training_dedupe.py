@@ -0,0 +1,72 @@
+"""
+Script para testar a deduplicação de viagens idênticas no treino.
+Verifica que as linhas agrupadas preservam o peso total, que o
+GradientBoosting ajustado com elas é o mesmo do histórico completo e que a
+escolha do modelo e as métricas de teste não mudam com o agrupamento.
+"""
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from sklearn.ensemble import GradientBoostingRegressor
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import StandardScaler
+from ml_service.train import load_data, collapse_duplicates, select_best_model, FEATURES
+
+def test_collapse_duplicates():
+    """As viagens repetidas devem virar linhas ponderadas sem alterar o ajuste."""
+    print("\n=== Teste da Deduplicação do Treino ===")
+    df = load_data()
+    agrupado, pesos, report = collapse_duplicates(df)
+
+    assert report['rows_after'] == len(agrupado) < len(df)
+    assert pesos.sum() == len(df)
+    assert not agrupado.duplicated().any()
+
+    X, y = df[FEATURES].to_numpy(), df['Frete Carreteiro'].to_numpy()
+    inicio = time.perf_counter()
+    completo = GradientBoostingRegressor(random_state=42).fit(X, y)
+    tempo_completo = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    ponderado = GradientBoostingRegressor(random_state=42).fit(
+        agrupado[FEATURES].to_numpy(), agrupado['Frete Carreteiro'].to_numpy(), sample_weight=pesos)
+    tempo_ponderado = time.perf_counter() - inicio
+
+    print(f"Ajuste: {tempo_completo:.2f}s com {len(df)} linhas, {tempo_ponderado:.2f}s com {len(agrupado)}")
+    assert np.allclose(completo.predict(X), ponderado.predict(X))
+
+def test_model_selection_unchanged():
+    """Com ou sem agrupamento, o treino escolhe o mesmo modelo com as mesmas métricas."""
+    print("\n=== Teste da Escolha do Modelo com Deduplicação ===")
+    df = load_data()
+    w = np.ones(len(df))
+    # Mesma divisão de train_model (nas viagens originais)
+    X_train, X_test, y_train, y_test, w_train, w_test = train_test_split(
+        df[FEATURES], df['Frete Carreteiro'], w, test_size=0.2, random_state=42)
+    scaler = StandardScaler()
+    X_train_scaled, X_test_scaled = scaler.fit_transform(X_train), scaler.transform(X_test)
+
+    escolhas = {}
+    for dedupe in (False, True):
+        inicio = time.perf_counter()
+        _, nome, metricas = select_best_model(X_train_scaled, y_train, w_train, X_test_scaled, y_test, w_test,
+                                              FEATURES, dedupe=dedupe)
+        escolhas[dedupe] = (nome, metricas)
+        print(f"dedupe={dedupe}: {nome} (R² {metricas['r2']:.4f}) em {time.perf_counter() - inicio:.2f}s")
+
+    assert escolhas[True][0] == escolhas[False][0]
+    # Diferenças residuais vêm só do desempate entre cortes de mesmo ganho nas árvores
+    for chave in ('r2', 'rmse', 'mae', 'cv_rmse', 'pct_diff'):
+        assert np.isclose(escolhas[True][1][chave], escolhas[False][1][chave], rtol=1e-3)
+
+def main():
+    """Função principal"""
+    test_collapse_duplicates()
+    test_model_selection_unchanged()
+
+if __name__ == "__main__":
+    main()
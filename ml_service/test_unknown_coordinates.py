@@ -11,7 +11,7 @@ from tabulate import tabulate
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from ml_service.improved_prediction import predict_with_high_confidence
-from ml_service.predict import load_historical_data
+from ml_service.predict import load_historical_data, predict_freight_price
 from geopy.distance import geodesic
 
 def find_unknown_coordinate_variations(historical_data, quantidade=3):
@@ -204,9 +204,46 @@ def test_unknown_coordinates():
             diff_pct = abs(média_original - média_nova) / média_original * 100
             print(f"Diferença média de confiança: {diff_pct:.1f}%")
 
+def test_nearest_lanes_fallback():
+    """
+    Desloca a rota mais comum para além do raio de 50km e verifica que a predição
+    usa as rotas vizinhas (e não o modelo com confiança fixa).
+    """
+    print("\n=== Teste de Rotas Vizinhas (fora do raio de 50km) ===")
+    
+    historical_data = load_historical_data()
+    rota = historical_data.groupby(['Lat_Origem', 'Lng_Origem', 'Lat_Destino', 'Lng_Destino']).size().idxmax()
+    km = 219.0
+    
+    results = []
+    for deslocamento_km in [60, 100, 150]:
+        # Desloca a origem para o leste (1 grau de longitude ≈ 101km nesta latitude)
+        origem_lng = rota[1] + deslocamento_km / 101.0
+        
+        padrao = predict_freight_price(rota[0], origem_lng, rota[2], rota[3], km, 5)
+        aprimorado = predict_with_high_confidence(rota[0], origem_lng, rota[2], rota[3], km, 5)
+        
+        results.append([
+            f"{deslocamento_km}km",
+            f"R$ {padrao['prediction']:.2f}", f"{padrao['confidence_pct']}%", padrao['method'],
+            f"R$ {aprimorado['prediction']:.2f}", f"{aprimorado['confidence_pct']}%", aprimorado['method']
+        ])
+        
+        assert padrao['method'] == "nearest_lanes"
+        assert aprimorado['method'] == "nearest_lanes"
+        assert padrao['confidence'] < 0.9
+    
+    headers = ["Deslocamento", "Pred. Padrão", "Conf.", "Método", "Pred. Aprimorada", "Conf.", "Método"]
+    print(tabulate(results, headers=headers, tablefmt='grid'))
+    
+    # A confiança deve cair conforme a rota se afasta do histórico
+    confiancas = [float(r[2].replace("%", "")) for r in results]
+    assert confiancas == sorted(confiancas, reverse=True)
+
 def main():
     """Função principal."""
     test_unknown_coordinates()
+    test_nearest_lanes_fallback()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
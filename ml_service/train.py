@@ -4,26 +4,45 @@ Este script utiliza apenas os dados históricos reais sem adaptações ou enriqu
 """
 
 import os
+import time
+import argparse
 import pandas as pd
 import numpy as np
 from datetime import datetime
 from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
 from sklearn.preprocessing import StandardScaler
-from sklearn.model_selection import train_test_split, cross_val_score
+from sklearn.model_selection import train_test_split, KFold
+from sklearn.base import clone
 from sklearn.metrics import r2_score, mean_squared_error, mean_absolute_error
 import joblib
 import json
+from seasonality import build_seasonality_table, seasonality_sums, finalize_seasonality, save_seasonality_table
+from feedback_ingest import ingest_feedback, FEEDBACK_SAMPLE_WEIGHT
+from feature_store import build_feature_store, save_feature_store
+from distill import run_distillation, STUDENT_MODEL_PATH, STUDENT_METADATA_PATH
+from staged_inference import is_staged_model, get_staged_model, staged_costs, staged_accuracy_table, print_accuracy_table
+from prediction_intervals import (train_quantile_models, save_quantile_models, interval_report,
+                                  print_interval_report, QUANTILE_MODELS_PATH)
 
 # Configurações
 CSV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'attached_assets', 'Libro3_utf8.csv')
 MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'gb_model.pkl')
 SCALER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'gb_scaler.pkl') 
 METADATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'gb_model_metadata.json')
+SEASONALITY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'seasonality.json')
+FEATURE_STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'enhanced_feature_store.json')
 
-def load_data():
-    """Carrega e processa os dados do CSV original."""
-    print(f"Carregando dados de: {CSV_PATH}")
-    df = pd.read_csv(CSV_PATH, sep=';')
+# Características usadas pelo modelo - foco em coordenadas geográficas
+FEATURES = ['KM', 'Mês', 'Trimestre', 'Ano', 'Lat_Origem', 'Lng_Origem', 'Lat_Destino', 'Lng_Destino', 'Valor_por_km']
+
+# Colunas do CSV original necessárias para o treino
+RAW_COLUMNS = ['Frete Carreteiro', 'Data Saída', 'ORIGEN', 'DESTINO', 'KM']
+
+# Colunas de coordenadas que identificam uma rota
+LANE_COLUMNS = ['Lat_Origem', 'Lng_Origem', 'Lat_Destino', 'Lng_Destino']
+
+def build_features(df):
+    """Extrai as colunas derivadas (mês, coordenadas, trimestre, ano, R$/km) dos dados brutos."""
     df['Frete Carreteiro'] = pd.to_numeric(df['Frete Carreteiro'], errors='coerce')
     df = df.dropna()
     
@@ -43,34 +62,174 @@ def load_data():
     # Adiciona R$ por km
     df['Valor_por_km'] = df['Frete Carreteiro'] / df['KM']
     
+    return df
+
+def load_data():
+    """Carrega e processa os dados do CSV original."""
+    print(f"Carregando dados de: {CSV_PATH}")
+    df = pd.read_csv(CSV_PATH, sep=';')
+    df = build_features(df)
+    
     print(f"Dados carregados: {len(df)} registros")
     return df
 
-def train_model(df):
-    """Treina o modelo com dados reais."""
-    print("Treinando modelo com dados reais...")
+def iter_data_chunks(csv_path=CSV_PATH, chunksize=100_000):
+    """
+    Lê o CSV em blocos e gera as features de cada bloco, sem carregar o
+    arquivo inteiro em memória. Cada bloco mantém apenas as colunas de treino.
     
-    # Preparação de dados - foco em coordenadas geográficas conforme solicitado
-    # Define características para o modelo
-    features = ['KM', 'Mês', 'Trimestre', 'Ano', 'Lat_Origem', 'Lng_Origem', 'Lat_Destino', 'Lng_Destino', 'Valor_por_km']
+    Args:
+        csv_path (str): Caminho do CSV (separador ';')
+        chunksize (int): Linhas por bloco
+        
+    Yields:
+        DataFrame: Bloco processado com FEATURES e 'Frete Carreteiro'
+    """
+    for chunk in pd.read_csv(csv_path, sep=';', usecols=RAW_COLUMNS, chunksize=chunksize):
+        chunk = build_features(chunk)
+        yield chunk[FEATURES + ['Frete Carreteiro']]
+
+def sample_by_lane(chunks, per_lane=2000, seed=42):
+    """
+    Amostragem estratificada por rota em uma única passada pelos blocos.
+    Cada viagem recebe uma chave aleatória e, para cada rota, são mantidas
+    as per_lane menores chaves (equivalente a um reservatório uniforme por rota).
+    A memória máxima é limitada a (rotas × per_lane) + um bloco.
     
-    # Prepara dados para treinamento
-    X = df[features]
-    y = df['Frete Carreteiro']
+    Args:
+        chunks (iterable): Blocos gerados por iter_data_chunks
+        per_lane (int): Tamanho máximo do reservatório de cada rota
+        seed (int): Semente do gerador aleatório
+        
+    Returns:
+        DataFrame: Amostra com a coluna 'sample_weight' (viagens da rota / amostradas)
+        dict: Estatísticas da leitura (linhas lidas, rotas, tamanho da amostra)
+    """
+    rng = np.random.default_rng(seed)
+    amostra = None
+    contagem = None
+    linhas_lidas = 0
+    
+    for chunk in chunks:
+        linhas_lidas += len(chunk)
+        chunk = chunk.assign(_chave=rng.random(len(chunk)))
+        
+        por_rota = chunk.groupby(LANE_COLUMNS).size()
+        contagem = por_rota if contagem is None else contagem.add(por_rota, fill_value=0)
+        
+        combinado = chunk if amostra is None else pd.concat([amostra, chunk], ignore_index=True)
+        combinado = combinado.sort_values('_chave', kind='stable')
+        amostra = combinado[combinado.groupby(LANE_COLUMNS).cumcount() < per_lane].reset_index(drop=True)
     
-    # Divisão treino/teste
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    if amostra is None:
+        raise ValueError("Nenhum dado encontrado para treinamento")
     
-    # Normaliza os dados
-    scaler = StandardScaler()
-    X_train_scaled = scaler.fit_transform(X_train)
-    X_test_scaled = scaler.transform(X_test)
+    amostrados = amostra.groupby(LANE_COLUMNS).size()
+    peso_rota = (contagem / amostrados).rename('sample_weight')
+    amostra = amostra.drop(columns='_chave').join(peso_rota, on=LANE_COLUMNS)
     
-    # Treina RandomForest e GradientBoosting para comparar
-    models = {
+    stats = {
+        'rows_read': int(linhas_lidas),
+        'lanes': int(len(contagem)),
+        'sample_size': int(len(amostra)),
+        'per_lane': int(per_lane),
+    }
+    print(f"Amostra estratificada: {stats['sample_size']} de {stats['rows_read']} viagens "
+          f"({stats['lanes']} rotas, até {per_lane} por rota)")
+    return amostra, stats
+
+def collapse_duplicates(df, sample_weight=None, columns=None):
+    """
+    Agrupa linhas idênticas nas colunas do treino (features e preço) em uma
+    única linha cujo peso é a soma dos pesos das repetidas. A perda ponderada
+    é a mesma (o ajuste só é idêntico nos modelos de fits_weighted_rows); o
+    custo do ajuste cai com o número de linhas.
+
+    Args:
+        df (DataFrame): Dados de treino
+        sample_weight (array, optional): Peso de cada linha (default: 1)
+        columns (list, optional): Colunas comparadas (default: FEATURES + 'Frete Carreteiro')
+
+    Returns:
+        DataFrame: Linhas distintas (colunas comparadas)
+        ndarray: Peso de cada linha distinta
+        dict: Relatório (linhas antes/depois, redução e maior repetição)
+    """
+    columns = columns or FEATURES + ['Frete Carreteiro']
+    w = np.ones(len(df)) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+
+    agrupado = (df[columns].assign(_peso=w, _linhas=1)
+                .groupby(columns, sort=False, as_index=False)[['_peso', '_linhas']].sum())
+    report = {
+        'rows_before': int(len(df)),
+        'rows_after': int(len(agrupado)),
+        'reduction_pct': round((1 - len(agrupado) / max(len(df), 1)) * 100, 1),
+        'max_repeats': int(agrupado['_linhas'].max()) if len(agrupado) else 0,
+    }
+    print(f"Deduplicação: {report['rows_before']} → {report['rows_after']} linhas "
+          f"(-{report['reduction_pct']}%, até {report['max_repeats']} viagens idênticas por linha)")
+    return agrupado[columns], agrupado['_peso'].to_numpy(), report
+
+def collapse_rows(X, y, w):
+    """
+    Versão em arrays de collapse_duplicates (ex.: matriz já padronizada):
+    linhas idênticas de (X, y) viram uma linha com o peso somado.
+
+    Returns:
+        tuple: (X, y, w) das linhas distintas
+    """
+    linhas, inverso = np.unique(np.column_stack([X, y]), axis=0, return_inverse=True)
+    return linhas[:, :-1], linhas[:, -1], np.bincount(inverso.ravel(), weights=w)
+
+def fits_weighted_rows(model):
+    """
+    Indica se o ajuste com as linhas idênticas agrupadas (peso somado) é o
+    mesmo do ajuste com as linhas repetidas (a menos do desempate entre cortes
+    de mesmo ganho): GradientBoosting com perda quadrática e sem subamostragem. O bootstrap do RandomForest sorteia linhas
+    distintas e a perda 'quantile' usa percentis ponderados; ambos mudariam.
+    """
+    return (isinstance(model, GradientBoostingRegressor) and model.loss == 'squared_error'
+            and model.subsample == 1.0)
+
+def fit_model(model, X, y, w, dedupe=False):
+    """Ajusta o modelo; com dedupe, agrupa as linhas idênticas quando o ajuste não muda."""
+    if dedupe and fits_weighted_rows(model):
+        X, y, w = collapse_rows(X, y, w)
+    return model.fit(X, y, sample_weight=w)
+
+def weighted_cv_rmse(model, X, y, w, cv=5, dedupe=False):
+    """
+    RMSE de validação cruzada (KFold) com ajuste e erro ponderados por w.
+    Os folds são sempre das linhas originais; dedupe vale só para o ajuste (ver fit_model).
+    """
+    X, y = np.asarray(X), np.asarray(y)
+    erros = []
+    for treino, teste in KFold(n_splits=cv).split(X):
+        fold = fit_model(clone(model), X[treino], y[treino], w[treino], dedupe)
+        erros.append(mean_squared_error(y[teste], fold.predict(X[teste]), sample_weight=w[teste]))
+    return float(np.sqrt(np.mean(erros)))
+
+def build_candidate_models():
+    """Cria os modelos candidatos (RandomForest e GradientBoosting) para comparação."""
+    return {
         'RandomForest': RandomForestRegressor(n_estimators=100, random_state=42),
         'GradientBoosting': GradientBoostingRegressor(n_estimators=100, random_state=42)
     }
+
+def select_best_model(X_train_scaled, y_train, w_train, X_test_scaled, y_test, w_test, features, dedupe=True):
+    """
+    Treina os modelos candidatos e escolhe o de maior R² no conjunto de teste.
+    
+    Args:
+        X_train_scaled, y_train, w_train: Treino padronizado e pesos
+        X_test_scaled, y_test, w_test: Teste padronizado e pesos
+        features (list): Nomes das features (importâncias)
+        dedupe (bool): Agrupa viagens idênticas no ajuste (ver fit_model)
+    
+    Returns:
+        tuple: (modelo, nome, métricas)
+    """
+    models = build_candidate_models()
     
     best_model = None
     best_r2 = -float('inf')
@@ -79,18 +238,17 @@ def train_model(df):
     
     for name, model in models.items():
         # Treina o modelo
-        model.fit(X_train_scaled, y_train)
+        fit_model(model, X_train_scaled, np.asarray(y_train), w_train, dedupe)
         
         # Avalia no conjunto de teste
         y_pred = model.predict(X_test_scaled)
-        r2 = r2_score(y_test, y_pred)
-        rmse = np.sqrt(mean_squared_error(y_test, y_pred))
-        mae = mean_absolute_error(y_test, y_pred)
-        cv_rmse = np.sqrt(-np.mean(cross_val_score(model, X_train_scaled, y_train, cv=5, 
-                                                 scoring='neg_mean_squared_error')))
+        r2 = r2_score(y_test, y_pred, sample_weight=w_test)
+        rmse = np.sqrt(mean_squared_error(y_test, y_pred, sample_weight=w_test))
+        mae = mean_absolute_error(y_test, y_pred, sample_weight=w_test)
+        cv_rmse = weighted_cv_rmse(model, X_train_scaled, y_train, w_train, cv=5, dedupe=dedupe)
         
         # Calcula diferenças percentuais
-        pct_diff = np.mean(np.abs((y_test - y_pred) / y_test)) * 100
+        pct_diff = np.average(np.abs((y_test - y_pred) / y_test), weights=w_test) * 100
         
         print(f"Modelo {name} - R²: {r2:.4f}, RMSE: {rmse:.2f}, MAE: {mae:.2f}, Diff%: {pct_diff:.2f}%")
         
@@ -118,38 +276,121 @@ def train_model(df):
                 'feature_importance': feature_importance
             }
     
-    print(f"Melhor modelo: {best_model_name} (R²: {best_r2:.4f})")
+    return best_model, best_model_name, best_model_metrics
+
+def train_model(df, sample_weight=None, extra_metadata=None, dedupe=True):
+    """
+    Treina o modelo com dados reais.
+    
+    Args:
+        df (DataFrame): Dados de treino
+        sample_weight (array, optional): Peso de cada linha (ex.: viagens que a linha representa)
+        extra_metadata (dict, optional): Informações adicionais gravadas nos metadados
+        dedupe (bool): Agrupa viagens idênticas em linhas ponderadas no ajuste dos
+            modelos em que isso não muda o resultado (ver fits_weighted_rows); a
+            divisão treino/teste, a validação cruzada e a escolha do modelo são
+            as mesmas do treino sem agrupamento
+    """
+    print("Treinando modelo com dados reais...")
+    inicio = time.perf_counter()
+    
+    # Preparação de dados - foco em coordenadas geográficas conforme solicitado
+    features = FEATURES
+    
+    if sample_weight is None:
+        sample_weight = np.ones(len(df))
+    w = np.asarray(sample_weight, dtype=np.float64)
+    
+    # Prepara dados para treinamento
+    X = df[features]
+    y = df['Frete Carreteiro']
+    
+    # Divisão treino/teste (sempre nas viagens originais)
+    X_train, X_test, y_train, y_test, w_train, w_test = train_test_split(
+        X, y, w, test_size=0.2, random_state=42)
     
-    # Salva o modelo e os metadados
+    # Viagens repetidas do treino (mesma rota, mês, KM e preço) são ajustadas como
+    # uma linha com o peso somado, apenas nos modelos em que o ajuste não muda
+    if dedupe:
+        _, _, dedupe_report = collapse_duplicates(X_train.assign(**{'Frete Carreteiro': y_train}), w_train)
+        extra_metadata = dict(extra_metadata or {}, deduplication=dedupe_report)
+    
+    # Normaliza os dados
+    scaler = StandardScaler()
+    X_train_scaled = scaler.fit_transform(X_train)
+    X_test_scaled = scaler.transform(X_test)
+    
+    # Treina RandomForest e GradientBoosting e escolhe o melhor no conjunto de teste
+    best_model, best_model_name, best_model_metrics = select_best_model(
+        X_train_scaled, y_train, w_train, X_test_scaled, y_test, w_test, features, dedupe=dedupe)
+    
+    print(f"Melhor modelo: {best_model_name} (R²: {best_model_metrics['r2']:.4f})")
+    print(f"Tempo de treinamento: {time.perf_counter() - inicio:.1f}s")
+    
+    # Perda de precisão por quantidade de estágios (inferência com orçamento de latência)
+    if is_staged_model(best_model):
+        tabela = staged_accuracy_table(best_model, X_test_scaled, y_test.to_numpy(), w_test)
+        print("Precisão por estágios (conjunto de teste):")
+        print_accuracy_table(tabela)
+        # Custos medidos uma vez aqui: na predição, o orçamento usa sempre os mesmos estágios
+        extra_metadata = dict(extra_metadata or {}, staged_inference=tabela,
+                              staged_inference_costs=staged_costs(get_staged_model(best_model)))
+    
+    # Intervalo de predição: modelos de quantis (GradientBoosting) ou dispersão das árvores (RandomForest)
+    quantile_models = None
+    if is_staged_model(best_model):
+        quantile_models = train_quantile_models(best_model, X_train_scaled, y_train, w_train)
+        save_quantile_models(quantile_models, best_model, features, QUANTILE_MODELS_PATH)
+    intervalo = interval_report(best_model, X_test_scaled, y_test, w_test, quantile_models)
+    if intervalo is not None:
+        print_interval_report(intervalo)
+        extra_metadata = dict(extra_metadata or {}, prediction_interval=intervalo)
+    
+    save_model_artifacts(best_model, scaler, best_model_name, best_model_metrics,
+                         n_samples=float(np.sum(w)), features=features,
+                         extra_metadata=extra_metadata)
+    
+    # Tabela de fatores sazonais por rota/região, usada na predição
+    save_seasonality_table(build_seasonality_table(df, sample_weight=w), SEASONALITY_PATH)
+    
+    # Agregados de rota e de cluster do modelo aprimorado (feature store)
+    save_feature_store(build_feature_store(df, sample_weight=w), FEATURE_STORE_PATH)
+    
+    return best_model, scaler, best_model_metrics
+
+def convert_numpy_types(obj):
+    """Converte recursivamente valores numpy para tipos Python nativos."""
+    if isinstance(obj, dict):
+        return {k: convert_numpy_types(v) for k, v in obj.items()}
+    elif isinstance(obj, (list, tuple)):
+        return [convert_numpy_types(item) for item in obj]
+    elif isinstance(obj, np.integer):
+        return int(obj)
+    elif isinstance(obj, np.floating):
+        return float(obj)
+    elif isinstance(obj, np.ndarray):
+        return obj.tolist()
+    else:
+        return obj
+
+def save_model_artifacts(model, scaler, model_name, metrics, n_samples, features,
+                         extra_metadata=None):
+    """Salva o modelo, o scaler e os metadados nos caminhos usados pela predição."""
     os.makedirs(os.path.dirname(MODEL_PATH), exist_ok=True)
-    joblib.dump(best_model, MODEL_PATH)
+    joblib.dump(model, MODEL_PATH)
     joblib.dump(scaler, SCALER_PATH)
     
     # Salva metadados
     metadata = {
-        'model_type': best_model_name,
+        'model_type': model_name,
         'training_date': datetime.now().isoformat(),
-        'metrics': best_model_metrics,
-        'n_samples': int(len(df)),
+        'metrics': metrics,
+        'n_samples': int(round(n_samples)),
         'features': list(features),  # Converte para lista Python padrão
         'coordinate_radius': 50,  # Raio para busca de cotações similares (em km)
         'model_description': 'Modelo natural com dados reais de frete'
     }
-    
-    # Função para converter qualquer valor numpy para tipo Python nativo
-    def convert_numpy_types(obj):
-        if isinstance(obj, dict):
-            return {k: convert_numpy_types(v) for k, v in obj.items()}
-        elif isinstance(obj, (list, tuple)):
-            return [convert_numpy_types(item) for item in obj]
-        elif isinstance(obj, np.integer):
-            return int(obj)
-        elif isinstance(obj, np.floating):
-            return float(obj)
-        elif isinstance(obj, np.ndarray):
-            return obj.tolist()
-        else:
-            return obj
+    metadata.update(extra_metadata or {})
     
     # Converte todos os valores numpy para tipos Python nativos
     metadata = convert_numpy_types(metadata)
@@ -160,18 +401,162 @@ def train_model(df):
     print(f"Modelo salvo em: {MODEL_PATH}")
     print(f"Scaler salvo em: {SCALER_PATH}")
     print(f"Metadados salvos em: {METADATA_PATH}")
+
+def train_chunked(csv_path=CSV_PATH, chunksize=100_000, per_lane=2000):
+    """
+    Treino para históricos maiores que a memória: lê o CSV em blocos, mantém
+    uma amostra estratificada limitada por rota e treina os modelos candidatos
+    com pesos que restauram a proporção original de cada rota.
+    """
+    amostra, stats = sample_by_lane(iter_data_chunks(csv_path, chunksize), per_lane=per_lane)
+    return train_model(amostra, sample_weight=amostra['sample_weight'],
+                       extra_metadata={'training_mode': 'chunked_lane_sample', 'sampling': stats})
+
+def train_incremental(csv_path=CSV_PATH, chunksize=100_000, epochs=5, holdout=0.2, seed=42):
+    """
+    Treino incremental (partial_fit) para históricos maiores que a memória.
+    A primeira passada ajusta o scaler; as seguintes treinam um SGDRegressor
+    bloco a bloco. Uma fração fixa de cada bloco é reservada para avaliação.
+    A memória máxima é a de um bloco.
+    """
+    from sklearn.linear_model import SGDRegressor
     
-    return best_model, scaler, best_model_metrics
+    print("Treinando modelo incremental em blocos...")
+    scaler = StandardScaler()
+    somas_sazonais = []
+    for chunk in iter_data_chunks(csv_path, chunksize):
+        scaler.partial_fit(chunk[FEATURES])
+        somas_sazonais.append(seasonality_sums(chunk))
+    
+    model = SGDRegressor(random_state=seed)
+    for epoch in range(epochs):
+        ultima = epoch == epochs - 1
+        soma = {'rows': 0, 'n': 0, 'abs': 0.0, 'sq': 0.0, 'pct': 0.0, 'y': 0.0, 'y2': 0.0}
+        
+        for i, chunk in enumerate(iter_data_chunks(csv_path, chunksize)):
+            soma['rows'] += len(chunk)
+            # Mesma separação treino/avaliação em todas as épocas
+            avaliacao = np.random.default_rng([seed, i]).random(len(chunk)) < holdout
+            X = scaler.transform(chunk[FEATURES])
+            y = chunk['Frete Carreteiro'].to_numpy()
+            
+            if (~avaliacao).any():
+                model.partial_fit(X[~avaliacao], y[~avaliacao])
+            
+            if ultima and avaliacao.any():
+                y_test = y[avaliacao]
+                erro = model.predict(X[avaliacao]) - y_test
+                soma['n'] += len(y_test)
+                soma['abs'] += np.abs(erro).sum()
+                soma['sq'] += (erro ** 2).sum()
+                soma['pct'] += np.abs(erro / y_test).sum()
+                soma['y'] += y_test.sum()
+                soma['y2'] += (y_test ** 2).sum()
+    
+    n = max(soma['n'], 1)
+    sst = soma['y2'] - soma['y'] ** 2 / n
+    importancia = np.abs(model.coef_) / max(np.abs(model.coef_).sum(), 1e-12)
+    metrics = {
+        'r2': float(1 - soma['sq'] / sst) if sst > 0 else 0.0,
+        'rmse': float(np.sqrt(soma['sq'] / n)),
+        'mae': float(soma['abs'] / n),
+        'pct_diff': float(soma['pct'] / n),
+        'feature_importance': dict(zip([str(f) for f in FEATURES], importancia)),
+    }
+    print(f"Modelo SGDRegressor - R²: {metrics['r2']:.4f}, RMSE: {metrics['rmse']:.2f}, "
+          f"MAE: {metrics['mae']:.2f}, Diff%: {metrics['pct_diff'] * 100:.2f}%")
+    
+    save_model_artifacts(model, scaler, 'SGDRegressor', metrics, n_samples=soma['rows'],
+                         features=FEATURES, extra_metadata={'training_mode': 'incremental'})
+    save_seasonality_table(finalize_seasonality(pd.concat(somas_sazonais, ignore_index=True)),
+                           SEASONALITY_PATH)
+    return model, scaler, metrics
+
+def train_with_feedback(df, feedback_path, weight=FEEDBACK_SAMPLE_WEIGHT, dedupe=True):
+    """
+    Treina com o histórico e as amostras de uma exportação de feedback
+    (ver feedback_ingest.py), deduplicadas contra o histórico e ponderadas.
+    """
+    amostras, stats = ingest_feedback(feedback_path, df, weight=weight)
+    colunas = FEATURES + ['Frete Carreteiro']
+    combinado = pd.concat([df[colunas], amostras[colunas]], ignore_index=True)
+    pesos = np.concatenate([np.ones(len(df)), amostras['sample_weight'].to_numpy()])
+    return train_model(combinado, sample_weight=pesos, dedupe=dedupe,
+                       extra_metadata={'feedback': dict(stats, path=os.path.abspath(feedback_path))})
+
+def run_walk_forward(df, max_workers=None):
+    """Executa a avaliação temporal (walk-forward) e exibe o resumo por modelo."""
+    from backtest import walk_forward_backtest
+
+    resultados = walk_forward_backtest(df, FEATURES, max_workers=max_workers)
+    if resultados.empty:
+        print("Histórico insuficiente para avaliação walk-forward")
+        return resultados
+
+    for (name, grupo) in resultados.groupby('model'):
+        # Média ponderada pelo número de viagens de cada mês avaliado
+        pesos = grupo['n_test']
+        mae = np.average(grupo['mae'], weights=pesos)
+        mape = np.average(grupo['mape'], weights=pesos)
+        print(f"Modelo {name} - walk-forward em {len(grupo)} meses: MAE: {mae:.2f}, MAPE: {mape:.2f}%")
+    return resultados
+
+def main(argv=None):
+    """
+    Função principal do script.
+
+    Args:
+        argv (list, optional): Argumentos da linha de comando (default: sys.argv);
+            chamadas de outros scripts passam a própria lista (ex.: train.main([]))
+    """
+    parser = argparse.ArgumentParser(description="Treinamento do modelo de previsão de fretes")
+    parser.add_argument('--force', action='store_true', help="Força o retreinamento (compatibilidade com o servidor)")
+    parser.add_argument('--walk-forward', action='store_true',
+                        help="Apenas avalia os modelos mês a mês (treino até M, teste em M+1)")
+    parser.add_argument('--workers', type=int, default=None, help="Processos paralelos do walk-forward")
+    parser.add_argument('--chunked', choices=['sample', 'incremental'],
+                        help="Treina lendo o CSV em blocos (amostra por rota ou partial_fit)")
+    parser.add_argument('--chunksize', type=int, default=100_000, help="Linhas por bloco no modo --chunked")
+    parser.add_argument('--per-lane', type=int, default=2000,
+                        help="Viagens mantidas por rota no modo --chunked sample")
+    parser.add_argument('--no-dedupe', action='store_true',
+                        help="Não agrupa viagens idênticas em linhas ponderadas")
+    parser.add_argument('--feedback', default=None,
+                        help="Exportação JSONL de feedback incluída no treino como amostras ponderadas")
+    parser.add_argument('--feedback-weight', type=float, default=FEEDBACK_SAMPLE_WEIGHT,
+                        help="Peso de cada amostra de feedback")
+    parser.add_argument('--distill', action='store_true',
+                        help="Destila o modelo aprimorado em um modelo compacto (nível rápido da predição)")
+    args = parser.parse_args(argv)
 
-def main():
-    """Função principal do script."""
     print("=== Treinamento de Modelo para Previsão de Fretes ===")
     
+    if args.chunked == 'sample':
+        train_chunked(CSV_PATH, chunksize=args.chunksize, per_lane=args.per_lane)
+        return
+    if args.chunked == 'incremental':
+        train_incremental(CSV_PATH, chunksize=args.chunksize)
+        return
+    
     # Carrega e processa dados reais
     df = load_data()
     
-    # Treina modelo com dados reais
-    best_model, scaler, metrics = train_model(df)
+    if args.walk_forward:
+        run_walk_forward(df, max_workers=args.workers)
+        return
+    
+    if args.feedback:
+        # Treina com os dados reais e as amostras de feedback
+        best_model, scaler, metrics = train_with_feedback(df, args.feedback, weight=args.feedback_weight,
+                                                          dedupe=not args.no_dedupe)
+    else:
+        # Treina modelo com dados reais
+        best_model, scaler, metrics = train_model(df, dedupe=not args.no_dedupe)
+    
+    # Destilação do modelo aprimorado com a feature store recém-gerada
+    if args.distill:
+        with open(FEATURE_STORE_PATH, 'r') as f:
+            run_distillation(df, json.load(f), STUDENT_MODEL_PATH, STUDENT_METADATA_PATH)
     
     print("\n=== Processamento concluído ===")
     print(f"Modelo salvo em: {MODEL_PATH}")
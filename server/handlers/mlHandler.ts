@@ -20,6 +20,7 @@ import { logger } from '../utils/production-logger';
 const ML_SERVICE_DIR = path.join(process.cwd(), 'ml_service');
 const TRAIN_SCRIPT = path.join(ML_SERVICE_DIR, 'train.py');
 const PREDICT_SCRIPT = path.join(ML_SERVICE_DIR, 'predict.py');
+const RESIDUAL_SCRIPT = path.join(ML_SERVICE_DIR, 'residual_correction.py');
 
 // Controle de aprendizado contínuo
 let newQuotesCount = 0;
@@ -97,14 +98,37 @@ interface PredictionResult {
   error?: string;
 }
 
+/**
+ * Decodifica a resposta enquadrada de predict.py: 1 byte de tipo ('J' = JSON),
+ * tamanho do payload em uint32 big-endian e o payload. A resposta é o último
+ * conteúdo da saída; bytes anteriores (avisos de bibliotecas) são ignorados.
+ * @param output Saída padrão completa do processo
+ * @returns Objeto decodificado
+ */
+export function parseFramedResponse(output: Buffer): any {
+  for (let inicio = 0; inicio + 5 <= output.length; inicio++) {
+    const tipo = output[inicio];
+    if (tipo !== 0x4a && tipo !== 0x4d) continue;
+    if (inicio + 5 + output.readUInt32BE(inicio + 1) !== output.length) continue;
+
+    if (tipo !== 0x4a) {
+      throw new Error('Resposta em MessagePack não suportada pelo servidor; use output="framed"');
+    }
+    return JSON.parse(output.subarray(inicio + 5).toString('utf8'));
+  }
+  throw new Error('Nenhuma resposta enquadrada encontrada na saída do script');
+}
+
 /**
  * Executa um script Python e retorna a saída como JSON
  * @param scriptPath Caminho do script Python
  * @param args Argumentos para o script
  * @param inputData Dados de entrada para enviar via stdin (opcional)
+ * @param options.framed A resposta vem enquadrada (tipo + tamanho + payload, ver predict.encode_response)
  * @returns Promise com o resultado em formato JSON
  */
-export function runPythonScript(scriptPath: string, args: string[] = [], inputData?: any): Promise<any> {
+export function runPythonScript(scriptPath: string, args: string[] = [], inputData?: any,
+                                options: { framed?: boolean } = {}): Promise<any> {
   return new Promise((resolve, reject) => {
     // Verificar se o script existe
     if (!fs.existsSync(scriptPath)) {
@@ -117,9 +141,14 @@ export function runPythonScript(scriptPath: string, args: string[] = [], inputDa
     
     let outputData = '';
     let errorData = '';
+    const outputChunks: Buffer[] = [];
     
     // Capturar saída padrão
-    pythonProcess.stdout.on('data', (data) => {
+    pythonProcess.stdout.on('data', (data: Buffer) => {
+      if (options.framed) {
+        outputChunks.push(data);
+        return;
+      }
       const chunk = data.toString();
       outputData += chunk;
     });
@@ -146,6 +175,24 @@ export function runPythonScript(scriptPath: string, args: string[] = [], inputDa
 
     // Resolver a Promise quando o processo terminar
     pythonProcess.on('close', (code) => {
+      if (options.framed) {
+        // Resposta enquadrada: lê o cabeçalho e o tamanho, sem procurar JSON no texto
+        try {
+          const frame = parseFramedResponse(Buffer.concat(outputChunks));
+          if (code !== 0) {
+            logger.error(`[ML Python] Processo encerrado com código ${code}`);
+            logger.error(`[ML Python] Erro: ${errorData}`);
+            reject(frame);
+          } else {
+            resolve(frame);
+          }
+        } catch (err) {
+          logger.error('[ML Python] Resposta enquadrada inválida:', err);
+          reject(new Error(`Erro ao executar script Python: ${errorData || (err instanceof Error ? err.message : String(err))}`));
+        }
+        return;
+      }
+
       if (code !== 0) {
         logger.error(`[ML Python] Processo encerrado com código ${code}`);
         logger.error(`[ML Python] Erro: ${errorData}`);
@@ -431,10 +478,12 @@ export const recommendFreightPriceHandler = async (req: Request, res: Response)
     
     // Cria um arquivo temporário para passar os dados para o script Python
     const tempJsonFile = path.join(os.tmpdir(), `predict_data_${Date.now()}.json`);
+    // Resposta enquadrada: o servidor lê o tamanho em vez de procurar o JSON na saída
+    predictionData.output = 'framed';
     fs.writeFileSync(tempJsonFile, JSON.stringify(predictionData));
     
     // Passa o arquivo como argumento em vez de enviar via stdin
-    const result = await runPythonScript(PREDICT_SCRIPT, [tempJsonFile, modelType]) as PredictionResult;
+    const result = await runPythonScript(PREDICT_SCRIPT, [tempJsonFile, modelType], undefined, { framed: true }) as PredictionResult;
     
     // Remove o arquivo temporário
     try {
@@ -625,6 +674,21 @@ export const savePredictionFeedbackHandler = async (req: Request, res: Response)
     if (userSuggestedPrice) {
       logger.log('[ML Handler] Feedback contém valor sugerido: será usado para treinamento futuro');
       
+      // Correção residual imediata da rota no mês (sem esperar o retreinamento)
+      if (metadata?.originLat !== undefined && metadata?.destLat !== undefined) {
+        runPythonScript(RESIDUAL_SCRIPT, [], {
+          originLat: metadata.originLat,
+          originLng: metadata.originLng,
+          destLat: metadata.destLat,
+          destLng: metadata.destLng,
+          month: metadata.month,
+          originalRecommendation,
+          userSuggestedPrice
+        })
+          .then((result) => logger.log('[ML Handler] Correção residual atualizada:', JSON.stringify(result)))
+          .catch((error) => logger.error('[ML Handler] ❌ Erro ao atualizar correção residual:', error));
+      }
+      
       // Adicionar esse feedback como uma nova "amostra" para o ML
       try {
         // Criar um documento no formato de cotação de frete para o ML poder usar
@@ -634,6 +698,12 @@ export const savePredictionFeedbackHandler = async (req: Request, res: Response)
           tonnage: metadata?.tonnage || 1000,
           originCity: metadata?.originCity || '',
           destinationCity: metadata?.destinationCity || '',
+          // Coordenadas e mês da cotação (necessários para usar a amostra no treino)
+          originLat: metadata?.originLat ?? null,
+          originLng: metadata?.originLng ?? null,
+          destLat: metadata?.destLat ?? null,
+          destLng: metadata?.destLng ?? null,
+          month: metadata?.month ?? null,
           createdAt: new Date().toISOString(),
           // Marcar claramente como feedback para que saibamos que é originado de uma sugestão do usuário
           isFromFeedback: true,